@@ -0,0 +1,183 @@
+"""
+Provides a local cache of downloaded artifacts.
+Artifacts are stored under the ETag of their object, so that unchanged
+objects are never transferred twice, and the least recently used
+versions are evicted once the cache exceeds its size budget.
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+from collections import Counter
+
+from common.logger import Logger
+
+_MD5_ETAG = re.compile(r'^[0-9a-f]{32}$')
+_DOWNLOAD_SUFFIX = '.download'
+
+
+def file_md5(path : str) -> str:
+    """Computes the MD5 hex digest of a file.
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        str: The hex digest
+    """
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Content-addressed cache of object storage artifacts.
+
+    Args:
+        directory (str): The directory storing the cached artifacts
+        max_bytes (int): The size budget of the cache
+    """
+
+    def __init__(self, directory : str, max_bytes : int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._in_use = Counter()
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, version : str) -> str:
+        """Gets the path of the cache entry of an object version.
+
+        Args:
+            version (str): The ETag of the object
+
+        Returns:
+            str: The path of the cache entry
+        """
+        return os.path.join(self.directory, re.sub(r'[^0-9A-Za-z_-]', '', version))
+
+    def fetch(self, object_store, bucket_name : str, object_name : str,
+              local_path : str, version : str = None) -> bool:
+        """Makes the latest version of an object available at a local path,
+        downloading it only if it is not cached yet.
+
+        Args:
+            object_store (ObjectStore): The object storage client
+            bucket_name (str): The name of the bucket of the object
+            object_name (str): The name of the object in the bucket
+            local_path (str): The local path to make the object available at
+            version (str, optional): The ETag the object must have. Defaults to None.
+
+        Returns:
+            bool: Whether the object is available at the local path.
+        """
+        stat = object_store.stat(bucket_name, object_name)
+        if stat is None:
+            return False
+        if version is not None and stat.etag != version:
+            Logger.fail(f'Object {object_name} changed from version {version} to {stat.etag} ❌')
+            return False
+
+        entry = self.entry_path(stat.etag)
+        with self._lock:
+            self._in_use[entry] += 1
+        try:
+            if self._is_valid(entry, stat.size):
+                self.hits += 1
+                Logger.info(f'Artifact {object_name} version {stat.etag} is cached ✔️')
+                # Keep the modification time as the last use, for the eviction order
+                os.utime(entry)
+            else:
+                self.misses += 1
+                if not self._download(object_store, bucket_name, object_name, entry, stat):
+                    return False
+            self._materialize(entry, local_path)
+        finally:
+            with self._lock:
+                self._in_use[entry] -= 1
+                if self._in_use[entry] == 0:
+                    del self._in_use[entry]
+        self.evict(keep=entry)
+        return True
+
+    @staticmethod
+    def _is_valid(entry : str, size : int) -> bool:
+        """Checks whether a cache entry is complete."""
+        return os.path.isfile(entry) and os.path.getsize(entry) == size
+
+    def _download(self, object_store, bucket_name : str, object_name : str,
+                  entry : str, stat) -> bool:
+        """Downloads an object version into the cache and verifies its integrity.
+        """
+        download_path = f'{entry}.{os.getpid()}.{threading.get_ident()}{_DOWNLOAD_SUFFIX}'
+        try:
+            if not object_store.download(download_path, bucket_name, object_name,
+                                         version=stat.etag, use_cache=False):
+                return False
+            if os.path.getsize(download_path) != stat.size:
+                Logger.fail(f'Artifact {object_name} has an unexpected size ❌')
+                return False
+            # Objects uploaded in a single part have the MD5 of their contents as ETag
+            if _MD5_ETAG.match(stat.etag) and file_md5(download_path) != stat.etag:
+                Logger.fail(f'Artifact {object_name} failed the integrity check ❌')
+                return False
+            os.replace(download_path, entry)
+            return True
+        finally:
+            if os.path.exists(download_path):
+                os.remove(download_path)
+
+    @staticmethod
+    def _materialize(entry : str, local_path : str):
+        """Atomically places a copy of a cache entry at a local path.
+        The entry is copied rather than linked, so that local files
+        overwritten in place never corrupt the cache.
+        """
+        directory = os.path.dirname(local_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f'{local_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(entry, temporary_path)
+        os.replace(temporary_path, local_path)
+
+    def size(self) -> int:
+        """Gets the total size of the cached artifacts.
+
+        Returns:
+            int: The size in bytes
+        """
+        return sum(os.path.getsize(path) for path, _ in self._entries())
+
+    def _entries(self) -> list:
+        """Lists the cache entries and their last use, least recently used first."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(_DOWNLOAD_SUFFIX) or not os.path.isfile(path):
+                continue
+            entries.append((path, os.path.getmtime(path)))
+        return sorted(entries, key=lambda entry: entry[1])
+
+    def evict(self, keep : str = None):
+        """Removes the least recently used artifacts until the cache fits its size budget.
+        Artifacts which are being fetched are never removed.
+
+        Args:
+            keep (str, optional): The path of an entry which must be kept. Defaults to None.
+        """
+        with self._lock:
+            entries = self._entries()
+            total = sum(os.path.getsize(path) for path, _ in entries)
+            for path, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if path in self._in_use or path == keep:
+                    continue
+                total -= os.path.getsize(path)
+                os.remove(path)
+                Logger.info(f'Evicted artifact {os.path.basename(path)} from the cache')
@@ -2,17 +2,56 @@
 Provides download and upload functionality
 For interfacing with MinIO buckets
 """
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
+import certifi
+import urllib3
 from joblib import load
 from minio import Minio
 from minio.error import S3Error
 
+from common.artifact_cache import ArtifactCache
 from common.logger import Logger
+from common.mapped_model import MAPPED_MODEL_EXTENSION, load_mapped_model
+
+# Maximum number of concurrent transfers, and of pooled connections per host
+MAX_TRANSFER_WORKERS = 8
+TRANSFER_TIMEOUT_SECONDS = 300
+
+_object_stores = {}
+_object_stores_lock = Lock()
+
+
+def create_http_client(max_connections : int = MAX_TRANSFER_WORKERS):
+    """Creates the connection pool shared by all requests of an object storage client.
+
+    Args:
+        max_connections (int, optional): Maximum number of pooled connections per host.
+                Defaults to MAX_TRANSFER_WORKERS.
+
+    Returns:
+        urllib3.PoolManager: The connection pool
+    """
+    return urllib3.PoolManager(
+        timeout=urllib3.Timeout(connect=TRANSFER_TIMEOUT_SECONDS, read=TRANSFER_TIMEOUT_SECONDS),
+        maxsize=max_connections,
+        block=True,
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=os.environ.get('SSL_CERT_FILE') or certifi.where(),
+        retries=urllib3.Retry(
+            total=5,
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504]
+        )
+    )
+
 
 def authenticate(object_storage_endpoint : str,
                  access_key : str, secret_key : str,
-                 secure : bool):
+                 secure : bool, http_client : urllib3.PoolManager = None):
     """Authenticates to the object storage environment.
 
     Args:
@@ -20,6 +59,8 @@ def authenticate(object_storage_endpoint : str,
         access_key (str): Object storage access key
         secret_key (str): Object storage secret key
         secure (bool): Whether the connection should use TLS
+        http_client (urllib3.PoolManager, optional): The connection pool to use.
+                Defaults to None, creating a new one.
 
     Returns:
         Minio: The Minio client
@@ -28,86 +69,269 @@ def authenticate(object_storage_endpoint : str,
     return Minio(
         object_storage_endpoint,
         access_key=access_key, secret_key=secret_key,
-        secure=secure
+        secure=secure,
+        http_client=http_client
     )
 
 
-def upload_model(model_path : str,
-                 bucket_name : str,
-                 model_name : str,
-                 object_storage_endpoint : str,
-                 access_key : str,
-                 secret_key : str,
-                 secure : bool):
-    """Uploads a file to the object storage bucket.
+class ObjectStore:
+    """Client of an object storage, sharing one connection pool between all
+    transfers and remembering which buckets exist.
 
     Args:
-        model_path (str): The local path of the model to upload
-        bucket_name (str): The name of the bucket to upload to
-        model_name (str): The name that the object in the bucket
-        object_storage_endpoint (str) : The endpoint used for auth
-        access_key (str) : The auth access key
-        secret_key (str) : The auth secret key
-        secure (str) : Whether to use TLS during auth
+        client (Minio): The Minio client, or any client with the same interface
+        max_workers (int, optional): Maximum number of concurrent transfers.
+                Defaults to MAX_TRANSFER_WORKERS.
+        cache (ArtifactCache, optional): The local cache of downloaded artifacts.
+                Defaults to None, downloading every artifact.
     """
-    Logger.info(f'Uploading model from path\
-        {model_path} to bucket {bucket_name} as {model_name}')
-
-    client = authenticate(object_storage_endpoint, access_key, secret_key, secure)
-    if not client.bucket_exists(bucket_name):
-        Logger.info(f'Creating bucket : {bucket_name}')
-        client.make_bucket(bucket_name)
-        Logger.info('Creating creation succeeded ✔️')
-    try:
-        client.fput_object(bucket_name, model_name, model_path)
-    except S3Error as error:
-        err = Logger.get_color_string(error, Logger.FAIL)
-        Logger.fail(f'Model upload failed ❌\n{err}')
-    Logger.info('Model upload succeeded ✔️')
-
-
-def download_model(model_path : str,
-                   bucket_name : str,
-                   model_name : str,
-                   object_storage_endpoint : str,
-                   access_key : str, secret_key : str,
-                   secure : bool):
-    """Downloads a file to the object storage bucket.
+
+    def __init__(self, client, max_workers : int = MAX_TRANSFER_WORKERS,
+                 cache : ArtifactCache = None):
+        self.client = client
+        self.max_workers = max_workers
+        self.cache = cache
+        self._existing_buckets = set()
+        self._lock = Lock()
+
+    def bucket_exists(self, bucket_name : str, create : bool = False) -> bool:
+        """Checks whether a bucket exists, the answer is cached once it does.
+
+        Args:
+            bucket_name (str): The name of the bucket
+            create (bool, optional): Whether to create a missing bucket. Defaults to False.
+
+        Returns:
+            bool: Whether the bucket exists.
+        """
+        if bucket_name in self._existing_buckets:
+            return True
+        with self._lock:
+            if bucket_name in self._existing_buckets:
+                return True
+            if not self.client.bucket_exists(bucket_name):
+                if not create:
+                    return False
+                Logger.info(f'Creating bucket : {bucket_name}')
+                self.client.make_bucket(bucket_name)
+                Logger.info('Creating creation succeeded ✔️')
+            self._existing_buckets.add(bucket_name)
+        return True
+
+    def upload(self, local_path : str, bucket_name : str, object_name : str) -> bool:
+        """Uploads a file to the object storage bucket, creating the bucket if needed.
+
+        Args:
+            local_path (str): The local path of the file to upload
+            bucket_name (str): The name of the bucket to upload to
+            object_name (str): The name of the object in the bucket
+
+        Returns:
+            bool: Whether the upload was successful.
+        """
+        Logger.info(f'Uploading model from path\
+            {local_path} to bucket {bucket_name} as {object_name}')
+        self.bucket_exists(bucket_name, create=True)
+        try:
+            self.client.fput_object(bucket_name, object_name, local_path)
+        except S3Error as error:
+            err = Logger.get_color_string(error, Logger.FAIL)
+            Logger.fail(f'Model upload failed ❌\n{err}')
+            return False
+        Logger.info('Model upload succeeded ✔️')
+        return True
+
+    def download(self, local_path : str, bucket_name : str, object_name : str,
+                 version : str = None, use_cache : bool = True) -> bool:
+        """Downloads a file from the object storage bucket.
+        If a cache is configured, only objects which are not cached yet are transferred.
+
+        Args:
+            local_path (str): The local path to download the file to
+            bucket_name (str): The name of the bucket to download from
+            object_name (str): The name of the object in the bucket
+            version (str, optional): The ETag the object must have,
+                    the download fails if the object changed. Defaults to None.
+            use_cache (bool, optional): Whether to use the configured cache. Defaults to True.
+
+        Returns:
+            bool: Whether the download was successful.
+        """
+        if use_cache and self.cache is not None:
+            return self.cache.fetch(self, bucket_name, object_name, local_path, version=version)
+        Logger.info(f'Downloading model {object_name}\
+            from bucket {bucket_name} to {local_path}')
+        if not self.bucket_exists(bucket_name):
+            Logger.fail(f'Model download failed, bucket {bucket_name} does not exist ❌')
+            return False
+        try:
+            request_headers = {'If-Match': f'"{version}"'} if version is not None else None
+            self.client.fget_object(bucket_name, object_name, local_path,
+                                    request_headers=request_headers)
+        except S3Error as error:
+            err = Logger.get_color_string(error, Logger.FAIL)
+            Logger.fail(f'Model download failed ❌\n{err}')
+            return False
+        Logger.info('Model download succeeded ✔️')
+        return True
+
+    def put_bytes(self, bucket_name : str, object_name : str, data : bytes,
+                  content_type : str = 'application/octet-stream') -> bool:
+        """Uploads a small object from memory, creating the bucket if needed.
+        The object is replaced atomically, readers see either the old or the new contents.
+
+        Args:
+            bucket_name (str): The name of the bucket to upload to
+            object_name (str): The name of the object in the bucket
+            data (bytes): The contents of the object
+            content_type (str, optional): The content type of the object.
+                    Defaults to 'application/octet-stream'.
+
+        Returns:
+            bool: Whether the upload was successful.
+        """
+        self.bucket_exists(bucket_name, create=True)
+        try:
+            self.client.put_object(bucket_name, object_name, io.BytesIO(data), len(data),
+                                   content_type=content_type)
+        except S3Error as error:
+            err = Logger.get_color_string(error, Logger.FAIL)
+            Logger.fail(f'Upload of {object_name} failed ❌\n{err}')
+            return False
+        return True
+
+    def get_bytes(self, bucket_name : str, object_name : str):
+        """Downloads a small object into memory.
+
+        Args:
+            bucket_name (str): The name of the bucket to download from
+            object_name (str): The name of the object in the bucket
+
+        Returns:
+            bytes | None: The contents of the object, or None if it is not available.
+        """
+        try:
+            response = self.client.get_object(bucket_name, object_name)
+        except S3Error as error:
+            err = Logger.get_color_string(error, Logger.FAIL)
+            Logger.fail(f'Download of {object_name} failed ❌\n{err}')
+            return None
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def stat(self, bucket_name : str, object_name : str):
+        """Gets the metadata of an object in the object storage bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket of the object
+            object_name (str): The name of the object in the bucket
+
+        Returns:
+            minio.datatypes.Object | None: The metadata of the object,
+                    or None if it is not available.
+        """
+        try:
+            return self.client.stat_object(bucket_name, object_name)
+        except S3Error as error:
+            err = Logger.get_color_string(error, Logger.FAIL)
+            Logger.fail(f'Reading model version failed ❌\n{err}')
+            return None
+
+    def get_version(self, bucket_name : str, object_name : str):
+        """Gets the version of an object in the object storage bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket of the object
+            object_name (str): The name of the object in the bucket
+
+        Returns:
+            str | None: The ETag of the object, or None if it is not available.
+        """
+        stat = self.stat(bucket_name, object_name)
+        return stat.etag if stat is not None else None
+
+    def _run_concurrently(self, function, transfers : list) -> bool:
+        """Runs transfers concurrently, so that the total time is bounded by the slowest one.
+
+        Args:
+            function (Callable[..., bool]): The transfer to run for every entry
+            transfers (list[tuple]): The arguments of each transfer
+
+        Returns:
+            bool: Whether all transfers were successful.
+        """
+        if not transfers:
+            return True
+        workers = min(self.max_workers, len(transfers))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transfer') as executor:
+            results = list(executor.map(lambda args: function(*args), transfers))
+        return all(results)
+
+    def upload_many(self, bucket_name : str, files : list) -> bool:
+        """Uploads several files concurrently to the object storage bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket to upload to
+            files (list[tuple[str, str]]): The local path and object name of every file
+
+        Returns:
+            bool: Whether all uploads were successful.
+        """
+        self.bucket_exists(bucket_name, create=True)
+        return self._run_concurrently(
+            self.upload,
+            [(local_path, bucket_name, object_name) for local_path, object_name in files]
+        )
+
+    def download_many(self, bucket_name : str, files : list) -> bool:
+        """Downloads several files concurrently from the object storage bucket.
+
+        Args:
+            bucket_name (str): The name of the bucket to download from
+            files (list[tuple[str, str]]): The local path and object name of every file
+
+        Returns:
+            bool: Whether all downloads were successful.
+        """
+        if not self.bucket_exists(bucket_name):
+            Logger.fail(f'Model download failed, bucket {bucket_name} does not exist ❌')
+            return False
+        return self._run_concurrently(
+            self.download,
+            [(local_path, bucket_name, object_name) for local_path, object_name in files]
+        )
+
+
+def get_object_store(object_storage_endpoint : str,
+                     access_key : str, secret_key : str,
+                     secure : bool) -> ObjectStore:
+    """Gets the shared object storage client for the given endpoint and credentials.
 
     Args:
-        model_path (str): The local path of the model to upload
-        bucket_name (str): The name of the bucket to upload to
-        model_name (str): The name that the object in the bucket
         object_storage_endpoint (str) : The endpoint used for auth
         access_key (str) : The auth access key
-        secre_key (str) : The auth secret key
+        secret_key (str) : The auth secret key
         secure (str) : Whether to use TLS during auth
 
     Returns:
-        bool: Whether the download was successful.
+        ObjectStore: The object storage client, created on first use
     """
-    Logger.info(f'Downloading model {model_name}\
-        from bucket {bucket_name} to {model_path}')
-
-    client = authenticate(object_storage_endpoint, access_key, secret_key, secure)
-    if not client.bucket_exists(bucket_name):
-        Logger.fail(f'Model download failed, bucket {bucket_name} does not exist ❌')
-        return False
-    success = True
-    try:
-        client.fget_object(bucket_name, model_name, model_path)
-    except S3Error as error:
-        success = False
-        err = Logger.get_color_string(error, Logger.FAIL)
-        Logger.fail(f'Model download failed ❌\n{err}')
-    
-    if success:
-        Logger.info('Model download succeeded ✔️')
+    key = (object_storage_endpoint, access_key, secret_key, secure)
+    with _object_stores_lock:
+        if key not in _object_stores:
+            client = authenticate(object_storage_endpoint, access_key, secret_key, secure,
+                                  http_client=create_http_client())
+            _object_stores[key] = ObjectStore(client)
+        return _object_stores[key]
 
-    return success
 
 def load_model(model_path : str):
     """Loads a model from the specified path.
+    Models in the memory-mapped format are mapped read-only
+    instead of being deserialized into the process memory.
 
     Args:
         model_path (str): The path of the model to load
@@ -119,7 +343,10 @@ def load_model(model_path : str):
     if not os.path.isfile(model_path):
         Logger.fail(f'No model available at {model_path} ❌')
         return None
-    model = load(model_path)
+    if model_path.endswith(MAPPED_MODEL_EXTENSION):
+        model = load_mapped_model(model_path)
+    else:
+        model = load(model_path)
 
     Logger.info('Model loading succeeded ✔️')
     return model
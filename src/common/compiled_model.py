@@ -0,0 +1,342 @@
+"""
+Provides a compiled model for fast tag predictions.
+The fitted TF-IDF vectorizer and one-vs-rest linear classifier are compiled into
+a single object which predicts all tags with one sparse matrix product.
+"""
+import re
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.utils import murmurhash3_32
+
+
+def top_k_scores(scores : np.ndarray, k : int, threshold=None) -> list:
+    """Selects the k highest scores of every row, using a partial sort.
+
+    Args:
+        scores (np.ndarray): scores of shape (number of samples, number of labels)
+        k (int): maximum number of labels selected for every sample
+        threshold (float | np.ndarray, optional): minimum score of a selected label,
+                    either global or for every label. Defaults to None.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: for every sample, the indices
+                    of the selected labels and their scores, by decreasing score
+    """
+    n_labels = scores.shape[1]
+    k = max(0, min(k, n_labels))
+    if k == 0:
+        return [(np.zeros(0, dtype=np.int64), np.zeros(0)) for _ in range(len(scores))]
+    if k < n_labels:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(n_labels), (len(scores), 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    # Only the k selected scores are sorted
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    if threshold is None:
+        return list(zip(top, top_scores))
+    threshold = np.asarray(threshold, dtype=np.float64)
+    passed = top_scores >= (threshold[top] if threshold.ndim else threshold)
+    return [(indices[mask], values[mask])
+            for indices, values, mask in zip(top, top_scores, passed)]
+
+
+class DictVocabulary:
+    """Vocabulary backed by a term to feature index mapping.
+
+    Args:
+        vocabulary (dict[str, int]): mapping of terms to feature indices
+    """
+
+    def __init__(self, vocabulary : dict):
+        self.vocabulary = vocabulary
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def lookup(self, terms : list) -> np.ndarray:
+        """Gets the feature indices of terms.
+
+        Args:
+            terms (list[str]): the terms to look up
+
+        Returns:
+            np.ndarray: the feature index of every term, -1 for unknown terms
+        """
+        get = self.vocabulary.get
+        return np.fromiter((get(term, -1) for term in terms), dtype=np.int64, count=len(terms))
+
+
+class HashedVocabulary:
+    """Vocabulary hashing terms into a fixed number of buckets,
+    like scikit-learn's `HashingVectorizer`, so that there are no terms to store.
+
+    Only the buckets used by the model are kept as features, so that
+    the size of the model does not depend on the number of buckets.
+
+    Args:
+        n_features (int): number of hashed buckets
+        buckets (np.ndarray, optional): sorted buckets used as features.
+                    Defaults to None, using every bucket as a feature.
+    """
+
+    def __init__(self, n_features : int, buckets : np.ndarray = None):
+        self.n_features = n_features
+        self.buckets = buckets
+
+    def __len__(self):
+        return self.n_features if self.buckets is None else len(self.buckets)
+
+    def lookup(self, terms : list) -> np.ndarray:
+        """Gets the feature indices of terms.
+
+        Args:
+            terms (list[str]): the terms to look up
+
+        Returns:
+            np.ndarray: the feature index of every term, -1 for terms in unused buckets
+        """
+        n_features = self.n_features
+        hashes = np.fromiter((abs(murmurhash3_32(term)) % n_features for term in terms),
+                             dtype=np.int64, count=len(terms))
+        if self.buckets is None:
+            return hashes
+        result = np.full(len(terms), -1, dtype=np.int64)
+        if len(terms) == 0 or len(self.buckets) == 0:
+            return result
+        positions = np.searchsorted(self.buckets, hashes)
+        positions[positions == len(self.buckets)] = 0
+        found = self.buckets[positions] == hashes
+        result[found] = positions[found]
+        return result
+
+
+class CompiledTagger:
+    """Tag predictor computing TF-IDF features and the scores of all tags at once.
+
+    Args:
+        vocabulary (DictVocabulary | MappedVocabulary | HashedVocabulary): vocabulary
+                    of the features
+        weights (sp.csr_matrix): stacked weights of all tags, of shape (features, tags)
+        intercept (np.ndarray): intercept of every tag
+        tags (list[str]): name of every tag
+        idf (np.ndarray, optional): inverse document frequency of every feature,
+                    None disables the IDF weighting. Defaults to None.
+        lowercase (bool, optional): whether titles are lowercased. Defaults to True.
+        token_pattern (str, optional): regular expression of a token. Defaults to r'(\\S+)'.
+        ngram_range (tuple[int, int], optional): range of the word n-gram sizes. Defaults to (1, 1).
+        sublinear_tf (bool, optional): whether term frequencies are log scaled. Defaults to False.
+        norm (str, optional): normalization of the features, 'l1', 'l2' or None. Defaults to 'l2'.
+    """
+
+    def __init__(self, vocabulary, weights : sp.csr_matrix, intercept : np.ndarray,
+                 tags : list, idf : np.ndarray = None, lowercase=True,
+                 token_pattern=r'(\S+)', ngram_range=(1, 1), sublinear_tf=False, norm='l2'):
+        self.vocabulary = vocabulary
+        self.weights = weights
+        self.intercept = intercept
+        self.tags = list(tags)
+        self.idf = idf
+        self.lowercase = lowercase
+        self.token_pattern = token_pattern
+        self.ngram_range = tuple(ngram_range)
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+        self._token_regex = re.compile(token_pattern)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_token_regex']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._token_regex = re.compile(self.token_pattern)
+
+    @property
+    def n_features(self) -> int:
+        """Number of features of the model."""
+        return self.weights.shape[0]
+
+    def analyze(self, title : str) -> list:
+        """Splits a title into the word n-grams used as features.
+
+        Args:
+            title (str): title of the StackOverflow question
+
+        Returns:
+            list[str]: the n-grams of the title
+        """
+        if self.lowercase:
+            title = title.lower()
+        tokens = self._token_regex.findall(title)
+        min_n, max_n = self.ngram_range
+        ngrams = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            ngrams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return ngrams
+
+    def vectorize(self, titles : list) -> sp.csr_matrix:
+        """Computes the TF-IDF features of titles.
+
+        Args:
+            titles (list[str]): titles of the StackOverflow questions
+
+        Returns:
+            sp.csr_matrix: the features of the titles
+        """
+        ngrams = []
+        rows = []
+        for row, title in enumerate(titles):
+            title_ngrams = self.analyze(title)
+            ngrams.extend(title_ngrams)
+            rows.extend([row] * len(title_ngrams))
+        columns = self.vocabulary.lookup(ngrams)
+        known = columns >= 0
+        rows = np.asarray(rows, dtype=np.int64)[known]
+        columns = columns[known]
+        features = sp.csr_matrix(
+            (np.ones(len(columns)), (rows, columns)),
+            shape=(len(titles), self.n_features)
+        )
+        features.sum_duplicates()
+        if self.sublinear_tf:
+            np.log(features.data, features.data)
+            features.data += 1
+        if self.idf is not None:
+            features.data *= np.asarray(self.idf)[features.indices]
+        if self.norm is not None:
+            row_ids = np.repeat(np.arange(len(titles)), np.diff(features.indptr))
+            values = features.data ** 2 if self.norm == 'l2' else np.abs(features.data)
+            lengths = np.bincount(row_ids, weights=values, minlength=len(titles))
+            if self.norm == 'l2':
+                lengths = np.sqrt(lengths)
+            lengths[lengths == 0] = 1
+            features.data /= lengths[row_ids]
+        return features
+
+    def decision_function(self, titles : list) -> np.ndarray:
+        """Computes the score of every tag for titles with a single sparse matrix product.
+
+        Args:
+            titles (list[str]): titles of the StackOverflow questions
+
+        Returns:
+            np.ndarray: scores of shape (number of titles, number of tags)
+        """
+        scores = (self.vectorize(titles) @ self.weights).toarray()
+        scores += self.intercept
+        return scores
+
+    def transform(self, titles : list) -> list:
+        """Predicts the tags of titles.
+
+        Args:
+            titles (list[str]): titles of the StackOverflow questions
+
+        Returns:
+            list[tuple[str]]: the predicted tags of every title
+        """
+        rows, columns = np.nonzero(self.decision_function(titles) > 0)
+        predictions = [[] for _ in titles]
+        for row, column in zip(rows, columns):
+            predictions[row].append(self.tags[column])
+        return [tuple(tags) for tags in predictions]
+
+    def tag_thresholds(self, thresholds : dict, default : float) -> np.ndarray:
+        """Creates the per-tag threshold vector used by `top_k`.
+
+        Args:
+            thresholds (dict[str, float]): thresholds of individual tags,
+                    unknown tags are ignored
+            default (float): threshold of the remaining tags
+
+        Returns:
+            np.ndarray: the threshold of every tag
+        """
+        result = np.full(len(self.tags), default, dtype=np.float64)
+        positions = {tag: i for i, tag in enumerate(self.tags)}
+        for tag, threshold in thresholds.items():
+            if tag in positions:
+                result[positions[tag]] = threshold
+        return result
+
+    def top_k(self, titles : list, k : int = None, threshold=None) -> list:
+        """Predicts the highest scoring tags of titles, together with their scores.
+
+        Args:
+            titles (list[str]): titles of the StackOverflow questions
+            k (int, optional): maximum number of tags for every title.
+                    Defaults to None, selecting all tags passing the threshold.
+            threshold (float | np.ndarray, optional): minimum score of a tag,
+                    either global or for every tag. Defaults to None.
+
+        Returns:
+            list[list[tuple[str, float]]]: the tags and scores of every title,
+                    by decreasing score
+        """
+        k = len(self.tags) if k is None else k
+        selected = top_k_scores(self.decision_function(titles), k, threshold)
+        return [
+            [(self.tags[index], float(score)) for index, score in zip(indices, scores)]
+            for indices, scores in selected
+        ]
+
+
+def compile_model(vectorizer, classifier, label_binarizer) -> CompiledTagger:
+    """Compiles a trained model into a `CompiledTagger`.
+
+    Args:
+        vectorizer (TfidfVectorizer | HashingTfidfVectorizer): fitted vectorizer of the titles
+        classifier (OneVsRestClassifier): fitted one-vs-rest linear classifier
+        label_binarizer (MultiLabelBinarizer): fitted binarizer of the tags
+
+    Returns:
+        CompiledTagger: the compiled model
+    """
+    if getattr(vectorizer, 'analyzer', 'word') != 'word' \
+            or any(getattr(vectorizer, attribute, None) is not None
+                   for attribute in ('stop_words', 'strip_accents', 'preprocessor', 'tokenizer')):
+        raise ValueError('Only word n-gram vectorizers without custom processing can be compiled')
+
+    if hasattr(vectorizer, 'vocabulary_'):
+        vocabulary = DictVocabulary(dict(vectorizer.vocabulary_))
+        features = slice(None)
+        idf = vectorizer.idf_ if vectorizer.use_idf else None
+    else:
+        # Vectorizers hashing their features, only the buckets with a non-zero IDF
+        # contribute to the features and are kept
+        features = np.flatnonzero(vectorizer.idf_)
+        vocabulary = HashedVocabulary(vectorizer.n_features, features)
+        idf = vectorizer.idf_[features]
+    n_features = len(vocabulary)
+    columns = []
+    intercept = np.zeros(len(classifier.estimators_), dtype=np.float64)
+    for i, estimator in enumerate(classifier.estimators_):
+        if hasattr(estimator, 'coef_'):
+            columns.append(sp.csr_matrix(np.reshape(np.ravel(estimator.coef_)[features], (-1, 1))))
+            intercept[i] = np.ravel(estimator.intercept_)[0]
+        else:
+            # Labels which were constant in the training data are always
+            # predicted as their constant value.
+            columns.append(sp.csr_matrix((n_features, 1)))
+            intercept[i] = float(estimator.y_)
+    weights = sp.csr_matrix(sp.hstack(columns, dtype=np.float64))
+    weights.eliminate_zeros()
+
+    return CompiledTagger(
+        vocabulary,
+        weights,
+        intercept,
+        [str(tag) for tag in label_binarizer.classes_],
+        idf=np.asarray(idf, dtype=np.float64) if idf is not None else None,
+        lowercase=vectorizer.lowercase,
+        token_pattern=vectorizer.token_pattern,
+        ngram_range=vectorizer.ngram_range,
+        sublinear_tf=vectorizer.sublinear_tf,
+        norm=vectorizer.norm
+    )
@@ -0,0 +1,225 @@
+"""
+Provides a memory-mapped model format for inference.
+All numeric arrays of the model, as well as its vocabulary, are stored
+in a single file which is mapped read-only into memory, so that the
+pages are shared between all processes serving the same file.
+"""
+import json
+
+import numpy as np
+import scipy.sparse as sp
+
+from common.compiled_model import CompiledTagger, HashedVocabulary
+
+MAPPED_MODEL_EXTENSION = '.npmap'
+
+_MAGIC = b'SOTMAP01'
+_HEADER_LENGTH_DTYPE = np.dtype('<u8')
+_ALIGNMENT = 64
+
+
+def _aligned(offset : int) -> int:
+    """Rounds an offset up to the array alignment."""
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def save_mapped_arrays(path : str, arrays : dict, meta : dict = None):
+    """Saves numeric arrays and metadata into a single memory-mappable file.
+
+    The file consists of a magic string, a JSON header describing
+    the arrays, followed by the raw aligned data of each array.
+
+    Args:
+        path (str): The path of the file to create
+        arrays (dict[str, np.ndarray]): The arrays to store
+        meta (dict, optional): JSON serializable metadata. Defaults to None.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    descriptions = {}
+    offset = 0
+    for name, array in arrays.items():
+        descriptions[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({"meta": meta or {}, "arrays": descriptions}).encode('utf-8')
+    data_start = _aligned(len(_MAGIC) + _HEADER_LENGTH_DTYPE.itemsize + len(header))
+
+    with open(path, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(np.array(len(header), dtype=_HEADER_LENGTH_DTYPE).tobytes())
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + descriptions[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def load_mapped_arrays(path : str):
+    """Maps the arrays of a file created by `save_mapped_arrays` read-only into memory.
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        tuple[dict[str, np.memmap], dict]: The mapped arrays and the metadata
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f'{path} is not a mapped model file')
+        header_length = int(np.frombuffer(f.read(_HEADER_LENGTH_DTYPE.itemsize),
+                                          dtype=_HEADER_LENGTH_DTYPE)[0])
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    data_start = _aligned(len(_MAGIC) + _HEADER_LENGTH_DTYPE.itemsize + header_length)
+
+    arrays = {}
+    for name, description in header["arrays"].items():
+        shape = tuple(description["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=description["dtype"])
+            continue
+        arrays[name] = np.memmap(
+            path,
+            dtype=np.dtype(description["dtype"]),
+            mode='r',
+            offset=data_start + description["offset"],
+            shape=shape
+        )
+    return arrays, header["meta"]
+
+
+class MappedVocabulary:
+    """Read-only vocabulary backed by a sorted array of UTF-8 encoded terms.
+
+    Instead of a per-process Python dict, terms are looked up with
+    a vectorized binary search in an array which can be memory-mapped.
+
+    Args:
+        terms (np.ndarray): sorted array of encoded terms, of a bytes (`S`) dtype
+        indices (np.ndarray): feature index of each term
+    """
+
+    def __init__(self, terms : np.ndarray, indices : np.ndarray):
+        self.terms = terms
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.terms)
+
+    @staticmethod
+    def arrays_from_dict(vocabulary : dict):
+        """Creates the arrays of a vocabulary from a term to feature index mapping.
+
+        Args:
+            vocabulary (dict[str, int]): mapping of terms to feature indices
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: the sorted terms and their feature indices
+        """
+        encoded = sorted((term.encode('utf-8'), index) for term, index in vocabulary.items())
+        width = max([len(term) for term, _ in encoded], default=1)
+        terms = np.array([term for term, _ in encoded], dtype=f'S{width}')
+        indices = np.array([index for _, index in encoded], dtype=np.int64)
+        return terms, indices
+
+    def lookup(self, terms : list) -> np.ndarray:
+        """Gets the feature indices of terms.
+
+        Args:
+            terms (list[str]): the terms to look up
+
+        Returns:
+            np.ndarray: the feature index of every term, -1 for unknown terms
+        """
+        result = np.full(len(terms), -1, dtype=np.int64)
+        if len(terms) == 0 or len(self.terms) == 0:
+            return result
+        width = self.terms.dtype.itemsize
+        # Terms longer than the widest known term cannot be in the vocabulary,
+        # they are replaced by an empty term which never matches.
+        encoded = [term.encode('utf-8') for term in terms]
+        queries = np.array([term if len(term) <= width else b'' for term in encoded],
+                           dtype=self.terms.dtype)
+        positions = np.searchsorted(self.terms, queries)
+        positions[positions == len(self.terms)] = 0
+        found = (self.terms[positions] == queries) & (queries != b'')
+        result[found] = self.indices[positions[found]]
+        return result
+
+
+def save_mapped_model(path : str, model : CompiledTagger):
+    """Exports a compiled model into the memory-mapped format.
+
+    Args:
+        path (str): The path of the file to create
+        model (CompiledTagger): The compiled model
+    """
+    if isinstance(model.vocabulary, HashedVocabulary):
+        # Hashed features have no vocabulary to store
+        terms, term_indices = np.zeros(0, dtype='S1'), np.zeros(0, dtype=np.int64)
+    elif isinstance(model.vocabulary, MappedVocabulary):
+        terms, term_indices = model.vocabulary.terms, model.vocabulary.indices
+    else:
+        terms, term_indices = MappedVocabulary.arrays_from_dict(model.vocabulary.vocabulary)
+    weights = sp.csr_matrix(model.weights)
+    tags = [tag.encode('utf-8') for tag in model.tags]
+
+    arrays = {
+        "terms": terms,
+        "term_indices": term_indices,
+        "weights_data": weights.data,
+        "weights_indices": weights.indices,
+        "weights_indptr": weights.indptr,
+        "intercept": np.asarray(model.intercept, dtype=np.float64),
+        "tags": np.array(tags, dtype=f'S{max([len(tag) for tag in tags], default=1)}'),
+    }
+    if model.idf is not None:
+        arrays["idf"] = np.asarray(model.idf, dtype=np.float64)
+    meta = {
+        "weights_shape": list(weights.shape),
+        "lowercase": model.lowercase,
+        "token_pattern": model.token_pattern,
+        "ngram_range": list(model.ngram_range),
+        "sublinear_tf": model.sublinear_tf,
+        "norm": model.norm,
+    }
+    if isinstance(model.vocabulary, HashedVocabulary):
+        meta["hashed_features"] = model.vocabulary.n_features
+        if model.vocabulary.buckets is not None:
+            arrays["hashed_buckets"] = np.asarray(model.vocabulary.buckets, dtype=np.int64)
+    save_mapped_arrays(path, arrays, meta)
+
+
+def load_mapped_model(path : str) -> CompiledTagger:
+    """Loads a model saved by `save_mapped_model`, mapping its arrays read-only.
+
+    Args:
+        path (str): The path of the model file
+
+    Returns:
+        CompiledTagger: The loaded model
+    """
+    arrays, meta = load_mapped_arrays(path)
+    weights = sp.csr_matrix(
+        (arrays["weights_data"], arrays["weights_indices"], arrays["weights_indptr"]),
+        shape=tuple(meta["weights_shape"]),
+        copy=False
+    )
+    if "hashed_features" in meta:
+        vocabulary = HashedVocabulary(meta["hashed_features"], arrays.get("hashed_buckets"))
+    else:
+        vocabulary = MappedVocabulary(arrays["terms"], arrays["term_indices"])
+    return CompiledTagger(
+        vocabulary,
+        weights,
+        arrays["intercept"],
+        [tag.decode('utf-8') for tag in arrays["tags"]],
+        idf=arrays.get("idf"),
+        lowercase=meta["lowercase"],
+        token_pattern=meta["token_pattern"],
+        ngram_range=meta["ngram_range"],
+        sublinear_tf=meta["sublinear_tf"],
+        norm=meta["norm"]
+    )
@@ -0,0 +1,189 @@
+"""
+Provides versioned model bundles.
+All artifacts of a trained model are uploaded under the hash of their contents,
+and listed in an immutable manifest. A bundle is published by replacing
+a single pointer object with the key of its manifest, so that readers
+always fetch artifacts of one and the same generation.
+Artifacts published before bundles existed, under their names as object keys,
+are read through a manifest describing them, until a bundle is published.
+"""
+import hashlib
+import json
+import os
+import time
+
+from common.bucket import ObjectStore
+from common.logger import Logger
+
+MANIFEST_FORMAT = 1
+ARTIFACT_PREFIX = 'artifacts/'
+MANIFEST_PREFIX = 'bundles/'
+
+
+def file_sha256(path : str) -> str:
+    """Computes the SHA-256 hex digest of a file.
+
+    Args:
+        path (str): The path of the file
+
+    Returns:
+        str: The hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_manifest(artifacts : dict) -> dict:
+    """Creates the manifest of a bundle of local files.
+
+    Args:
+        artifacts (dict[str, str]): The local path of every artifact, by artifact name
+
+    Returns:
+        dict: The manifest, listing the object key, hash and size of every artifact
+    """
+    entries = {}
+    for name, path in sorted(artifacts.items()):
+        sha256 = file_sha256(path)
+        entries[name] = {
+            "key": f'{ARTIFACT_PREFIX}{sha256}',
+            "sha256": sha256,
+            "size": os.path.getsize(path),
+        }
+    bundle_hash = hashlib.sha256(
+        json.dumps(entries, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return {
+        "format": MANIFEST_FORMAT,
+        "version": f'{time.strftime("%Y%m%d%H%M%S", time.gmtime())}-{bundle_hash[:12]}',
+        "artifacts": entries,
+    }
+
+
+def publish_bundle(object_store : ObjectStore, bucket_name : str,
+                   pointer_key : str, artifacts : dict):
+    """Uploads the artifacts of a model and publishes them as the latest bundle.
+
+    The artifacts and the manifest are uploaded first, the pointer is
+    only replaced once they are all available.
+
+    Args:
+        object_store (ObjectStore): The object storage client
+        bucket_name (str): The name of the bucket to upload to
+        pointer_key (str): The name of the object pointing to the latest manifest
+        artifacts (dict[str, str]): The local path of every artifact, by artifact name
+
+    Returns:
+        dict | None: The published manifest, or None if the upload failed.
+    """
+    manifest = create_manifest(artifacts)
+    Logger.info(f'Publishing model bundle {manifest["version"]}')
+    success = object_store.upload_many(bucket_name, [
+        (artifacts[name], entry["key"]) for name, entry in manifest["artifacts"].items()
+    ])
+    manifest_key = f'{MANIFEST_PREFIX}{manifest["version"]}.json'
+    success = success and object_store.put_bytes(
+        bucket_name, manifest_key,
+        json.dumps(manifest, indent=2).encode('utf-8'), content_type='application/json'
+    )
+    success = success and object_store.put_bytes(
+        bucket_name, pointer_key,
+        json.dumps({"manifest": manifest_key}).encode('utf-8'), content_type='application/json'
+    )
+    if not success:
+        Logger.fail(f'Publishing model bundle {manifest["version"]} failed ❌')
+        return None
+    Logger.info(f'Model bundle {manifest["version"]} published ✔️')
+    return manifest
+
+
+def read_legacy_manifest(object_store : ObjectStore, bucket_name : str, names : list):
+    """Describes artifacts stored under their names as object keys, like a manifest.
+
+    The version of the description is derived from the ETags of the artifacts.
+    The artifacts have no hash, so they are not verified when fetched.
+
+    Args:
+        object_store (ObjectStore): The object storage client
+        bucket_name (str): The name of the bucket of the artifacts
+        names (list[str]): The names of the artifacts
+
+    Returns:
+        dict | None: The manifest, or None if an artifact is not available.
+    """
+    etags = {}
+    for name in names:
+        etags[name] = object_store.get_version(bucket_name, name)
+        if etags[name] is None:
+            return None
+    etags_hash = hashlib.sha256(json.dumps(etags, sort_keys=True).encode('utf-8')).hexdigest()
+    return {
+        "format": MANIFEST_FORMAT,
+        "version": f'legacy-{etags_hash[:12]}',
+        "artifacts": {
+            name: {"key": name, "sha256": None} for name in names
+        },
+    }
+
+
+def read_manifest(object_store : ObjectStore, bucket_name : str, pointer_key : str,
+                  legacy_names : list = None):
+    """Reads the manifest of the latest bundle.
+
+    Args:
+        object_store (ObjectStore): The object storage client
+        bucket_name (str): The name of the bucket of the bundle
+        pointer_key (str): The name of the object pointing to the latest manifest
+        legacy_names (list[str], optional): The names of the artifacts to read from their
+                    own object keys when no bundle was published yet. Defaults to None.
+
+    Returns:
+        dict | None: The manifest, or None if no bundle is available.
+    """
+    pointer = object_store.get_bytes(bucket_name, pointer_key)
+    if pointer is None:
+        if legacy_names:
+            Logger.warning(f'No model bundle at {pointer_key}, reading the artifacts '
+                           'from their own object keys ⚠️')
+            return read_legacy_manifest(object_store, bucket_name, legacy_names)
+        return None
+    manifest = object_store.get_bytes(bucket_name, json.loads(pointer)["manifest"])
+    if manifest is None:
+        return None
+    manifest = json.loads(manifest)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        Logger.fail(f'Unsupported model bundle format {manifest.get("format")} ❌')
+        return None
+    return manifest
+
+
+def fetch_bundle(object_store : ObjectStore, bucket_name : str,
+                 manifest : dict, targets : dict) -> bool:
+    """Downloads artifacts of a bundle concurrently and verifies their contents.
+
+    Args:
+        object_store (ObjectStore): The object storage client
+        bucket_name (str): The name of the bucket of the bundle
+        manifest (dict): The manifest of the bundle
+        targets (dict[str, str]): The local path to download to, by artifact name
+
+    Returns:
+        bool: Whether all artifacts were downloaded.
+    """
+    missing = [name for name in targets if name not in manifest["artifacts"]]
+    if missing:
+        Logger.fail(f'Model bundle {manifest["version"]} has no artifact {", ".join(missing)} ❌')
+        return False
+    if not object_store.download_many(bucket_name, [
+        (path, manifest["artifacts"][name]["key"]) for name, path in targets.items()
+    ]):
+        return False
+    for name, path in targets.items():
+        expected = manifest["artifacts"][name]["sha256"]
+        if expected is not None and file_sha256(path) != expected:
+            Logger.fail(f'Artifact {name} of bundle {manifest["version"]} is corrupted ❌')
+            return False
+    return True
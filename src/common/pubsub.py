@@ -1,22 +1,42 @@
 """Provides a `subscribe` function
-   That creates a new subscription to a Pub/Sub topic.
+   That creates a new subscription to a Pub/Sub topic,
+   optionally delivering its messages to the callback in lists.
+   Also provides the encoding of corrections into compact binary messages,
+   each carrying many corrections.
 """
 import os
+import struct
+import sys
 import uuid
-from typing import Callable
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+from typing import Callable, List, Union
 from google.api_core.exceptions import NotFound
 from common.logger import Logger
 from google.cloud.pubsub_v1.subscriber.message import Message
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
 from google.cloud.pubsub_v1 import PublisherClient, SubscriberClient, types
 
 
-def publish_to_topic(topic_path: str):
+def publish_to_topic(topic_path: str, batch_settings: types.BatchSettings = None,
+                     flow_control: types.PublishFlowControl = None):
     """Creates a publisher to a given topic and creates that topic.
 
     Args:
         topic_path (str): topic we want to publish to or just create a topic
+        batch_settings (types.BatchSettings, optional): limits of the batches of messages
+                    sent in one request. Defaults to None, using the client defaults.
+        flow_control (types.PublishFlowControl, optional): limits of the messages
+                    waiting to be sent. Defaults to None, unlimited.
     """
-    publisher = PublisherClient()
+    publisher_options = {}
+    if batch_settings is not None:
+        publisher_options["batch_settings"] = batch_settings
+    if flow_control is not None:
+        publisher_options["publisher_options"] = types.PublisherOptions(flow_control=flow_control)
+    publisher = PublisherClient(**publisher_options)
     colored_topic_path = Logger.get_color_string(
         topic_path,
         Logger.OK_BLUE
@@ -33,10 +53,74 @@ def publish_to_topic(topic_path: str):
         Logger.info(f'Topic created {colored_topic_path} ✔️')
     return publisher
 
+class MessageBatcher:
+    """Collects the messages of a subscription, handing them to a callback in lists.
+
+    A list is handed over once it holds `max_messages` messages, or `max_latency`
+    seconds after its first message arrived. The callback acknowledges every message
+    itself. When it fails, the messages it did not acknowledge are delivered again
+    once their leases expire, those it already handed over are left alone.
+
+    Args:
+        callback (Callable[[List[Message]], None]): callback on handling lists of messages
+        max_messages (int): maximum number of messages in a list
+        max_latency (float): maximum number of seconds a message waits for its list to fill
+    """
+
+    def __init__(self, callback : Callable[[List[Message]], None], max_messages : int,
+                 max_latency : float):
+        self.callback = callback
+        self.max_messages = max_messages
+        self.max_latency = max_latency
+        self._lock = Lock()
+        self._messages = []
+        self._timer = None
+
+    def __call__(self, message : Message):
+        """Adds a message, handing over its list when it is full."""
+        with self._lock:
+            self._messages.append(message)
+            if len(self._messages) < self.max_messages:
+                if self._timer is None:
+                    self._timer = Timer(self.max_latency, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            messages = self._take()
+        self._deliver(messages)
+
+    def flush(self):
+        """Hands over the collected messages, if any."""
+        with self._lock:
+            messages = self._take()
+        if messages:
+            self._deliver(messages)
+
+    def _take(self) -> List[Message]:
+        """Takes the collected messages, starting a new list."""
+        messages, self._messages = self._messages, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return messages
+
+    def _deliver(self, messages : List[Message]):
+        """Hands a list of messages to the callback."""
+        try:
+            self.callback(messages)
+        except Exception as error: # pylint: disable=broad-except
+            Logger.fail(f'Failed to handle {len(messages)} messages ❌\n{error}')
+
+
 def subscribe_to_topic(pubsub_host : str, pubsub_project_id : str,
                        pubsub_subscription_id : str, pubsub_subscription_topic_id : str,
-                       rec_msg_callback : Callable[[Message], None],
-                       unique_subscription_name=False):
+                       rec_msg_callback : Union[Callable[[Message], None],
+                                                Callable[[List[Message]], None]],
+                       unique_subscription_name=False,
+                       flow_control : types.FlowControl = None,
+                       callback_workers : int = None,
+                       batch_max_messages : int = None,
+                       batch_max_latency : float = 0.05):
     """Subscribes to a Pub/Sub topic.
 
     Args:
@@ -44,10 +128,19 @@ def subscribe_to_topic(pubsub_host : str, pubsub_project_id : str,
         pubsub_project_id (str): project id on pubsub
         pubsub_subscription_id (str): subscription id on pubsub
         pubsub_subscription_topic_id (str): subscription topic id on pubsub
-        rec_msg_callback (Callable[[Message], None]): callback on handling messages
-                    coming from subscription topic
+        rec_msg_callback (Callable[[Message], None] | Callable[[List[Message]], None]):
+                    callback on handling messages coming from subscription topic,
+                    receiving lists of messages when `batch_max_messages` is set
         unique_subscription_name (bool, optional): Whether to create a unique subscription name.
                 This should be enabled for the interface services. Defaults to False.
+        flow_control (types.FlowControl, optional): limits of the messages which are
+                    received but not acknowledged yet. Defaults to None, using the client defaults.
+        callback_workers (int, optional): number of threads running the callback.
+                    Defaults to None, using the client default.
+        batch_max_messages (int, optional): maximum number of messages handed to the callback
+                    in one list. Defaults to None, handing over messages one at a time.
+        batch_max_latency (float, optional): maximum number of seconds a message waits
+                    for its list to fill. Defaults to 0.05.
 
     Returns:
         (tuple[SubscriberClient, StreamingPullFuture | Unbound]): 
@@ -117,13 +210,189 @@ def subscribe_to_topic(pubsub_host : str, pubsub_project_id : str,
             )
     # Subscribe to the topic
     Logger.info(f'Subscribing to subscription {colored_subscription_path}')
+    subscribe_options = {}
+    if flow_control is not None:
+        subscribe_options["flow_control"] = flow_control
+    if callback_workers is not None:
+        subscribe_options["scheduler"] = ThreadScheduler(executor=ThreadPoolExecutor(
+            max_workers=callback_workers,
+            thread_name_prefix='pubsub-callback'
+        ))
+    callback = rec_msg_callback
+    if batch_max_messages:
+        max_outstanding = (flow_control or types.FlowControl()).max_messages
+        if max_outstanding < batch_max_messages:
+            Logger.warning(f'At most {max_outstanding} messages are received at once, '
+                           f'lists of {batch_max_messages} messages only fill by latency ⚠️')
+        callback = MessageBatcher(rec_msg_callback, batch_max_messages, batch_max_latency)
     try:
         streaming_pull_future = subscriber.subscribe(
             subscription_path,
-            callback=rec_msg_callback,
-            await_callbacks_on_shutdown=True
+            callback=callback,
+            await_callbacks_on_shutdown=True,
+            **subscribe_options
         )
         Logger.info(f'Subscribed to {colored_subscription_path} ✔️')
     except NotFound:
         Logger.fail(f'Failed to subscribe to {colored_subscription_path} ❌')
     return subscriber, streaming_pull_future
+
+
+# Binary messages of corrections start with the magic bytes, the format version and flags.
+# The body holds the number of corrections and of distinct tags, the distinct tags and the
+# titles as NUL separated UTF-8 strings, the numbers of predicted and actual tags of every
+# correction, then the indices of its predicted and actual tags in the distinct tags.
+CORRECTIONS_MAGIC = b'SOTC'
+CORRECTIONS_FORMAT_VERSION = 1
+_CORRECTIONS_HEADER = struct.Struct('<4sBB')
+_CORRECTIONS_COUNTS = struct.Struct('<III')
+_FLAG_COMPRESSED = 1
+# Compressing shorter bodies saves fewer bytes than the compression header costs
+_MIN_COMPRESSED_SIZE = 512
+_SEPARATOR = '\0'
+
+
+def _little_endian(values : array) -> bytes:
+    """Gets the little endian bytes of an array."""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode : str, data : bytes) -> array:
+    """Creates an array from little endian bytes."""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _check_field(value : str) -> str:
+    """Checks that a title or tag can be separated from the others."""
+    if _SEPARATOR in value:
+        raise ValueError(f'Corrections cannot contain NUL characters: {value!r}')
+    return value
+
+
+def encode_corrections(corrections : List[dict]) -> bytes:
+    """Encodes corrections into the data of a single message.
+
+    Args:
+        corrections (List[dict]): corrections with a `title`,
+                and the `predicted` and `actual` collections of tags
+
+    Returns:
+        bytes: the encoded corrections
+    """
+    tag_indices = {}
+    counts = array('H')
+    indices = array('I')
+    for correction in corrections:
+        for key in ("predicted", "actual"):
+            tags = correction[key]
+            counts.append(len(tags))
+            for tag in tags:
+                index = tag_indices.get(tag)
+                if index is None:
+                    index = tag_indices[_check_field(tag)] = len(tag_indices)
+                indices.append(index)
+    tags_blob = _SEPARATOR.join(tag_indices).encode('utf-8')
+    titles_blob = _SEPARATOR.join(
+        _check_field(correction["title"]) for correction in corrections
+    ).encode('utf-8')
+    body = b''.join([
+        _CORRECTIONS_COUNTS.pack(len(corrections), len(tag_indices), len(tags_blob)),
+        tags_blob,
+        struct.pack('<I', len(titles_blob)),
+        titles_blob,
+        _little_endian(counts),
+        _little_endian(indices),
+    ])
+    flags = 0
+    if len(body) >= _MIN_COMPRESSED_SIZE:
+        compressed = zlib.compress(body, 1)
+        if len(compressed) < len(body):
+            body, flags = compressed, _FLAG_COMPRESSED
+    return _CORRECTIONS_HEADER.pack(CORRECTIONS_MAGIC, CORRECTIONS_FORMAT_VERSION, flags) + body
+
+
+def _parse_tag_set(value : str) -> set:
+    """Parses a set of tags written as a Python set, such as `{'c#', 'asp.net'}`."""
+    if value in ('', 'set()', '{}'):
+        return set()
+    return {tag[1:-1] for tag in value[1:-1].split(', ')}
+
+
+def _decode_corrections_body(data : bytes):
+    """Decodes the distinct tags, titles, tag counts and tag indices of a binary message."""
+    _, version, flags = _CORRECTIONS_HEADER.unpack_from(data)
+    if version != CORRECTIONS_FORMAT_VERSION:
+        raise ValueError(f'Unsupported corrections format version {version}')
+    body = data[_CORRECTIONS_HEADER.size:]
+    if flags & _FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+
+    n_corrections, n_tags, tags_size = _CORRECTIONS_COUNTS.unpack_from(body)
+    offset = _CORRECTIONS_COUNTS.size
+    if offset + tags_size + 4 > len(body):
+        raise ValueError('Malformed corrections message: truncated tags')
+    tags = body[offset:offset + tags_size].decode('utf-8').split(_SEPARATOR) if n_tags else []
+    offset += tags_size
+    titles_size, = struct.unpack_from('<I', body, offset)
+    offset += 4
+    if offset + titles_size + 4 * n_corrections > len(body):
+        raise ValueError('Malformed corrections message: truncated titles or counts')
+    titles = body[offset:offset + titles_size].decode('utf-8').split(_SEPARATOR) \
+        if n_corrections else []
+    offset += titles_size
+    counts = _from_little_endian('H', body[offset:offset + 4 * n_corrections])
+    offset += 4 * n_corrections
+    indices = _from_little_endian('I', body[offset:])
+    if len(tags) != n_tags or len(titles) != n_corrections or len(indices) != sum(counts):
+        raise ValueError('Malformed corrections message')
+    if indices and max(indices) >= n_tags:
+        raise ValueError('Malformed corrections message: tag index out of range')
+    return tags, titles, counts, indices
+
+
+def decode_corrections(data : bytes, attributes : dict = None) -> List[dict]:
+    """Decodes the corrections of a message.
+
+    Messages in the former format, carrying a single correction in their
+    attributes, are decoded from the attributes.
+
+    Args:
+        data (bytes): the data of the message
+        attributes (dict, optional): the attributes of the message. Defaults to None.
+
+    Returns:
+        List[dict]: corrections with a `title`, and the `predicted` and `actual` sets of tags
+    """
+    if not data.startswith(CORRECTIONS_MAGIC):
+        if attributes is None or "title" not in attributes:
+            raise ValueError('The message does not contain corrections')
+        return [{
+            "title": attributes["title"],
+            "predicted": _parse_tag_set(attributes.get("predicted", '')),
+            "actual": _parse_tag_set(attributes.get("actual", '')),
+        }]
+    try:
+        tags, titles, counts, indices = _decode_corrections_body(data)
+    except (struct.error, zlib.error) as error:
+        raise ValueError(f'Malformed corrections message: {error}') from error
+
+    record_tags = [tags[index] for index in indices]
+    corrections = []
+    position = 0
+    for title, n_predicted, n_actual in zip(titles, counts[::2], counts[1::2]):
+        predicted_end = position + n_predicted
+        actual_end = predicted_end + n_actual
+        corrections.append({
+            "title": title,
+            "predicted": set(record_tags[position:predicted_end]),
+            "actual": set(record_tags[predicted_end:actual_end]),
+        })
+        position = actual_end
+    return corrections
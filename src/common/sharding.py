@@ -0,0 +1,27 @@
+"""
+Provides the split of batches into shards for worker processes.
+"""
+# Shards smaller than this are not worth sending to worker processes
+MIN_TITLES_PER_SHARD = 10000
+
+
+def split_into_shards(items : list, n_jobs : int, min_shard_size : int = None) -> list:
+    """Splits a batch into contiguous shards of equal sizes, one for every job.
+    Batches too small for every job to get a shard of the minimum size get fewer shards.
+
+    Args:
+        items (list): the batch
+        n_jobs (int): maximum number of shards
+        min_shard_size (int, optional): minimum number of items of a shard.
+                    Defaults to None, using MIN_TITLES_PER_SHARD.
+
+    Returns:
+        list[list]: the shards in order, the whole batch when it is not worth splitting
+    """
+    if min_shard_size is None:
+        min_shard_size = MIN_TITLES_PER_SHARD
+    n_shards = min(n_jobs, len(items) // min_shard_size)
+    if n_shards <= 1:
+        return [items]
+    shard_length = -(-len(items) // n_shards)
+    return [items[i:i + shard_length] for i in range(0, len(items), shard_length)]
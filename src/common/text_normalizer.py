@@ -0,0 +1,140 @@
+"""
+Provides a batched normalizer of StackOverflow titles.
+Titles are lowercased and cleaned in a single pass over the whole batch,
+and every distinct word is checked against the stop words and stemmed only once.
+The normalized words of a training corpus can be persisted as a table,
+while words outside of it are kept in a bounded cache.
+"""
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from common.sharding import split_into_shards
+
+REPLACE_BY_SPACE_RE = re.compile(r'[/(){}\[\]\|@,;]')
+BAD_SYMBOLS_RE = re.compile('[^0-9a-z #+_\n]')
+DEFAULT_CACHE_SIZE = 100000
+
+
+class TextNormalizer:
+    """Normalizer removing bad characters and stop words from titles, optionally stemming words.
+
+    Args:
+        stop_words (set[str], optional): words removed from the titles. Defaults to None.
+        stemmer (nltk.stem.StemmerI, optional): stemmer applied to the remaining words.
+                    Defaults to None, disabling stemming.
+        cache_size (int, optional): maximum number of memoized words outside of the table.
+                    Defaults to DEFAULT_CACHE_SIZE.
+    """
+
+    def __init__(self, stop_words : set = None, stemmer=None,
+                 cache_size : int = DEFAULT_CACHE_SIZE):
+        self.stop_words = frozenset(stop_words or ())
+        self.stemmer = stemmer
+        self.cache_size = cache_size
+        self.table = {}
+        self.word_cache = OrderedDict()
+        self._lock = Lock()
+
+    def __getstate__(self):
+        # Only the table is persisted, the cache belongs to the running process
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['word_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _normalize_new_word(self, word : str) -> str:
+        """Normalizes a word without memoizing it."""
+        if word in self.stop_words:
+            return ''
+        if self.stemmer is not None:
+            return self.stemmer.stem(word)
+        return word
+
+    def normalize_word(self, word : str) -> str:
+        """Normalizes a single word, memoizing the result.
+
+        Args:
+            word (str): lowercased word without bad characters
+
+        Returns:
+            str: the stemmed word, or an empty string for stop words
+        """
+        normalized = self.table.get(word)
+        if normalized is not None:
+            return normalized
+        with self._lock:
+            normalized = self.word_cache.get(word)
+            if normalized is not None:
+                self.word_cache.move_to_end(word)
+                return normalized
+        normalized = self._normalize_new_word(word)
+        with self._lock:
+            self.word_cache[word] = normalized
+            while len(self.word_cache) > self.cache_size:
+                self.word_cache.popitem(last=False)
+        return normalized
+
+    def build_table(self, titles) -> int:
+        """Adds the normalized form of every word of a corpus to the table.
+
+        Args:
+            titles (Iterable[str]): titles of StackOverflow questions
+
+        Returns:
+            int: the number of words in the table
+        """
+        for word in set(self._clean(list(titles)).split()).difference(self.table):
+            self.table[word] = self._normalize_new_word(word)
+        return len(self.table)
+
+    def normalize(self, titles, n_jobs : int = 1) -> list:
+        """Normalizes a batch of titles.
+
+        Args:
+            titles (Iterable[str]): titles of StackOverflow questions
+            n_jobs (int, optional): number of processes sharing large batches. Defaults to 1.
+
+        Returns:
+            list[str]: the normalized titles
+        """
+        titles = list(titles)
+        shards = split_into_shards(titles, n_jobs)
+        if len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                results = executor.map(self._normalize_batch, shards)
+                return [title for result in results for title in result]
+        return self._normalize_batch(titles)
+
+    @staticmethod
+    def _clean(titles : list) -> str:
+        """Lowercases titles and removes bad characters, returning them as one string.
+        Newlines are removed as bad symbols anyway, so they separate the titles
+        and the whole batch is cleaned with one pass of each operation.
+        """
+        text = '\n'.join(title.replace('\n', '') for title in titles)
+        text = REPLACE_BY_SPACE_RE.sub(' ', text.lower())
+        return BAD_SYMBOLS_RE.sub('', text)
+
+    def _normalize_batch(self, titles : list) -> list:
+        """Normalizes a batch of titles in the current process, see `normalize`."""
+        if not titles:
+            return []
+        text = self._clean(titles)
+
+        # Every distinct word is normalized once, the titles are then mapped with plain lookups
+        table = self.table
+        distinct = set(text.split())
+        unseen = distinct.difference(table)
+        if unseen:
+            words = {word: table[word] for word in distinct.difference(unseen)}
+            words.update((word, self.normalize_word(word)) for word in unseen)
+            lookup = words.__getitem__
+        else:
+            lookup = table.__getitem__
+        return [' '.join(filter(None, map(lookup, title.split()))) for title in text.split('\n')]
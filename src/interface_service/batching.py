@@ -0,0 +1,128 @@
+"""
+Provides a dynamic micro-batcher for model predictions.
+Concurrent prediction requests are collected for a short window
+and run through the model as a single batch on a background thread.
+"""
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread
+from typing import Any, Callable, List
+
+from common.logger import Logger
+
+
+class PredictionBatcher:
+    """Collects single predictions into batches processed by a background worker.
+
+    A batch is run as soon as either `max_batch_size` titles are waiting,
+    or `max_wait_ms` milliseconds passed since the first title of the batch arrived.
+
+    Args:
+        predict_fn (Callable[[List[str]], List[Any]]): function predicting
+                    the tags for a list of titles, e.g. `model.transform`
+        max_batch_size (int, optional): maximum number of titles in one batch. Defaults to 64.
+        max_wait_ms (float, optional): maximum time the first title of a batch
+                    waits for other titles. Defaults to 3.
+    """
+    _STOP = object()
+
+    def __init__(self, predict_fn : Callable[[List[str]], List[Any]],
+                 max_batch_size : int = 64, max_wait_ms : float = 3):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000
+        self._queue = queue.Queue()
+        self._worker = Thread(target=self._run, name='prediction-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, title : str) -> Future:
+        """Schedules a title for prediction.
+
+        Args:
+            title (str): title of the StackOverflow question
+
+        Returns:
+            Future: future resolved with the predicted tags of the title
+        """
+        future = Future()
+        self._queue.put((title, future))
+        return future
+
+    def predict(self, title : str, timeout : float = None):
+        """Predicts the tags of a title, blocking until its batch has been processed.
+
+        Args:
+            title (str): title of the StackOverflow question
+            timeout (float, optional): maximum number of seconds to wait. Defaults to None.
+
+        Returns:
+            The predicted tags of the title.
+        """
+        return self.submit(title).result(timeout=timeout)
+
+    def close(self):
+        """Stops the background worker after the already queued titles are processed.
+        """
+        self._queue.put(self._STOP)
+        self._worker.join()
+
+    def _collect_batch(self, first_item) -> list:
+        """Collects a batch starting with the given item.
+
+        Args:
+            first_item (tuple[str, Future]): the first item of the batch
+
+        Returns:
+            list: the items of the batch, possibly followed by the stop marker
+        """
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is self._STOP:
+                break
+        return batch
+
+    def _run(self):
+        """Main loop of the background worker.
+        """
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            batch = self._collect_batch(item)
+            stop = batch[-1] is self._STOP
+            if stop:
+                batch.pop()
+            # Skip the titles whose requests were cancelled while waiting
+            batch = [(title, future) for title, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if batch:
+                self._process_batch(batch)
+            if stop:
+                return
+
+    def _process_batch(self, batch : list):
+        """Runs a batch through the model and fans the results out to the waiting futures.
+
+        Args:
+            batch (list[tuple[str, Future]]): titles and their futures
+        """
+        try:
+            results = self.predict_fn([title for title, _ in batch])
+        except Exception as error: # pylint: disable=broad-except
+            Logger.fail(f'Batch prediction failed ❌\n{error}')
+            for _, future in batch:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,92 @@
+"""
+Provides an in-process prediction cache with LRU eviction and expiry.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+from prometheus_client import Counter
+
+CACHE_HITS = Counter('stackoverflow_tagger_prediction_cache_hits', 'Prediction cache hits')
+CACHE_MISSES = Counter('stackoverflow_tagger_prediction_cache_misses', 'Prediction cache misses')
+
+MISSING = object()
+
+
+def normalize_title(title : str) -> str:
+    """Normalizes a title into the form used as a cache key.
+
+    The served model lowercases the title and splits it on whitespace
+    before computing any features, so titles which only differ in
+    letter case or whitespace always get the same predictions.
+
+    Args:
+        title (str): title of the StackOverflow question
+
+    Returns:
+        str: the normalized title
+    """
+    return " ".join(title.lower().split())
+
+
+class PredictionCache:
+    """Thread-safe cache of predictions bounded by size, with time based expiry.
+
+    Args:
+        max_size (int, optional): maximum number of cached predictions.
+                    A size of 0 disables the cache. Defaults to 10000.
+        ttl_seconds (float, optional): number of seconds after which
+                    a cached prediction expires. Defaults to 3600.
+    """
+
+    def __init__(self, max_size : int = 10000, ttl_seconds : float = 3600):
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = float(ttl_seconds)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key : Hashable) -> Any:
+        """Gets a prediction from the cache.
+
+        Args:
+            key (Hashable): key of the prediction
+
+        Returns:
+            Any: the cached prediction, or `MISSING` if not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is not MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    CACHE_HITS.inc()
+                    return value
+                del self._entries[key]
+        CACHE_MISSES.inc()
+        return MISSING
+
+    def put(self, key : Hashable, value : Any):
+        """Stores a prediction, evicting the least recently used ones if the cache is full.
+
+        Args:
+            key (Hashable): key of the prediction
+            value (Any): the prediction
+        """
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Removes all predictions from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
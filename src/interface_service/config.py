@@ -21,6 +21,27 @@ class VarNames(Enum):
     PUBSUB_DATA_TOPIC_ID = "PUBSUB_DATA_TOPIC_ID"
     PUBSUB_MODEL_TOPIC_ID = "PUBSUB_MODEL_TOPIC_ID"
     PUBSUB_SUBSCRIPTION_ID = "PUBSUB_SUBSCRIPTION_ID"
+    PREDICTION_BATCH_MAX_TITLES = "PREDICTION_BATCH_MAX_TITLES"
+    PREDICTION_BATCH_MAX_SIZE = "PREDICTION_BATCH_MAX_SIZE"
+    PREDICTION_BATCH_MAX_WAIT_MS = "PREDICTION_BATCH_MAX_WAIT_MS"
+    PREDICTION_CACHE_MAX_SIZE = "PREDICTION_CACHE_MAX_SIZE"
+    PREDICTION_CACHE_TTL_SECONDS = "PREDICTION_CACHE_TTL_SECONDS"
+    MODEL_BUNDLE_POINTER_KEY = "MODEL_BUNDLE_POINTER_KEY"
+    ARTIFACT_CACHE_DIR = "ARTIFACT_CACHE_DIR"
+    ARTIFACT_CACHE_MAX_BYTES = "ARTIFACT_CACHE_MAX_BYTES"
+    CORRECTION_BATCH_MAX_ITEMS = "CORRECTION_BATCH_MAX_ITEMS"
+    CORRECTION_PUBLISH_MAX_MESSAGES = "CORRECTION_PUBLISH_MAX_MESSAGES"
+    CORRECTION_PUBLISH_MAX_BYTES = "CORRECTION_PUBLISH_MAX_BYTES"
+    CORRECTION_PUBLISH_MAX_LATENCY_SECONDS = "CORRECTION_PUBLISH_MAX_LATENCY_SECONDS"
+    CORRECTION_PUBLISH_FLOW_CONTROL_MAX_MESSAGES = "CORRECTION_PUBLISH_FLOW_CONTROL_MAX_MESSAGES"
+    CORRECTION_PUBLISH_FLOW_CONTROL_MAX_BYTES = "CORRECTION_PUBLISH_FLOW_CONTROL_MAX_BYTES"
+    CORRECTION_MESSAGE_MAX_RECORDS = "CORRECTION_MESSAGE_MAX_RECORDS"
+    PUBSUB_FLOW_CONTROL_MAX_MESSAGES = "PUBSUB_FLOW_CONTROL_MAX_MESSAGES"
+    PUBSUB_FLOW_CONTROL_MAX_BYTES = "PUBSUB_FLOW_CONTROL_MAX_BYTES"
+    PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS = "PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS"
+    PUBSUB_CALLBACK_WORKERS = "PUBSUB_CALLBACK_WORKERS"
+    PUBSUB_BATCH_MAX_MESSAGES = "PUBSUB_BATCH_MAX_MESSAGES"
+    PUBSUB_BATCH_MAX_LATENCY_SECONDS = "PUBSUB_BATCH_MAX_LATENCY_SECONDS"
 
 
 settings = Dynaconf(
@@ -51,6 +72,30 @@ settings.validators.register(
     Validator(VarNames.PUBSUB_DATA_TOPIC_ID.value, must_exist=True),
     Validator(VarNames.PUBSUB_MODEL_TOPIC_ID.value, must_exist=True),
     Validator(VarNames.PUBSUB_SUBSCRIPTION_ID.value, must_exist=True),
+
+    Validator(VarNames.PREDICTION_BATCH_MAX_TITLES.value, default=10000),
+    Validator(VarNames.PREDICTION_BATCH_MAX_SIZE.value, default=64),
+    Validator(VarNames.PREDICTION_BATCH_MAX_WAIT_MS.value, default=3),
+    Validator(VarNames.PREDICTION_CACHE_MAX_SIZE.value, default=10000),
+    Validator(VarNames.PREDICTION_CACHE_TTL_SECONDS.value, default=3600),
+
+    Validator(VarNames.MODEL_BUNDLE_POINTER_KEY.value, default="bundles/latest.json"),
+    Validator(VarNames.ARTIFACT_CACHE_DIR.value, default="./interface_service/artifact_cache"),
+    Validator(VarNames.ARTIFACT_CACHE_MAX_BYTES.value, default=2 * 1024 ** 3),
+
+    Validator(VarNames.CORRECTION_BATCH_MAX_ITEMS.value, default=1000),
+    Validator(VarNames.CORRECTION_PUBLISH_MAX_MESSAGES.value, default=100),
+    Validator(VarNames.CORRECTION_PUBLISH_MAX_BYTES.value, default=1024 ** 2),
+    Validator(VarNames.CORRECTION_PUBLISH_MAX_LATENCY_SECONDS.value, default=0.05),
+    Validator(VarNames.CORRECTION_PUBLISH_FLOW_CONTROL_MAX_MESSAGES.value, default=10000),
+    Validator(VarNames.CORRECTION_PUBLISH_FLOW_CONTROL_MAX_BYTES.value, default=16 * 1024 ** 2),
+    Validator(VarNames.CORRECTION_MESSAGE_MAX_RECORDS.value, default=500),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_MESSAGES.value, default=10),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_BYTES.value, default=10 * 1024 ** 2),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS.value, default=3600),
+    Validator(VarNames.PUBSUB_CALLBACK_WORKERS.value, default=1),
+    Validator(VarNames.PUBSUB_BATCH_MAX_MESSAGES.value, default=0),
+    Validator(VarNames.PUBSUB_BATCH_MAX_LATENCY_SECONDS.value, default=0.05),
 )
 
 settings.validators.validate()
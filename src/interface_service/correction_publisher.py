@@ -0,0 +1,87 @@
+"""
+Provides non-blocking publishing of tag corrections.
+Corrections are encoded into compact binary messages carrying many corrections,
+which are handed to a batching Pub/Sub publisher. The futures of the
+published messages are tracked by callbacks, off the request path.
+"""
+from functools import partial
+from threading import Condition
+from typing import List
+
+from prometheus_client import Counter
+
+from common.logger import Logger
+from common.pubsub import encode_corrections
+
+CORRECTIONS_PUBLISHED = Counter('stackoverflow_tagger_corrections_published',
+                                'Corrections published to the learning service')
+CORRECTIONS_FAILED = Counter('stackoverflow_tagger_corrections_publish_failures',
+                             'Corrections which failed to be published')
+
+
+class CorrectionPublisher:
+    """Publishes corrections without waiting for their messages to be sent.
+
+    Args:
+        publish_client (PublisherClient): publisher, batching the messages
+        topic_path (str): topic of the corrections
+        max_corrections_per_message (int, optional): maximum number of corrections
+                    encoded into one message. Defaults to 500.
+    """
+
+    def __init__(self, publish_client, topic_path : str, max_corrections_per_message : int = 500):
+        self.publish_client = publish_client
+        self.topic_path = topic_path
+        self.max_corrections_per_message = max_corrections_per_message
+        self._condition = Condition()
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of corrections which are published but not sent yet."""
+        return self._pending
+
+    def publish(self, corrections : List[dict]) -> int:
+        """Publishes corrections, returning before their messages are sent.
+
+        Args:
+            corrections (List[dict]): corrections with a `title`,
+                    and the `predicted` and `actual` sets of tags
+
+        Returns:
+            int: number of published corrections
+        """
+        for start in range(0, len(corrections), self.max_corrections_per_message):
+            message_corrections = corrections[start:start + self.max_corrections_per_message]
+            future = self.publish_client.publish(
+                self.topic_path,
+                encode_corrections(message_corrections)
+            )
+            with self._condition:
+                self._pending += len(message_corrections)
+            future.add_done_callback(partial(self._on_sent, len(message_corrections)))
+        return len(corrections)
+
+    def _on_sent(self, n_corrections : int, future):
+        """Records the outcome of a sent message."""
+        error = future.exception()
+        with self._condition:
+            self._pending -= n_corrections
+            self._condition.notify_all()
+        if error is None:
+            CORRECTIONS_PUBLISHED.inc(n_corrections)
+        else:
+            CORRECTIONS_FAILED.inc(n_corrections)
+            Logger.fail(f'Failed to publish {n_corrections} corrections ❌\n{error}')
+
+    def flush(self, timeout : float = None) -> bool:
+        """Waits until the published corrections are sent.
+
+        Args:
+            timeout (float, optional): maximum number of seconds to wait. Defaults to None.
+
+        Returns:
+            bool: whether all corrections were sent
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
@@ -48,6 +48,15 @@ class InferenceTest(HttpUser):
             }
         )
 
+    @task
+    def predict_batch(self):
+        """Batch predict request."""
+        self.client.post(
+            "api/predict/batch", json={
+                "titles": random.sample(predict_data, 10)
+            }
+        )
+
     def correct(self):
         """Correct request."""
         df_correct = correction_data.sample()
@@ -1,15 +1,24 @@
 """Main file for the FastAPI application."""
+import asyncio
 from threading import Thread
-from typing import Set
+from typing import Dict, List, Optional, Set
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, conint, conlist, validator
+from google.cloud.pubsub_v1 import types
 from google.cloud.pubsub_v1.subscriber.message import Message
 import prometheus_client
 
 from interface_service.config import settings, VarNames
 
+from common.artifact_cache import ArtifactCache
+from common.bucket import get_object_store
 from common.pubsub import subscribe_to_topic, publish_to_topic
-from common.bucket import download_model, load_model
+from common.logger import Logger
+from interface_service.batching import PredictionBatcher
+from interface_service.cache import PredictionCache, normalize_title, MISSING
+from interface_service.correction_publisher import CorrectionPublisher
+from interface_service.model_swap import ModelSwapper
 
 def get_callback(app_object : FastAPI):
     """Creates a callback that updates the model from object storage.
@@ -18,25 +27,28 @@ def get_callback(app_object : FastAPI):
         app_object (FastAPI): The app which the model should be part of.
     """
     def receive_model_update_callback(message : Message):
-        print('downloading new model')
         message.ack()
-        bucket_auth = (
-            settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_TLS.value]
-        )
-        download_model(
-            settings[VarNames.MODEL_LOCAL_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.MODEL_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        app_object.model = load_model(settings[VarNames.MODEL_LOCAL_PATH.value])
+        Logger.info('New model available, scheduling update')
+        app_object.model_swapper.request_update()
 
     return receive_model_update_callback
 
 
+def get_batch_callback(app_object : FastAPI):
+    """Creates a callback that updates the model once for a list of model update messages.
+
+    Args:
+        app_object (FastAPI): The app which the model should be part of.
+    """
+    def receive_model_updates_callback(messages : List[Message]):
+        for message in messages:
+            message.ack()
+        Logger.info(f'{len(messages)} new models available, scheduling update')
+        app_object.model_swapper.request_update()
+
+    return receive_model_updates_callback
+
+
 def get_result(streaming_pull_future):
     """Wrapper function for getting results from Pub/Sub.
 
@@ -55,6 +67,37 @@ class InferenceApp(FastAPI):
         """Constructor for the Inference FastAPI application.
         """
         super().__init__(*args, **kwargs)
+        self.prediction_cache = PredictionCache(
+            max_size=settings[VarNames.PREDICTION_CACHE_MAX_SIZE.value],
+            ttl_seconds=settings[VarNames.PREDICTION_CACHE_TTL_SECONDS.value]
+        )
+        self._served_model = (None, None)
+        # Model versions which are already on disk are not downloaded again
+        get_object_store(
+            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
+            settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
+            settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
+            settings[VarNames.OBJECT_STORAGE_TLS.value]
+        ).cache = ArtifactCache(
+            settings[VarNames.ARTIFACT_CACHE_DIR.value],
+            settings[VarNames.ARTIFACT_CACHE_MAX_BYTES.value]
+        )
+        self.model_swapper = ModelSwapper(
+            self,
+            settings[VarNames.MODEL_LOCAL_PATH.value],
+            settings[VarNames.BUCKET_NAME.value],
+            settings[VarNames.MODEL_OBJECT_KEY.value],
+            settings[VarNames.MODEL_BUNDLE_POINTER_KEY.value],
+            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
+            settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
+            settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
+            settings[VarNames.OBJECT_STORAGE_TLS.value]
+        )
+        self.batcher = PredictionBatcher(
+            self.predict_uncached_batch,
+            max_batch_size=settings[VarNames.PREDICTION_BATCH_MAX_SIZE.value],
+            max_wait_ms=settings[VarNames.PREDICTION_BATCH_MAX_WAIT_MS.value]
+        )
         pubsub_host = settings[VarNames.PUBSUB_EMULATOR_HOST.value]
         pubsub_project_id = settings[VarNames.PUBSUB_PROJECT_ID.value]
         pubsub_subscription_id = settings[VarNames.PUBSUB_SUBSCRIPTION_ID.value]
@@ -62,7 +105,11 @@ class InferenceApp(FastAPI):
         pubsub_publish_topic_id = settings[VarNames.PUBSUB_DATA_TOPIC_ID.value]
         pubsub_subscription_topic_id = settings[VarNames.PUBSUB_MODEL_TOPIC_ID.value]
 
-        pubsub_handle_model_callback = get_callback(self)
+        batch_max_messages = settings[VarNames.PUBSUB_BATCH_MAX_MESSAGES.value]
+        if batch_max_messages:
+            pubsub_handle_model_callback = get_batch_callback(self)
+        else:
+            pubsub_handle_model_callback = get_callback(self)
 
         subscriber, streaming_pull_future = subscribe_to_topic(
             pubsub_host,
@@ -70,39 +117,166 @@ class InferenceApp(FastAPI):
             pubsub_subscription_id,
             pubsub_subscription_topic_id,
             pubsub_handle_model_callback,
-            unique_subscription_name=True
+            unique_subscription_name=True,
+            flow_control=types.FlowControl(
+                max_messages=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_MESSAGES.value],
+                max_bytes=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_BYTES.value],
+                max_lease_duration=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS.value]
+            ),
+            callback_workers=settings[VarNames.PUBSUB_CALLBACK_WORKERS.value],
+            batch_max_messages=batch_max_messages,
+            batch_max_latency=settings[VarNames.PUBSUB_BATCH_MAX_LATENCY_SECONDS.value]
         )
         self.publish_topic = subscriber.topic_path(
             pubsub_project_id,
             pubsub_publish_topic_id
         )
-        self.publish_client = publish_to_topic(self.publish_topic)
+        # Corrections are sent in batches, publishing blocks while too many are waiting
+        self.publish_client = publish_to_topic(
+            self.publish_topic,
+            batch_settings=types.BatchSettings(
+                max_messages=settings[VarNames.CORRECTION_PUBLISH_MAX_MESSAGES.value],
+                max_bytes=settings[VarNames.CORRECTION_PUBLISH_MAX_BYTES.value],
+                max_latency=settings[VarNames.CORRECTION_PUBLISH_MAX_LATENCY_SECONDS.value]
+            ),
+            flow_control=types.PublishFlowControl(
+                message_limit=settings[VarNames.CORRECTION_PUBLISH_FLOW_CONTROL_MAX_MESSAGES.value],
+                byte_limit=settings[VarNames.CORRECTION_PUBLISH_FLOW_CONTROL_MAX_BYTES.value],
+                limit_exceeded_behavior=types.LimitExceededBehavior.BLOCK
+            )
+        )
+        self.correction_publisher = CorrectionPublisher(
+            self.publish_client,
+            self.publish_topic,
+            max_corrections_per_message=settings[VarNames.CORRECTION_MESSAGE_MAX_RECORDS.value]
+        )
         self.subscribe_client = subscriber
         self.streaming_pull_future = streaming_pull_future
         self.title = "Inference Service API"
         self.description = "Inference Service API for accessing models 🚀"
-        bucket_auth = (
-            settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_TLS.value]
-        )
-        success = download_model(
-            settings[VarNames.MODEL_LOCAL_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.MODEL_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        if success :
-            self.model = load_model(settings[VarNames.MODEL_LOCAL_PATH.value])
+        self.model_swapper.update()
         prometheus_client.start_http_server(9000)
 
         # Create a new thread for the blockinb Pub/Sub call and start it
         pubsub_thread = Thread(target=get_result, args=(streaming_pull_future,), daemon=True)
         pubsub_thread.start()
 
+    @property
+    def model(self):
+        """The model currently used for predictions."""
+        return self._served_model[0]
+
+    @property
+    def model_version(self):
+        """The version of the model currently used for predictions."""
+        return self._served_model[1]
+
+    def set_model(self, model, version : str):
+        """Swaps the served model and invalidates the cached predictions of the previous one.
+        Cached predictions are keyed on the model version, so they stop being
+        served as soon as the new model and its version are swapped in.
+
+        Args:
+            model: The model to serve
+            version (str): The version of the model
+        """
+        self._served_model = (model, version)
+        self.prediction_cache.clear()
+
+    def cached_prediction(self, title : str):
+        """Gets the prediction for a title from the cache.
+
+        Args:
+            title (str): title of the StackOverflow question
+
+        Returns:
+            The cached tags, or `MISSING` if not cached.
+        """
+        version = self._served_model[1]
+        return self.prediction_cache.get((version, normalize_title(title)))
+
+    def predict_batch(self, titles : List[str]):
+        """Predicts the tags for a list of titles in a single model call.
+        Cached predictions are reused, only the remaining titles reach the model.
+
+        Args:
+            titles (List[str]): titles of the StackOverflow questions
+
+        Returns:
+            list: predicted tags for every title
+        """
+        version = self._served_model[1]
+        results = [
+            self.prediction_cache.get((version, normalize_title(title)))
+            for title in titles
+        ]
+        missing = [i for i, result in enumerate(results) if result is MISSING]
+        if missing:
+            predictions = self.predict_uncached_batch([titles[i] for i in missing])
+            for i, tags in zip(missing, predictions):
+                results[i] = tags
+        return results
+
+    def predict_uncached_batch(self, titles : List[str]):
+        """Runs a list of titles through the model and caches the predictions.
+
+        Args:
+            titles (List[str]): titles of the StackOverflow questions
+
+        Returns:
+            list: predicted tags for every title
+        """
+        model, version = self._served_model
+        predictions = model.transform(titles)
+        for title, tags in zip(titles, predictions):
+            self.prediction_cache.put((version, normalize_title(title)), tags)
+        return predictions
+
+    def score_batch(self, titles : List[str], top_k : int = None,
+                    threshold : float = None, tag_thresholds : Dict[str, float] = None):
+        """Predicts the highest scoring tags for a list of titles, with their scores.
+
+        Args:
+            titles (List[str]): titles of the StackOverflow questions
+            top_k (int, optional): maximum number of tags for every title. Defaults to None.
+            threshold (float, optional): minimum score of a tag. Defaults to None.
+            tag_thresholds (Dict[str, float], optional): minimum scores of individual tags,
+                    overriding the global threshold. Defaults to None.
+
+        Returns:
+            list: the tags and scores of every title, by decreasing score
+        """
+        model = self.model
+        if tag_thresholds:
+            threshold = model.tag_thresholds(
+                tag_thresholds,
+                float('-inf') if threshold is None else threshold
+            )
+        return model.top_k(titles, top_k, threshold)
+
 app = InferenceApp()
 
+
+def check_model_available(scoring : bool = False):
+    """Checks that a model able to answer the request is served.
+
+    Args:
+        scoring (bool, optional): whether the request needs tag scores. Defaults to False.
+    """
+    if app.model is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Model not available",
+            headers={"X-Error": "Model not available"},
+        )
+    if scoring and not hasattr(app.model, 'top_k'):
+        raise HTTPException(
+            status_code=400,
+            detail="Model does not support scoring",
+            headers={"X-Error": "Model does not support scoring"},
+        )
+
+
 @app.get('/api/ping')
 def ping():
     """
@@ -117,7 +291,29 @@ async def model_present():
     """
     return app.model is not None
 
-class PredictionRequest(BaseModel):
+@app.get('/api/model_version')
+async def model_version():
+    """
+    Used to check which version of the model is currently served.
+    """
+    return {"version": app.model_version}
+
+class ScoringOptions(BaseModel):
+    """
+    Defines the options of the scoring mode, returning the highest scoring
+    tags with their scores instead of the predicted tag set.
+    """
+    top_k: Optional[conint(ge=1)] = None
+    threshold: Optional[float] = None
+    tag_thresholds: Optional[Dict[str, float]] = None
+
+    def scoring(self) -> bool:
+        """Whether the scoring mode is requested."""
+        return self.top_k is not None or self.threshold is not None \
+            or self.tag_thresholds is not None
+
+
+class PredictionRequest(ScoringOptions):
     """
     Defines the model of a prediction request.
     """
@@ -130,25 +326,99 @@ class PredictionResult(BaseModel):
     """
     title: str
     tags: Set[str]
+    scores: Optional[Dict[str, float]] = None
+
+    @staticmethod
+    def from_scores(title : str, scores : list):
+        """Creates a result of the scoring mode.
+
+        Args:
+            title (str): title of the StackOverflow question
+            scores (list[tuple[str, float]]): the selected tags and their scores
+        """
+        return PredictionResult(
+            title=title,
+            tags={tag for tag, _ in scores},
+            scores=dict(scores),
+        )
 
 
 @app.post('/api/predict')
-def predict_tags(request: PredictionRequest):
+async def predict_tags(request: PredictionRequest):
     """
     Create a prediction of tags for the given StackOverflow title.
+    Concurrent requests are batched together before reaching the model.
 
     - **title**: title of the StackOverflow question
+    - **top_k**: optional, return at most this many highest scoring tags with their scores
+    - **threshold**: optional, return only tags scoring at least the threshold
+    - **tag_thresholds**: optional, thresholds of individual tags
     """
-    if app.model is None:
-        raise HTTPException(
-            status_code=500,
-            detail="Model not available",
-            headers={"X-Error": "Model not available"},
+    check_model_available(scoring=request.scoring())
+    if request.scoring():
+        scores = await run_in_threadpool(
+            app.score_batch,
+            [request.title],
+            request.top_k,
+            request.threshold,
+            request.tag_thresholds
         )
-    result = app.model.transform([request.title])
+        return PredictionResult.from_scores(request.title, scores[0])
+    tags = app.cached_prediction(request.title)
+    if tags is MISSING:
+        tags = await asyncio.wrap_future(app.batcher.submit(request.title))
     return PredictionResult(
         title=request.title,
-        tags=result[0],
+        tags=tags,
+    )
+
+
+class BatchPredictionRequest(ScoringOptions):
+    """
+    Defines the model of a batch prediction request.
+    """
+    titles: conlist(str, min_items=1, max_items=settings[VarNames.PREDICTION_BATCH_MAX_TITLES.value])
+
+
+class BatchPredictionResult(BaseModel):
+    """
+    Defines the model of a batch prediction result.
+    """
+    results: List[PredictionResult]
+
+
+@app.post('/api/predict/batch')
+def predict_tags_batch(request: BatchPredictionRequest):
+    """
+    Create predictions of tags for many StackOverflow titles at once.
+    All titles are vectorized into a single sparse matrix and run
+    through the model in one call.
+
+    - **titles**: titles of the StackOverflow questions
+    - **top_k**: optional, return at most this many highest scoring tags with their scores
+    - **threshold**: optional, return only tags scoring at least the threshold
+    - **tag_thresholds**: optional, thresholds of individual tags
+    """
+    check_model_available(scoring=request.scoring())
+    if request.scoring():
+        scores = app.score_batch(
+            request.titles,
+            request.top_k,
+            request.threshold,
+            request.tag_thresholds
+        )
+        return BatchPredictionResult(
+            results=[
+                PredictionResult.from_scores(title, title_scores)
+                for title, title_scores in zip(request.titles, scores)
+            ]
+        )
+    result = app.predict_batch(request.titles)
+    return BatchPredictionResult(
+        results=[
+            PredictionResult(title=title, tags=tags)
+            for title, tags in zip(request.titles, result)
+        ]
     )
 
 
@@ -162,6 +432,13 @@ class CorrectionRequest(BaseModel):
     predicted: Set[str]
     actual: Set[str]
 
+    @validator('title', 'predicted', 'actual', each_item=True)
+    def check_no_nul(cls, value : str): # pylint: disable=no-self-argument
+        """Rejects NUL characters, which separate the fields of correction messages."""
+        if '\0' in value:
+            raise ValueError('must not contain NUL characters')
+        return value
+
 
 @app.post('/api/correct', summary="Correct the tags to the model", )
 def correct_prediction(request: CorrectionRequest):
@@ -172,12 +449,27 @@ def correct_prediction(request: CorrectionRequest):
     - **predicted**: prediction of tags for the title
     - **actual**: actual tags for the title
     """
-    data_to_publish = request.dict()
-    data_to_publish["predicted"] = str(data_to_publish["predicted"])
-    data_to_publish["actual"] = str(data_to_publish["actual"])
-    app.publish_client.publish(
-        app.publish_topic,
-        b'New correction data',
-        **data_to_publish
-    )
+    app.correction_publisher.publish([request.dict()])
     return request
+
+
+class BatchCorrectionRequest(BaseModel):
+    """
+    Defines the model of a batch correction request.
+    """
+    corrections: conlist(CorrectionRequest, min_items=1,
+                         max_items=settings[VarNames.CORRECTION_BATCH_MAX_ITEMS.value])
+
+
+@app.post('/api/correct/batch', summary="Correct the tags of many titles to the model")
+def correct_predictions_batch(request: BatchCorrectionRequest):
+    """
+    Correct predictions of tags of many StackOverflow titles at once.
+    The corrections are published in batches, without waiting for them to be sent.
+
+    - **corrections**: corrections with a title, the predicted and the actual tags
+    """
+    published = app.correction_publisher.publish(
+        [correction.dict() for correction in request.corrections]
+    )
+    return {"published": published}
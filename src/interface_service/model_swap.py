@@ -0,0 +1,185 @@
+"""
+Provides zero-downtime swapping of the served model.
+New models are downloaded from the latest model bundle to versioned local files,
+loaded and warmed up on a background worker, and only then swapped in atomically.
+"""
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from common.bucket import get_object_store, load_model
+from common.logger import Logger
+from common.model_bundle import fetch_bundle, read_manifest
+
+WARMUP_TITLES = [
+    "How to free c++ memory vector<int> * arr?",
+    "SQL Server - any equivalent of Excel's CHOOSE function?",
+    "Access a base classes variable from within a child class",
+]
+# Seconds during which an unused version file is kept, since another process
+# sharing the directory may have just reused it and be about to load it.
+STALE_VERSION_GRACE_PERIOD = 600
+
+
+class ModelSwapper:
+    """Keeps the model of an application up to date with the object storage.
+
+    The served model is only replaced by a model which has been fully downloaded,
+    loaded and successfully used for predictions. The previous model is kept
+    in memory, so that it can be restored instantly.
+
+    Args:
+        app (InferenceApp): The application serving the model
+        model_local_path (str): The local path of the model, versions are stored next to it
+        bucket_name (str): The name of the bucket of the model
+        model_name (str): The name of the model artifact in the bundle
+        pointer_key (str): The name of the object pointing to the latest bundle
+        object_storage_endpoint (str) : The endpoint used for auth
+        access_key (str) : The auth access key
+        secret_key (str) : The auth secret key
+        secure (str) : Whether to use TLS during auth
+        grace_period (float, optional): The seconds during which unused version files
+                    are kept after their last use. Defaults to STALE_VERSION_GRACE_PERIOD.
+    """
+
+    def __init__(self, app, model_local_path : str, bucket_name : str, model_name : str,
+                 pointer_key : str, object_storage_endpoint : str, access_key : str,
+                 secret_key : str, secure : bool,
+                 grace_period : float = STALE_VERSION_GRACE_PERIOD):
+        self.app = app
+        self.model_local_path = model_local_path
+        self.bucket_name = bucket_name
+        self.model_name = model_name
+        self.pointer_key = pointer_key
+        self.grace_period = grace_period
+        self.object_store = get_object_store(object_storage_endpoint, access_key,
+                                             secret_key, secure)
+        self.version = None
+        self.previous = None
+        self._lock = Lock()
+        self._update_lock = Lock()
+        self._pending = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-swap')
+
+    def version_path(self, version : str) -> str:
+        """Gets the local path of a model version.
+
+        Args:
+            version (str): The version of the model
+
+        Returns:
+            str: The local path of the model version
+        """
+        root, extension = os.path.splitext(self.model_local_path)
+        safe_version = re.sub(r'[^0-9A-Za-z_-]', '', version)
+        return f'{root}-{safe_version}{extension}'
+
+    def request_update(self):
+        """Schedules an update of the model on the background worker.
+        Requests arriving while an update is still pending are coalesced.
+        """
+        with self._lock:
+            if self._pending:
+                Logger.info('Model update already pending, skipping ⚠️')
+                return
+            self._pending = True
+        self._executor.submit(self._run_update)
+
+    def _run_update(self):
+        """Runs a requested update on the background worker.
+        """
+        with self._lock:
+            self._pending = False
+        try:
+            self.update()
+        except Exception as error: # pylint: disable=broad-except
+            Logger.fail(f'Model update failed ❌\n{error}')
+
+    def update(self) -> bool:
+        """Downloads, loads and warms up the latest model, then swaps it in.
+
+        Returns:
+            bool: Whether a new model has been swapped in.
+        """
+        with self._update_lock:
+            return self._update()
+
+    def _update(self) -> bool:
+        """Performs the update, see `update`.
+        """
+        manifest = read_manifest(self.object_store, self.bucket_name, self.pointer_key,
+                                 legacy_names=[self.model_name])
+        if manifest is None:
+            return False
+        version = manifest["version"]
+        if version == self.version:
+            Logger.info(f'Model version {version} is already served, skipping ⚠️')
+            return False
+
+        model_path = self.version_path(version)
+        try:
+            # Marks a file shared with other processes as used, so that they keep it.
+            os.utime(model_path)
+        except FileNotFoundError:
+            download_path = f'{model_path}.{os.getpid()}.download'
+            if not fetch_bundle(self.object_store, self.bucket_name, manifest,
+                                {self.model_name: download_path}):
+                return False
+            # Processes serving the same version share one file, the first
+            # completed download wins and the others reuse it.
+            try:
+                os.link(download_path, model_path)
+            except FileExistsError:
+                pass
+            os.remove(download_path)
+
+        model = load_model(model_path)
+        if model is None:
+            return False
+        # Run a few predictions before serving the model, so that failures
+        # and lazy initialization do not hit the first requests.
+        model.transform(WARMUP_TITLES)
+
+        self.previous = (self.app.model, self.version)
+        self.app.set_model(model, version)
+        self.version = version
+        Logger.info(f'Serving model version {version} ✔️')
+        self._remove_stale_versions()
+        return True
+
+    def rollback(self) -> bool:
+        """Swaps the previously served model back in.
+
+        Returns:
+            bool: Whether a previous model was available.
+        """
+        with self._update_lock:
+            if self.previous is None or self.previous[0] is None:
+                Logger.fail('No previous model available for rollback ❌')
+                return False
+            model, version = self.previous
+            self.previous = (self.app.model, self.version)
+            self.app.set_model(model, version)
+            self.version = version
+            Logger.info(f'Rolled back to model version {version} ✔️')
+            return True
+
+    def _remove_stale_versions(self):
+        """Removes the local files of versions which are neither served nor kept for rollback,
+        and which were not used by any process during the grace period.
+        """
+        keep = {self.version_path(version)
+                for version in (self.version, self.previous[1]) if version is not None}
+        directory = os.path.dirname(self.model_local_path) or '.'
+        root, extension = os.path.splitext(os.path.basename(self.model_local_path))
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.startswith(f'{root}-') or not name.endswith(extension) or path in keep:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) >= self.grace_period:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,63 @@
+"""Tests for the prediction micro-batcher."""
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from interface_service.batching import PredictionBatcher
+
+
+class PredictionBatcherTest(unittest.TestCase):
+    """Testing batching of concurrent predictions"""
+
+    def setUp(self):
+        self.batches = []
+
+    def predict_fn(self, titles):
+        """Fake model that records the batches it receives."""
+        self.batches.append(list(titles))
+        return [title.upper() for title in titles]
+
+    def test_single_prediction(self):
+        """A lone title is predicted after the wait window."""
+        batcher = PredictionBatcher(self.predict_fn, max_batch_size=8, max_wait_ms=1)
+        self.assertEqual(batcher.predict("java", timeout=5), "JAVA")
+        batcher.close()
+        self.assertEqual(self.batches, [["java"]])
+
+    def test_concurrent_predictions_are_batched(self):
+        """Concurrent titles are combined into batches bounded by the max batch size."""
+        release = Event()
+
+        def blocking_predict_fn(titles):
+            release.wait(5)
+            return self.predict_fn(titles)
+
+        batcher = PredictionBatcher(blocking_predict_fn, max_batch_size=4, max_wait_ms=50)
+        titles = [f"title {i}" for i in range(10)]
+        futures = [batcher.submit(title) for title in titles]
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+        batcher.close()
+
+        self.assertEqual(results, [title.upper() for title in titles])
+        self.assertTrue(all(len(batch) <= 4 for batch in self.batches))
+        self.assertLess(len(self.batches), len(titles))
+
+    def test_results_are_fanned_out_to_callers(self):
+        """Every caller receives the result of its own title."""
+        batcher = PredictionBatcher(self.predict_fn, max_batch_size=16, max_wait_ms=5)
+        titles = [f"title {i}" for i in range(50)]
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(lambda title: batcher.predict(title, timeout=5), titles))
+        batcher.close()
+        self.assertEqual(results, [title.upper() for title in titles])
+
+    def test_errors_are_propagated(self):
+        """A failing model call fails every request of the batch."""
+        def failing_predict_fn(titles):
+            raise ValueError("Model not available")
+
+        batcher = PredictionBatcher(failing_predict_fn, max_batch_size=4, max_wait_ms=1)
+        with self.assertRaises(ValueError):
+            batcher.predict("java", timeout=5)
+        batcher.close()
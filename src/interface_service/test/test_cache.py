@@ -0,0 +1,51 @@
+"""Tests for the prediction cache."""
+import time
+import unittest
+
+from interface_service.cache import PredictionCache, normalize_title, MISSING
+
+
+class PredictionCacheTest(unittest.TestCase):
+    """Testing caching of predictions"""
+
+    def test_normalize_title(self):
+        """Titles differing only in case and whitespace share a key."""
+        self.assertEqual(
+            normalize_title("  How to free C++   memory?\t"),
+            normalize_title("how to free c++ memory?")
+        )
+        self.assertNotEqual(normalize_title("c++ memory"), normalize_title("c memory"))
+
+    def test_get_and_put(self):
+        """Stored predictions are returned, unknown keys are missing."""
+        cache = PredictionCache(max_size=10)
+        self.assertIs(cache.get((1, "java")), MISSING)
+        cache.put((1, "java"), ("java",))
+        self.assertEqual(cache.get((1, "java")), ("java",))
+        self.assertIs(cache.get((2, "java")), MISSING)
+
+    def test_least_recently_used_is_evicted(self):
+        """The cache never grows beyond its size, evicting the least recently used entry."""
+        cache = PredictionCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entries_are_missing(self):
+        """Predictions older than the time to live are not served."""
+        cache = PredictionCache(max_size=10, ttl_seconds=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        self.assertIs(cache.get("a"), MISSING)
+        self.assertEqual(len(cache), 0)
+
+    def test_disabled_cache(self):
+        """A cache of size 0 stores nothing."""
+        cache = PredictionCache(max_size=0)
+        cache.put("a", 1)
+        self.assertIs(cache.get("a"), MISSING)
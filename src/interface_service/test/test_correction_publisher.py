@@ -0,0 +1,79 @@
+"""Tests for the non-blocking publisher of corrections."""
+import unittest
+from concurrent.futures import Future
+
+from prometheus_client import REGISTRY
+
+from common.pubsub import decode_corrections
+from interface_service.correction_publisher import CorrectionPublisher
+
+PUBLISHED = 'stackoverflow_tagger_corrections_published'
+FAILED = 'stackoverflow_tagger_corrections_publish_failures'
+
+
+def counter_value(name):
+    """Gets the value of a Prometheus counter."""
+    return REGISTRY.get_sample_value(f'{name}_total') or 0
+
+
+class FakePublishClient:
+    """Publisher recording the messages, whose futures are resolved by the test."""
+
+    def __init__(self):
+        self.messages = []
+        self.futures = []
+
+    def publish(self, topic, data, **attributes):
+        """Records a message and returns its unresolved future."""
+        self.messages.append((topic, data, attributes))
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+class CorrectionPublisherTest(unittest.TestCase):
+    """Testing that corrections are published without waiting for them to be sent"""
+
+    def setUp(self):
+        self.client = FakePublishClient()
+        self.publisher = CorrectionPublisher(self.client, 'topic')
+        self.corrections = [
+            {"title": f"title {index}", "predicted": {"java"}, "actual": {"python"}}
+            for index in range(3)
+        ]
+
+    def test_publish_returns_before_sent(self):
+        """Publishing returns with the messages still pending."""
+        self.assertEqual(self.publisher.publish(self.corrections), 3)
+        self.assertEqual(self.publisher.pending, 3)
+        self.assertFalse(self.publisher.flush(timeout=0.01))
+        self.assertEqual(len(self.client.messages), 1)
+        topic, data, attributes = self.client.messages[0]
+        self.assertEqual(topic, 'topic')
+        self.assertEqual(attributes, {})
+        self.assertEqual(decode_corrections(data), self.corrections)
+
+        published = counter_value(PUBLISHED)
+        for future in self.client.futures:
+            future.set_result("message-id")
+        self.assertTrue(self.publisher.flush(timeout=1))
+        self.assertEqual(self.publisher.pending, 0)
+        self.assertEqual(counter_value(PUBLISHED), published + 3)
+
+    def test_failures_are_counted(self):
+        """Messages which failed to be sent are counted, and no longer pending."""
+        self.publisher.publish(self.corrections[:1])
+        failed = counter_value(FAILED)
+        self.client.futures[0].set_exception(RuntimeError("unavailable"))
+        self.assertTrue(self.publisher.flush(timeout=1))
+        self.assertEqual(counter_value(FAILED), failed + 1)
+
+    def test_corrections_are_split_into_messages(self):
+        """Corrections beyond the maximum per message are sent in further messages."""
+        publisher = CorrectionPublisher(self.client, 'topic', max_corrections_per_message=2)
+        publisher.publish(self.corrections)
+        self.assertEqual([len(decode_corrections(data)) for _, data, _ in self.client.messages], [2, 1])
+        published = counter_value(PUBLISHED)
+        self.client.futures[0].set_result("message-id")
+        self.assertEqual(publisher.pending, 1)
+        self.assertEqual(counter_value(PUBLISHED), published + 2)
@@ -0,0 +1,171 @@
+"""Tests for the prediction and correction endpoints of the inference service."""
+import unittest
+from unittest import mock
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from common.compiled_model import top_k_scores
+
+TAGS = ['java', 'python', 'sql']
+
+
+class FakeModel:
+    """Model scoring every tag by whether the title mentions it."""
+
+    tags = TAGS
+
+    def decision_function(self, titles):
+        """Scores the tags of titles."""
+        return np.array([
+            [1.0 if tag in title.lower() else -1.0 - index for index, tag in enumerate(TAGS)]
+            for title in titles
+        ])
+
+    def transform(self, titles):
+        """Predicts the tags with a positive score."""
+        return [
+            {tag for tag, score in zip(TAGS, scores) if score > 0}
+            for scores in self.decision_function(titles)
+        ]
+
+    def tag_thresholds(self, thresholds, default):
+        """Creates the per-tag threshold vector."""
+        return np.array([thresholds.get(tag, default) for tag in TAGS])
+
+    def top_k(self, titles, k=None, threshold=None):
+        """Predicts the highest scoring tags with their scores."""
+        selected = top_k_scores(self.decision_function(titles), len(TAGS) if k is None else k,
+                                threshold)
+        return [
+            [(TAGS[index], float(score)) for index, score in zip(indices, scores)]
+            for indices, scores in selected
+        ]
+
+
+class FakeLegacyModel:
+    """Model predicting tag sets without scores."""
+
+    def transform(self, titles):
+        """Predicts the same tags for every title."""
+        return [{'java'} for _ in titles]
+
+
+@pytest.fixture(scope="module")
+def inference_app():
+    """Imports the inference app without Pub/Sub, object storage or metrics server."""
+    subscriber = mock.MagicMock()
+    with mock.patch('common.pubsub.subscribe_to_topic', return_value=(subscriber, mock.MagicMock())), \
+            mock.patch('common.pubsub.publish_to_topic'), \
+            mock.patch('interface_service.model_swap.ModelSwapper.update'), \
+            mock.patch('prometheus_client.start_http_server'):
+        from interface_service.main import app # pylint: disable=import-outside-toplevel
+    return app
+
+
+class EndpointsTest(unittest.TestCase):
+    """Testing the batch, scoring and correction endpoints"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, inference_app):
+        """Fixture serving the fake model and recording the published corrections."""
+        self.app = inference_app
+        self.app.set_model(FakeModel(), 'v1')
+        self.publisher = mock.MagicMock()
+        self.publisher.publish.side_effect = len
+        with mock.patch.object(self.app, 'correction_publisher', self.publisher):
+            self.client = TestClient(self.app)
+            yield
+        self.app.set_model(None, None)
+
+    def test_predict(self):
+        """A single title is predicted through the batching worker."""
+        response = self.client.post('/api/predict', json={"title": "Java or Python?"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()["tags"]), {'java', 'python'})
+
+    def test_predict_batch(self):
+        """Many titles are predicted in one request, in order."""
+        response = self.client.post('/api/predict/batch', json={
+            "titles": ["Java streams", "SQL joins", "Rust lifetimes"]
+        })
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["title"] for result in results],
+                         ["Java streams", "SQL joins", "Rust lifetimes"])
+        self.assertEqual([result["tags"] for result in results], [['java'], ['sql'], []])
+        self.assertTrue(all(result["scores"] is None for result in results))
+
+    def test_scoring(self):
+        """Top-k, global and per-tag thresholds select the returned tags and scores."""
+        response = self.client.post('/api/predict', json={"title": "Java", "top_k": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["scores"], {"java": 1.0, "python": -2.0})
+
+        response = self.client.post('/api/predict/batch', json={
+            "titles": ["Java", "SQL"], "threshold": 0.0
+        })
+        self.assertEqual([result["scores"] for result in response.json()["results"]],
+                         [{"java": 1.0}, {"sql": 1.0}])
+
+        response = self.client.post('/api/predict/batch', json={
+            "titles": ["Java"], "threshold": 0.0, "tag_thresholds": {"java": 2.0, "python": -5.0}
+        })
+        self.assertEqual(response.json()["results"][0]["scores"], {"python": -2.0})
+
+    def test_invalid_requests(self):
+        """Invalid options and too many items are rejected before reaching the model."""
+        response = self.client.post('/api/predict', json={"title": "Java", "top_k": 0})
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post('/api/predict/batch', json={"titles": []})
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post('/api/predict/batch', json={"titles": ["Java"] * 10001})
+        self.assertEqual(response.status_code, 422)
+        correction = {"title": "Java", "predicted": [], "actual": ["java"]}
+        response = self.client.post('/api/correct/batch', json={"corrections": [correction] * 1001})
+        self.assertEqual(response.status_code, 422)
+        self.publisher.publish.assert_not_called()
+
+    def test_scoring_unsupported(self):
+        """Scoring is rejected for models without scores, plain predictions still work."""
+        self.app.set_model(FakeLegacyModel(), 'v0')
+        response = self.client.post('/api/predict/batch', json={"titles": ["Java"], "top_k": 1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/predict/batch', json={"titles": ["Java"]})
+        self.assertEqual(response.json()["results"][0]["tags"], ['java'])
+
+    def test_model_not_available(self):
+        """Predictions fail while no model is served."""
+        self.app.set_model(None, None)
+        response = self.client.post('/api/predict/batch', json={"titles": ["Java"]})
+        self.assertEqual(response.status_code, 500)
+
+    def test_correct_batch(self):
+        """Corrections of a batch are handed to the publisher at once."""
+        corrections = [
+            {"title": "Java streams", "predicted": ["python"], "actual": ["java"]},
+            {"title": "SQL joins", "predicted": [], "actual": ["sql"]},
+        ]
+        response = self.client.post('/api/correct/batch', json={"corrections": corrections})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"published": 2})
+        published, = self.publisher.publish.call_args.args
+        self.assertEqual(published, [
+            {"title": "Java streams", "predicted": {"python"}, "actual": {"java"}},
+            {"title": "SQL joins", "predicted": set(), "actual": {"sql"}},
+        ])
+
+    def test_correct_rejects_nul(self):
+        """Corrections with NUL characters are rejected before anything is published."""
+        corrections = [
+            {"title": "Java streams", "predicted": [], "actual": ["java"]},
+            {"title": "SQL\0joins", "predicted": [], "actual": ["sql"]},
+        ]
+        response = self.client.post('/api/correct/batch', json={"corrections": corrections})
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post('/api/correct', json={
+            "title": "Java", "predicted": [], "actual": ["ja\0va"]
+        })
+        self.assertEqual(response.status_code, 422)
+        self.publisher.publish.assert_not_called()
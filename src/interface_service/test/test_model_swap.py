@@ -0,0 +1,140 @@
+"""Tests for swapping the served model."""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from interface_service import model_swap
+from interface_service.model_swap import ModelSwapper
+
+
+class FakeModel:
+    """Model that tags every title with its own name."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def transform(self, titles):
+        """Fake prediction."""
+        self.calls += 1
+        return [(self.name,) for _ in titles]
+
+
+class FakeApp:
+    """Application holding the served model."""
+
+    def __init__(self):
+        self.model = None
+        self.version = None
+
+    def set_model(self, model, version):
+        """Swaps the served model."""
+        self.model = model
+        self.version = version
+
+
+class ModelSwapperTest(unittest.TestCase):
+    """Testing versioned model swapping"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = FakeApp()
+        self.swapper = ModelSwapper(
+            self.app, os.path.join(self.directory.name, 'model.joblib'),
+            'bucket', 'model.joblib', 'bundles/latest.json',
+            'localhost:10000', 'key', 'secret', False, grace_period=0
+        )
+        self.remote_version = 'v1'
+        self.downloads = []
+        patches = [
+            mock.patch.object(model_swap, 'read_manifest',
+                              lambda *args, **kwargs: {"version": self.remote_version}),
+            mock.patch.object(model_swap, 'fetch_bundle', self.fake_fetch),
+            mock.patch.object(model_swap, 'load_model', self.fake_load),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def fake_fetch(self, object_store, bucket_name, manifest, targets):
+        """Writes the version into the downloaded file."""
+        self.downloads.append(manifest["version"])
+        with open(targets['model.joblib'], 'w', encoding='utf-8') as f:
+            f.write(manifest["version"])
+        return True
+
+    @staticmethod
+    def fake_load(path):
+        """Loads a model named after the file contents."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return FakeModel(f.read())
+
+    def test_update_swaps_in_warm_model(self):
+        """A new version is downloaded to its own file, warmed up and swapped in."""
+        self.assertTrue(self.swapper.update())
+        self.assertEqual(self.app.version, 'v1')
+        self.assertEqual(self.app.model.name, 'v1')
+        self.assertEqual(self.app.model.calls, 1)
+        self.assertTrue(os.path.isfile(self.swapper.version_path('v1')))
+
+    def test_unchanged_version_is_skipped(self):
+        """Duplicate notifications do not load the model twice."""
+        self.swapper.update()
+        model = self.app.model
+        self.assertFalse(self.swapper.update())
+        self.assertIs(self.app.model, model)
+        self.assertEqual(self.downloads, ['v1'])
+
+    def test_rollback_restores_previous_model(self):
+        """The previous model is kept and old versions are removed from disk."""
+        self.swapper.update()
+        self.remote_version = 'v2'
+        self.swapper.update()
+        self.remote_version = 'v3'
+        self.swapper.update()
+        self.assertEqual(self.app.model.name, 'v3')
+        self.assertFalse(os.path.isfile(self.swapper.version_path('v1')))
+
+        self.assertTrue(self.swapper.rollback())
+        self.assertEqual(self.app.model.name, 'v2')
+        self.assertEqual(self.app.version, 'v2')
+
+    def test_failed_warm_up_keeps_served_model(self):
+        """A model failing its warm-up predictions is never served."""
+        self.swapper.update()
+        model = self.app.model
+        self.remote_version = 'v2'
+        with mock.patch.object(FakeModel, 'transform', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.swapper.update()
+        self.assertIs(self.app.model, model)
+        self.assertEqual(self.swapper.version, 'v1')
+
+    def test_recently_used_versions_are_kept(self):
+        """Version files another process may be about to load are not removed."""
+        self.swapper.grace_period = 600
+        shared_path = self.swapper.version_path('v0')
+        with open(shared_path, 'w', encoding='utf-8') as f:
+            f.write('v0')
+        self.swapper.update()
+        self.remote_version = 'v2'
+        self.swapper.update()
+        self.assertTrue(os.path.isfile(shared_path))
+
+        expired = os.path.getmtime(shared_path) - 601
+        os.utime(shared_path, (expired, expired))
+        self.remote_version = 'v3'
+        self.swapper.update()
+        self.assertFalse(os.path.isfile(shared_path))
+
+    def test_reused_version_is_marked_as_used(self):
+        """A version file downloaded by another process is reused and marked as used."""
+        shared_path = self.swapper.version_path('v1')
+        with open(shared_path, 'w', encoding='utf-8') as f:
+            f.write('v1')
+        os.utime(shared_path, (0, 0))
+        self.assertTrue(self.swapper.update())
+        self.assertEqual(self.downloads, [])
+        self.assertGreater(os.path.getmtime(shared_path), 0)
@@ -23,6 +23,7 @@ class VarNames(Enum):
     BUCKET_NAME = "BUCKET_NAME"
     MODEL_OBJECT_KEY = "MODEL_OBJECT_KEY"
     MODEL_LOCAL_PATH = "MODEL_LOCAL_PATH"
+    MAPPED_MODEL_OBJECT_KEY = "MAPPED_MODEL_OBJECT_KEY"
     PUBSUB_EMULATOR_HOST = "PUBSUB_EMULATOR_HOST"
     PUBSUB_PROJECT_ID = "PUBSUB_PROJECT_ID"
     PUBSUB_DATA_TOPIC_ID = "PUBSUB_DATA_TOPIC_ID"
@@ -42,6 +43,38 @@ class VarNames(Enum):
     PREPROCESSOR_VAL_DATA_PATH = "PREPROCESSOR_VAL_DATA_PATH"
     PREPROCESSOR_VAL_LABELS_OBJECT_KEY = "PREPROCESSOR_VAL_LABELS_OBJECT_KEY"
     PREPROCESSOR_VAL_LABELS_PATH = "PREPROCESSOR_VAL_LABELS_PATH"
+    MODEL_BUNDLE_POINTER_KEY = "MODEL_BUNDLE_POINTER_KEY"
+    ARTIFACT_CACHE_DIR = "ARTIFACT_CACHE_DIR"
+    ARTIFACT_CACHE_MAX_BYTES = "ARTIFACT_CACHE_MAX_BYTES"
+    PREPROCESSING_JOBS = "PREPROCESSING_JOBS"
+    FEATURIZER_MODE = "FEATURIZER_MODE"
+    HASHING_N_FEATURES = "HASHING_N_FEATURES"
+    PREPROCESSING_TOKEN_CACHE_SIZE = "PREPROCESSING_TOKEN_CACHE_SIZE"
+    PREPROCESSOR_TOKENS_OBJECT_KEY = "PREPROCESSOR_TOKENS_OBJECT_KEY"
+    TRAINING_MODE = "TRAINING_MODE"
+    STREAMING_CHUNK_SIZE = "STREAMING_CHUNK_SIZE"
+    STREAMING_EPOCHS = "STREAMING_EPOCHS"
+    STREAMING_SHUFFLE_BUFFER_SIZE = "STREAMING_SHUFFLE_BUFFER_SIZE"
+    DATASET_COLUMNAR_COPY = "DATASET_COLUMNAR_COPY"
+    STAGE_CACHE_ENABLED = "STAGE_CACHE_ENABLED"
+    STAGE_CACHE_DIR = "STAGE_CACHE_DIR"
+    STAGE_CACHE_MAX_ENTRIES = "STAGE_CACHE_MAX_ENTRIES"
+    INCREMENTAL_GROW_LABELS = "INCREMENTAL_GROW_LABELS"
+    INCREMENTAL_GROW_VOCABULARY = "INCREMENTAL_GROW_VOCABULARY"
+    INCREMENTAL_VOCABULARY_MIN_DF = "INCREMENTAL_VOCABULARY_MIN_DF"
+    CORRECTION_MAX_AGE_SECONDS = "CORRECTION_MAX_AGE_SECONDS"
+    CORRECTION_FSYNC_INTERVAL_SECONDS = "CORRECTION_FSYNC_INTERVAL_SECONDS"
+    CORRECTION_FSYNC_BATCH_SIZE = "CORRECTION_FSYNC_BATCH_SIZE"
+    PUBSUB_FLOW_CONTROL_MAX_MESSAGES = "PUBSUB_FLOW_CONTROL_MAX_MESSAGES"
+    PUBSUB_FLOW_CONTROL_MAX_BYTES = "PUBSUB_FLOW_CONTROL_MAX_BYTES"
+    PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS = "PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS"
+    PUBSUB_CALLBACK_WORKERS = "PUBSUB_CALLBACK_WORKERS"
+    PUBSUB_BATCH_MAX_MESSAGES = "PUBSUB_BATCH_MAX_MESSAGES"
+    PUBSUB_BATCH_MAX_LATENCY_SECONDS = "PUBSUB_BATCH_MAX_LATENCY_SECONDS"
+    TRAINING_DEBOUNCE_SECONDS = "TRAINING_DEBOUNCE_SECONDS"
+    TRAINING_MIN_INTERVAL_SECONDS = "TRAINING_MIN_INTERVAL_SECONDS"
+    TRAINING_MAX_STALENESS_SECONDS = "TRAINING_MAX_STALENESS_SECONDS"
+    TRAINING_MAX_BATCH_ATTEMPTS = "TRAINING_MAX_BATCH_ATTEMPTS"
 
 settings = Dynaconf(
     # variables exported in .env as `REMLA_FOO=bar` becomes `settings.FOO == "bar"`
@@ -68,6 +101,7 @@ settings.validators.register(
     Validator(VarNames.BUCKET_NAME.value, must_exist=True),
     Validator(VarNames.MODEL_OBJECT_KEY.value, must_exist=True),
     Validator(VarNames.MODEL_LOCAL_PATH.value, must_exist=True),
+    Validator(VarNames.MAPPED_MODEL_OBJECT_KEY.value, default="model.npmap"),
     Validator(VarNames.CLASSIFIER_OBJECT_KEY.value, must_exist=True),
     Validator(VarNames.CLASSIFIER_LOCAL_PATH.value, must_exist=True),
     Validator(VarNames.PUBSUB_DATA_TEMP_FILE.value, must_exist=True),
@@ -92,6 +126,39 @@ settings.validators.register(
     Validator(VarNames.PUBSUB_DATA_TOPIC_ID.value, must_exist=True),
     Validator(VarNames.PUBSUB_MODEL_TOPIC_ID.value, must_exist=True),
     Validator(VarNames.PUBSUB_SUBSCRIPTION_ID.value, must_exist=True),
+
+    Validator(VarNames.MODEL_BUNDLE_POINTER_KEY.value, default="bundles/latest.json"),
+    Validator(VarNames.ARTIFACT_CACHE_DIR.value, default="./learning_service/artifact_cache"),
+    Validator(VarNames.ARTIFACT_CACHE_MAX_BYTES.value, default=2 * 1024 ** 3),
+    Validator(VarNames.PREPROCESSING_JOBS.value, default=1),
+    Validator(VarNames.FEATURIZER_MODE.value, default="tfidf", is_in=["tfidf", "hashing"]),
+    Validator(VarNames.HASHING_N_FEATURES.value, default=2 ** 20),
+    Validator(VarNames.PREPROCESSING_TOKEN_CACHE_SIZE.value, default=100000),
+    Validator(VarNames.PREPROCESSOR_TOKENS_OBJECT_KEY.value, default="preprocessor_tokens.joblib"),
+    Validator(VarNames.TRAINING_MODE.value, default="batch", is_in=["batch", "streaming"]),
+    Validator(VarNames.STREAMING_CHUNK_SIZE.value, default=10000),
+    Validator(VarNames.STREAMING_EPOCHS.value, default=5),
+    Validator(VarNames.STREAMING_SHUFFLE_BUFFER_SIZE.value, default=50000),
+    Validator(VarNames.DATASET_COLUMNAR_COPY.value, default=False),
+    Validator(VarNames.STAGE_CACHE_ENABLED.value, default=True),
+    Validator(VarNames.STAGE_CACHE_DIR.value, default="./learning_service/stage_cache"),
+    Validator(VarNames.STAGE_CACHE_MAX_ENTRIES.value, default=3),
+    Validator(VarNames.INCREMENTAL_GROW_LABELS.value, default=True),
+    Validator(VarNames.INCREMENTAL_GROW_VOCABULARY.value, default=False),
+    Validator(VarNames.INCREMENTAL_VOCABULARY_MIN_DF.value, default=2),
+    Validator(VarNames.CORRECTION_MAX_AGE_SECONDS.value, default=3600),
+    Validator(VarNames.CORRECTION_FSYNC_INTERVAL_SECONDS.value, default=0.05),
+    Validator(VarNames.CORRECTION_FSYNC_BATCH_SIZE.value, default=100),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_MESSAGES.value, default=1000),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_BYTES.value, default=100 * 1024 ** 2),
+    Validator(VarNames.PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS.value, default=3600),
+    Validator(VarNames.PUBSUB_CALLBACK_WORKERS.value, default=2),
+    Validator(VarNames.PUBSUB_BATCH_MAX_MESSAGES.value, default=100),
+    Validator(VarNames.PUBSUB_BATCH_MAX_LATENCY_SECONDS.value, default=0.05),
+    Validator(VarNames.TRAINING_DEBOUNCE_SECONDS.value, default=10),
+    Validator(VarNames.TRAINING_MIN_INTERVAL_SECONDS.value, default=60),
+    Validator(VarNames.TRAINING_MAX_STALENESS_SECONDS.value, default=300),
+    Validator(VarNames.TRAINING_MAX_BATCH_ATTEMPTS.value, default=3),
 )
 
 settings.validators.validate()
@@ -0,0 +1,254 @@
+"""
+Provides a buffer of the corrections received from the interface services.
+Corrections are appended to a write-ahead log, which is synced to disk in
+groups, and acknowledged only once they are durable. When enough corrections
+arrived, or the oldest of them waited long enough, the log is rotated into a
+batch file, which is handed to training as a whole.
+"""
+import glob
+import os
+import shutil
+import time
+import traceback
+from threading import Event, Lock, Thread
+
+from common.logger import Logger
+
+WAL_HEADER = "title\ttags\n"
+BATCH_SUFFIX = '.batch'
+MERGED_SUFFIX = '.merged'
+FAILED_SUFFIX = '.failed'
+
+
+def _clean_field(value : str) -> str:
+    """Replaces the separators of the log in a field by spaces."""
+    return value.replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+class CorrectionBuffer:
+    """Durable buffer of corrections, flushed to training in batches.
+
+    The log has the format of the training data, so that batch files
+    can be read like any data file.
+
+    Args:
+        wal_path (str): path of the write-ahead log
+        threshold (int): number of corrections which triggers a flush
+        on_flush (Callable[[str], Any]): handler of the path of a flushed batch file.
+                    The handler removes the batch file once its corrections are learned,
+                    batch files which are left over are handed to it again by `recover_batches`.
+        max_age (float, optional): seconds after which the oldest correction
+                    triggers a flush. Defaults to None, only flushing by count.
+        fsync_interval (float, optional): maximum seconds between syncs of the log.
+                    Defaults to 0.05.
+        fsync_batch_size (int, optional): number of unsynced corrections which
+                    triggers a sync. Defaults to 100.
+    """
+
+    def __init__(self, wal_path : str, threshold : int, on_flush, max_age : float = None,
+                 fsync_interval : float = 0.05, fsync_batch_size : int = 100):
+        self.wal_path = wal_path
+        self.threshold = threshold
+        self.on_flush = on_flush
+        self.max_age = max_age
+        self.fsync_interval = fsync_interval
+        self.fsync_batch_size = fsync_batch_size
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._file = None
+        self._count = 0
+        self._oldest = None
+        self._unsynced = []
+
+    def __len__(self) -> int:
+        return self._count
+
+    def start(self):
+        """Opens the log, recovering its corrections, and starts the background syncs."""
+        directory = os.path.dirname(self.wal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._open()
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background syncs, and syncs and closes the log."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def recover_batches(self):
+        """Hands the batch files left over by a previous run to the flush handler, oldest first."""
+        for batch_path in self.pending_batches():
+            Logger.warning(f'Recovering batch of corrections {batch_path} ⚠️')
+            self.on_flush(batch_path)
+
+    def pending_batches(self) -> list:
+        """Lists the batch files which were flushed but not removed, oldest first.
+
+        Returns:
+            list[str]: paths of the batch files
+        """
+        root, extension = os.path.splitext(self.wal_path)
+        return sorted(
+            glob.glob(f'{glob.escape(root)}.*{BATCH_SUFFIX}{extension}'),
+            key=lambda path: int(path[len(root) + 1:].split('.')[0])
+        )
+
+    def merge_batches(self, batch_paths : list) -> str:
+        """Concatenates batch files into a single file of corrections, keeping the batches.
+
+        Args:
+            batch_paths (list[str]): paths of the batch files
+
+        Returns:
+            str: path of the merged file, which is overwritten by the next merge
+        """
+        if len(batch_paths) == 1:
+            return batch_paths[0]
+        root, extension = os.path.splitext(self.wal_path)
+        merged_path = f'{root}{MERGED_SUFFIX}{extension}'
+        with open(merged_path, 'w', encoding='utf-8') as merged:
+            merged.write(WAL_HEADER)
+            for batch_path in batch_paths:
+                with open(batch_path, encoding='utf-8') as batch:
+                    batch.readline()
+                    shutil.copyfileobj(batch, merged)
+        return merged_path
+
+    def set_aside(self, batch_path : str, error : Exception) -> str:
+        """Moves a batch file which cannot be learned out of the pending batches,
+        next to a log of its error.
+
+        Args:
+            batch_path (str): path of the batch file
+            error (Exception): the error of the last attempt to learn the batch
+
+        Returns:
+            str: path of the moved batch file
+        """
+        root, extension = os.path.splitext(batch_path)
+        failed_root = root[:-len(BATCH_SUFFIX)] + FAILED_SUFFIX
+        with open(f'{failed_root}.log', 'w', encoding='utf-8') as log:
+            log.write(''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+        os.replace(batch_path, failed_root + extension)
+        Logger.fail(f'Set aside batch of corrections {batch_path} ❌')
+        return failed_root + extension
+
+    def _open(self):
+        """Opens the log for appending, counting the corrections it already holds."""
+        self._count = 0
+        if os.path.isfile(self.wal_path):
+            with open(self.wal_path, 'rb') as f:
+                self._count = max(sum(1 for _ in f) - 1, 0)
+        self._file = open(self.wal_path, 'a', encoding='utf-8')
+        if self._file.tell() == 0:
+            self._file.write(WAL_HEADER)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._oldest = time.monotonic() if self._count > 0 else None
+        if self._count > 0:
+            Logger.info(f'Recovered {self._count} corrections from {self.wal_path} ✔️')
+
+    def append(self, title : str, tags : list, on_durable=None):
+        """Appends a correction to the log, flushing the buffer when it is full.
+
+        Args:
+            title (str): title of the question
+            tags (list[str]): the correct tags
+            on_durable (Callable[[], Any], optional): called once the correction is synced
+                    to disk, e.g. to acknowledge its message. Defaults to None.
+        """
+        self.extend([(title, tags)], on_durable)
+
+    def extend(self, corrections : list, on_durable=None):
+        """Appends many corrections to the log at once, flushing the buffer when it is full.
+
+        Once the corrections are appended, failures to sync or flush the log are only
+        logged, the background thread syncs the log again. An error raised by this
+        method means that the corrections were not appended, and `on_durable` is not called.
+
+        Args:
+            corrections (list[tuple[str, list[str]]]): titles of the questions and their correct tags
+            on_durable (Callable[[], Any], optional): called once all corrections are synced
+                    to disk, e.g. to acknowledge their message. Defaults to None.
+        """
+        with self._lock:
+            self._file.write(''.join(
+                f'{_clean_field(title)}\t{[_clean_field(tag) for tag in tags]}\n'
+                for title, tags in corrections
+            ))
+            self._count += len(corrections)
+            if corrections and self._oldest is None:
+                self._oldest = time.monotonic()
+            if on_durable is not None:
+                self._unsynced.append(on_durable)
+            sync_now = len(self._unsynced) >= self.fsync_batch_size
+            flush_now = self._count >= self.threshold
+        try:
+            if flush_now:
+                self.flush()
+            elif sync_now:
+                self.sync()
+        except Exception as error: # pylint: disable=broad-except
+            Logger.fail(f'Failed to sync or flush corrections: {error} ❌')
+
+    def sync(self):
+        """Syncs the log to disk, and notifies the callers of the synced corrections."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            callbacks, self._unsynced = self._unsynced, []
+        for callback in callbacks:
+            callback()
+
+    def flush(self):
+        """Rotates the corrections of the log into a batch file, and hands it to the handler.
+
+        Returns:
+            str | None: path of the batch file, or None when there were no corrections
+        """
+        # Flushes are serialized, so that batches are handed over in order
+        with self._flush_lock:
+            with self._lock:
+                if self._count == 0:
+                    return None
+                root, extension = os.path.splitext(self.wal_path)
+                batch_path = f'{root}.{time.time_ns()}{BATCH_SUFFIX}{extension}'
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                os.replace(self.wal_path, batch_path)
+                count = self._count
+                self._open()
+                callbacks, self._unsynced = self._unsynced, []
+            for callback in callbacks:
+                callback()
+            Logger.info(f'Flushed {count} corrections to {batch_path} ✔️')
+            self.on_flush(batch_path)
+            return batch_path
+
+    def _run(self):
+        """Syncs the log periodically, and flushes corrections which waited too long."""
+        while not self._stopped.wait(self.fsync_interval):
+            try:
+                self.sync()
+                oldest = self._oldest
+                if self.max_age is not None and oldest is not None \
+                        and time.monotonic() - oldest >= self.max_age:
+                    self.flush()
+            except Exception as error: # pylint: disable=broad-except
+                Logger.fail(f'Failed to sync or flush corrections: {error} ❌')
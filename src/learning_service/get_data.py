@@ -12,6 +12,25 @@ DATA_PATH = settings[VarNames.DATA_DIR.value]
 RESOURCES_DATA_PATH = "learning_service/data"
 
 
+def copy_if_changed(source, destination):
+    """Copies a file with its metadata, unless the destination has the same size and modification time.
+
+    Args:
+        source (str): path of the file to copy
+        destination (str): path of the copy
+
+    Returns:
+        str: the path of the copy
+    """
+    if os.path.isfile(destination):
+        source_stat = os.stat(source)
+        destination_stat = os.stat(destination)
+        if source_stat.st_size == destination_stat.st_size \
+                and source_stat.st_mtime_ns == destination_stat.st_mtime_ns:
+            return destination
+    return shutil.copy2(source, destination)
+
+
 def copy_data():
     """
     Copies data from `data/` folder and creates
@@ -20,7 +39,7 @@ def copy_data():
     if not os.path.exists(DATASET_DIR):
         Logger.info(f'Directory {DATASET_DIR} does not exist - creating')
         os.mkdir(DATASET_DIR)
-    shutil.copytree(DATA_PATH, DATASET_DIR, dirs_exist_ok=True)
+    shutil.copytree(DATA_PATH, DATASET_DIR, dirs_exist_ok=True, copy_function=copy_if_changed)
 
 
 def copy_data_from_resources():
@@ -31,7 +50,8 @@ def copy_data_from_resources():
     if not os.path.exists(DATASET_DIR):
         Logger.info(f'Directory {DATASET_DIR} does not exist - creating')
         os.mkdir(DATASET_DIR)
-    shutil.copytree(RESOURCES_DATA_PATH, DATASET_DIR, dirs_exist_ok=True)
+    shutil.copytree(RESOURCES_DATA_PATH, DATASET_DIR, dirs_exist_ok=True,
+                    copy_function=copy_if_changed)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,167 @@
+"""
+Provides a TF-IDF vectorizer based on feature hashing.
+Terms are hashed into a fixed number of features instead of being stored
+in a vocabulary, and the document frequencies are updated incrementally,
+so that memory does not grow with the corpus and new terms are never dropped.
+"""
+import numbers
+
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+class HashingTfidfVectorizer(TransformerMixin, BaseEstimator):
+    """TF-IDF vectorizer hashing word n-grams, with a streaming fitted IDF.
+
+    The IDF is computed like the one of `TfidfVectorizer` with `smooth_idf=True`.
+    Features outside of the document frequency bounds get an IDF of zero.
+
+    Args:
+        n_features (int, optional): number of hashed features. Defaults to 2 ** 20.
+        ngram_range (tuple[int, int], optional): range of the word n-gram sizes. Defaults to (1, 2).
+        token_pattern (str, optional): regular expression of a token. Defaults to r'(\\S+)'.
+        lowercase (bool, optional): whether documents are lowercased. Defaults to True.
+        min_df (int | float, optional): minimum document frequency of a feature,
+                    as a count or as a proportion of the documents. Defaults to 1.
+        max_df (int | float, optional): maximum document frequency of a feature,
+                    as a count or as a proportion of the documents. Defaults to 1.0.
+        sublinear_tf (bool, optional): whether term frequencies are log scaled. Defaults to False.
+        norm (str, optional): normalization of the features, 'l1', 'l2' or None. Defaults to 'l2'.
+    """
+
+    def __init__(self, n_features=2 ** 20, ngram_range=(1, 2), token_pattern=r'(\S+)',
+                 lowercase=True, min_df=1, max_df=1.0, sublinear_tf=False, norm='l2'):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.min_df = min_df
+        self.max_df = max_df
+        self.sublinear_tf = sublinear_tf
+        self.norm = norm
+
+    def _hasher(self) -> HashingVectorizer:
+        """Creates the stateless vectorizer counting the hashed n-grams."""
+        return HashingVectorizer(
+            n_features=self.n_features,
+            ngram_range=self.ngram_range,
+            token_pattern=self.token_pattern,
+            lowercase=self.lowercase,
+            alternate_sign=False,
+            norm=None
+        )
+
+    def partial_fit(self, raw_documents, y=None):
+        """Updates the document frequencies with a batch of documents.
+
+        Args:
+            raw_documents (Iterable[str]): the documents
+
+        Returns:
+            HashingTfidfVectorizer: the vectorizer
+        """
+        self._update_document_frequency(self._hasher().transform(raw_documents))
+        return self
+
+    def _update_document_frequency(self, counts):
+        """Adds the hashed term counts of documents to the document frequencies."""
+        if not hasattr(self, 'document_frequency_'):
+            self.document_frequency_ = np.zeros(self.n_features, dtype=np.int32)
+            self.n_documents_ = 0
+        self.document_frequency_ += np.bincount(
+            counts.indices, minlength=self.n_features
+        ).astype(np.int32)
+        self.n_documents_ += counts.shape[0]
+        self._idf = None
+
+    def fit(self, raw_documents, y=None):
+        """Computes the document frequencies of documents, discarding previous ones.
+
+        Args:
+            raw_documents (Iterable[str]): the documents
+
+        Returns:
+            HashingTfidfVectorizer: the vectorizer
+        """
+        self._reset()
+        return self.partial_fit(raw_documents)
+
+    def _reset(self):
+        """Discards the fitted document frequencies."""
+        for attribute in ('document_frequency_', 'n_documents_', '_idf'):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    def __getstate__(self):
+        # The IDF is derived from the document frequencies, and only the
+        # non-zero document frequencies are stored
+        state = dict(super().__getstate__())
+        state.pop('_idf', None)
+        if 'document_frequency_' in state:
+            document_frequency = state.pop('document_frequency_')
+            indices = np.flatnonzero(document_frequency).astype(np.int32)
+            state['_document_frequency_sparse'] = (indices, document_frequency[indices])
+        return state
+
+    def __setstate__(self, state):
+        if '_document_frequency_sparse' in state:
+            indices, values = state.pop('_document_frequency_sparse')
+            state['document_frequency_'] = np.zeros(state['n_features'], dtype=np.int32)
+            state['document_frequency_'][indices] = values
+        super().__setstate__(state)
+
+    @property
+    def idf_(self) -> np.ndarray:
+        """Inverse document frequency of every feature, zero for features outside of the bounds."""
+        if getattr(self, '_idf', None) is None:
+            self._idf = self._compute_idf()
+        return self._idf
+
+    def _compute_idf(self) -> np.ndarray:
+        """Computes the inverse document frequencies, see `idf_`."""
+        document_frequency = self.document_frequency_
+        idf = np.log((1 + self.n_documents_) / (1 + document_frequency)) + 1
+        min_df, max_df = (
+            bound if isinstance(bound, numbers.Integral) else bound * self.n_documents_
+            for bound in (self.min_df, self.max_df)
+        )
+        idf[(document_frequency < min_df) | (document_frequency > max_df)] = 0
+        return idf
+
+    def transform(self, raw_documents):
+        """Computes the TF-IDF features of documents.
+
+        Args:
+            raw_documents (Iterable[str]): the documents
+
+        Returns:
+            sp.csr_matrix: the features of the documents
+        """
+        return self._weight(self._hasher().transform(raw_documents))
+
+    def _weight(self, features):
+        """Turns hashed term counts into TF-IDF features."""
+        if self.sublinear_tf:
+            np.log(features.data, features.data)
+            features.data += 1
+        features.data *= self.idf_[features.indices]
+        features.eliminate_zeros()
+        if self.norm is not None:
+            features = normalize(features, norm=self.norm, copy=False)
+        return features
+
+    def fit_transform(self, raw_documents, y=None):
+        """Computes the document frequencies and the TF-IDF features of documents.
+
+        Args:
+            raw_documents (Iterable[str]): the documents
+
+        Returns:
+            sp.csr_matrix: the features of the documents
+        """
+        self._reset()
+        counts = self._hasher().transform(raw_documents)
+        self._update_document_frequency(counts)
+        return self._weight(counts)
@@ -0,0 +1,134 @@
+"""
+Provides the growth of trained models to new tags and new terms.
+New tags get label columns appended after the known ones, and new terms
+get feature columns appended after the known ones, so that the columns of
+a trained classifier keep their meaning. Only the estimators of new tags
+and the weights of new terms start from scratch in the next `partial_fit`.
+"""
+import numpy as np
+import scipy.sparse as sp
+from sklearn.base import clone
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer
+
+# Attributes of SGD estimators holding one weight per feature
+_FEATURE_WEIGHT_ATTRIBUTES = ('coef_', '_standard_coef', '_average_coef')
+
+
+def grow_label_binarizer(mlb : MultiLabelBinarizer, tags_lists):
+    """Creates a binarizer of the known tags followed by the new tags of the data.
+
+    Args:
+        mlb (MultiLabelBinarizer): fitted binarizer of the known tags
+        tags_lists (Iterable[list[str]]): tags of every question
+
+    Returns:
+        tuple[MultiLabelBinarizer, list[str]]: the binarizer and the new tags, in column order
+    """
+    known = set(mlb.classes_)
+    new_tags = sorted({tag for tags in tags_lists for tag in tags} - known)
+    if not new_tags:
+        return mlb, []
+    grown = MultiLabelBinarizer(classes=list(mlb.classes_) + new_tags,
+                                sparse_output=mlb.sparse_output)
+    grown.fit([])
+    return grown, new_tags
+
+
+def grow_vocabulary(vectorizer, titles, min_df : int = 2) -> list:
+    """Adds the new terms of titles to the vocabulary of a fitted TF-IDF vectorizer.
+
+    The document frequencies of the corpus the vectorizer was fitted on are not kept,
+    so new terms get the highest known IDF, the one of the rarest known terms.
+
+    Args:
+        vectorizer (TfidfVectorizer): fitted vectorizer
+        titles (Iterable[str]): titles of StackOverflow questions
+        min_df (int, optional): minimum number of titles a new term occurs in. Defaults to 2.
+
+    Returns:
+        list[str]: the new terms, in column order
+    """
+    analyzer = vectorizer.build_analyzer()
+    document_frequency = {}
+    for title in titles:
+        for term in set(analyzer(title)):
+            if term not in vectorizer.vocabulary_:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+    new_terms = sorted(term for term, count in document_frequency.items() if count >= min_df)
+    if not new_terms:
+        return []
+
+    idf = vectorizer.idf_ if vectorizer.use_idf else None
+    n_known = len(vectorizer.vocabulary_)
+    vectorizer.vocabulary_.update(
+        (term, n_known + index) for index, term in enumerate(new_terms)
+    )
+    if idf is not None:
+        vectorizer.idf_ = np.concatenate([idf, np.full(len(new_terms), idf.max())])
+        # The IDF transformer checks the number of features it was fitted with
+        if hasattr(vectorizer._tfidf, 'n_features_in_'):
+            vectorizer._tfidf.n_features_in_ = len(vectorizer.vocabulary_)
+    return new_terms
+
+
+def _grow_estimator_features(estimator, n_features : int):
+    """Appends zero weights of new features to a linear estimator."""
+    for name in _FEATURE_WEIGHT_ATTRIBUTES:
+        weights = getattr(estimator, name, None)
+        if isinstance(weights, np.ndarray) and weights.shape[-1] < n_features:
+            padding = [(0, 0)] * (weights.ndim - 1) + [(0, n_features - weights.shape[-1])]
+            setattr(estimator, name, np.pad(weights, padding))
+    if hasattr(estimator, 'n_features_in_'):
+        estimator.n_features_in_ = n_features
+
+
+def grow_classifier(classifier : OneVsRestClassifier, n_features : int, n_classes : int):
+    """Grows a fitted one-vs-rest classifier to more features and labels.
+
+    Known estimators get zero weights for the new features, and new labels
+    get unfitted estimators, which are fitted by the next `partial_fit`.
+
+    Args:
+        classifier (OneVsRestClassifier): classifier fitted on multi-label data
+        n_features (int): number of features, at least the known number
+        n_classes (int): number of labels, at least the known number
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    n_known_classes = len(classifier.estimators_)
+    if n_classes < n_known_classes:
+        raise ValueError(f"Cannot shrink a classifier of {n_known_classes} labels to {n_classes}")
+    for estimator in classifier.estimators_:
+        _grow_estimator_features(estimator, n_features)
+    if hasattr(classifier, 'n_features_in_'):
+        classifier.n_features_in_ = n_features
+    if n_classes > n_known_classes:
+        classifier.estimators_ = list(classifier.estimators_) + [
+            clone(classifier.estimator) for _ in range(n_classes - n_known_classes)
+        ]
+        classifier.label_binarizer_.classes_ = np.arange(n_classes)
+        classifier.classes_ = classifier.label_binarizer_.classes_
+    return classifier
+
+
+def pad_columns(matrix, n_columns : int):
+    """Appends zero columns to a matrix of features or labels.
+
+    Args:
+        matrix (sp.spmatrix | np.ndarray): the matrix
+        n_columns (int): number of columns, at least the current number
+
+    Returns:
+        sp.csr_matrix | np.ndarray: the matrix with n_columns columns
+    """
+    n_rows, n_known = matrix.shape
+    if n_known >= n_columns:
+        return matrix
+    if sp.issparse(matrix):
+        return sp.hstack(
+            [matrix, sp.csr_matrix((n_rows, n_columns - n_known), dtype=matrix.dtype)],
+            format='csr'
+        )
+    return np.pad(matrix, [(0, 0), (0, n_columns - n_known)])
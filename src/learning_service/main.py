@@ -1,90 +1,167 @@
 """Main file for the FastAPI application."""
 import json
 import os
+import uuid
 from threading import Thread, Lock
+from typing import List
 
 import prometheus_client
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from google.cloud.pubsub_v1 import types
 from google.cloud.pubsub_v1.subscriber.message import Message
 from sklearn.multiclass import OneVsRestClassifier
 
-from common.bucket import download_model, load_model
+from common.artifact_cache import ArtifactCache
+from common.bucket import get_object_store, load_model
 from common.logger import Logger
-from common.pubsub import subscribe_to_topic, publish_to_topic
+from common.model_bundle import fetch_bundle, read_manifest
+from common.pubsub import decode_corrections, subscribe_to_topic, publish_to_topic
 from learning_service.config import settings, VarNames
+from learning_service.correction_buffer import CorrectionBuffer
 from learning_service.get_data import copy_data, copy_data_from_resources
-from learning_service.text_classification import main as classification_main, update_scores_from_file
-from learning_service.text_preprocessing import main as preprocess_main, prepocess_incoming_data
+from learning_service.streaming_training import main as streaming_main
+from learning_service.text_classification import main as classification_main, publish_model, \
+    update_scores_from_file
+from learning_service.text_preprocessing import main as preprocess_main, prepocess_incoming_data, \
+    PREPROCESSOR_TOKENS_FILE_NAME
+from learning_service.training_jobs import TrainingJobManager
+from learning_service.training_scheduler import TrainingScheduler
 
 OUTPUT_PATH = settings[VarNames.OUTPUT_DIR.value]
+TRAINING_MODE_STREAMING = "streaming"
 
 def train_and_send(app : FastAPI, train_file = "train.tsv", train_file_path : str = "/app/data/", model = None):
     """Method to train and send a model.
     """
     copy_data()
-    if model is None:
-        preprocess_main(train_file=train_file)
+    if model is None and settings[VarNames.TRAINING_MODE.value] == TRAINING_MODE_STREAMING:
+        streaming_main(bucket_upload=True, train_file=train_file)
     else:
-        prepocess_incoming_data('/'.join(settings[VarNames.PREPROCESSOR_DATA_PATH.value].split('/')[:-1]),
-                                '/'.join(settings[VarNames.PREPROCESSOR_LABELS_PATH.value].split('/')[:-1]),
-                                settings[VarNames.PREPROCESSOR_LABELS_PATH.value].split('/')[-1],
-                                train_file,
-                                train_file_path)
-    classification_main(bucket_upload=True, classifier=model)
+        if model is None:
+            preprocess_main(train_file=train_file)
+        else:
+            prepocess_incoming_data('/'.join(settings[VarNames.PREPROCESSOR_DATA_PATH.value].split('/')[:-1]),
+                                    '/'.join(settings[VarNames.PREPROCESSOR_LABELS_PATH.value].split('/')[:-1]),
+                                    settings[VarNames.PREPROCESSOR_LABELS_PATH.value].split('/')[-1],
+                                    train_file,
+                                    train_file_path)
+        classification_main(bucket_upload=True, classifier=model)
     app.publish_client.publish(app.publish_topic, b'New model available')
 
-def get_callback(lock : Lock, message_threshold : int, temp_file : str, train_file : str, app : FastAPI):
-    """Generates a callback that processes the receives that by re-training
+def get_training_job(lock : Lock, app : FastAPI, correction_buffer : CorrectionBuffer,
+                     max_attempts : int = 3):
+    """Generates a job that re-trains on all the flushed batches of corrections of a buffer.
 
     Args:
         lock (Lock): The lock used to ensure atomic operations on the files and models
-        message_threshold (int): The number of received messages required to trigger training
-        temp_file (str): The file in which to temprarily store the received messages
-        train_file (str): The file in which to move the messages for learning
+        app (FastAPI): The application holding the served model
+        correction_buffer (CorrectionBuffer): The buffer of the received corrections
+        max_attempts (int, optional): Number of failed trainings after which a batch
+                    is set aside. Defaults to 3.
+    """
+    # Failed trainings of every batch file
+    failures = {}
+
+    def train_on_batches(batch_paths : list):
+        """Trains once on batch files of corrections, and removes them.
+        When training fails, the batches are kept, until they failed too often."""
+        try:
+            with lock:
+                train_path = correction_buffer.merge_batches(batch_paths)
+                Logger.info(f'Training on {len(batch_paths)} batches of corrections')
+                train_and_send(app, os.path.basename(train_path),
+                               os.path.dirname(train_path), getattr(app, 'model', None))
+        except Exception as error: # pylint: disable=broad-except
+            Logger.fail(f'Training on {len(batch_paths)} batches of corrections failed ❌\n{error}')
+            for batch_path in batch_paths:
+                failures[batch_path] = failures.get(batch_path, 0) + 1
+                if failures[batch_path] >= max_attempts:
+                    correction_buffer.set_aside(batch_path, error)
+                    del failures[batch_path]
+            return
+        for batch_path in batch_paths:
+            os.remove(batch_path)
+            failures.pop(batch_path, None)
+        Logger.info('Sent model! ✔️')
+
+    def train_on_corrections():
+        """Trains on the batch files of corrections. Batches which failed before are
+        trained on their own, so that a batch which cannot be learned does not block the others."""
+        batch_paths = correction_buffer.pending_batches()
+        failed = [batch_path for batch_path in batch_paths if batch_path in failures]
+        fresh = [batch_path for batch_path in batch_paths if batch_path not in failures]
+        if fresh:
+            train_on_batches(fresh)
+        for batch_path in failed:
+            train_on_batches([batch_path])
+    return train_on_corrections
+
+def buffer_corrections(correction_buffer : CorrectionBuffer, message : Message) -> int:
+    """Buffers the corrections of a Pub/Sub message, and acknowledges it once they are durable.
+
+    Messages which cannot be decoded would fail on every delivery, so they are logged and
+    acknowledged. Messages whose corrections could not be appended to the log are delivered again.
+
+    Args:
+        correction_buffer (CorrectionBuffer): The buffer of the received corrections
+        message (pubsub_v1.subscriber.message.Message): The message to acknowledge.
+
+    Returns:
+        int: number of buffered corrections
+    """
+    try:
+        corrections = decode_corrections(message.data, message.attributes)
+    except ValueError as error:
+        Logger.fail(f'Dropping undecodable message {message.message_id} ❌\n{error}')
+        message.ack()
+        return 0
+    try:
+        correction_buffer.extend(
+            [(correction["title"], sorted(correction["actual"])) for correction in corrections],
+            on_durable=message.ack
+        )
+    except Exception as error: # pylint: disable=broad-except
+        Logger.fail(f'Failed to buffer message {message.message_id} ❌\n{error}')
+        message.nack()
+        return 0
+    return len(corrections)
+
+def get_callback(correction_buffer : CorrectionBuffer):
+    """Generates a callback that buffers the received corrections for re-training
+
+    Args:
+        correction_buffer (CorrectionBuffer): The buffer of the received corrections
     """
 
     def receive_msg_callback(message : Message):
-        """Acknowledges a Pub/Sub message. Used in the `subscribe()` function.
+        """Buffers the corrections of a Pub/Sub message, and acknowledges it once they are durable.
+        Used in the `subscribe()` function.
 
         Args:
             message (pubsub_v1.subscriber.message.Message): The message to acknowledge.
         """
-        message.ack()
-        Logger.info(f'💬✔️ Received message: {message} ')
-        lock.acquire()
-        try:
-            # Open the file and append to it
-            if not (os.path.exists(temp_file) and os.path.isfile(temp_file)):
-                with open(temp_file, 'w+') as f:
-                    f.write("title\ttags\n")
-
-            with open(temp_file, 'a') as f:
-                tags = [tag[1:-1] for tag in message.attributes['actual'][1:-1].split(', ')]
-                line = f'{message.attributes["title"]}\t{tags}'
-                f.write(line + '\n')
-            
-            with open(temp_file, 'r') as f:
-                lines = f.readlines()
-
-            Logger.info(f'Wrote line {line} to {temp_file}. File now has {len(lines)} lines')
-
-            # If the threshold has been reached, trigger re-learning
-            if len(lines) >= message_threshold:
-                # Perform learning
-                train_and_send(app, temp_file.split('/')[-1],
-                               '/'.join(temp_file.split('/')[:-1]), app.model)
-
-                # Empty the temporary file
-                with open(temp_file, 'w') as f:
-                    f.write("title\ttags\n")
-                
-                Logger.info('Training')
-                
-        finally:
-            lock.release()
-        Logger.info('Sent model! ✔️')
+        n_corrections = buffer_corrections(correction_buffer, message)
+        Logger.info(f'💬✔️ Received message with {n_corrections} corrections')
     return receive_msg_callback
 
+def get_batch_callback(correction_buffer : CorrectionBuffer):
+    """Generates a callback that buffers the corrections of lists of messages for re-training
+
+    Args:
+        correction_buffer (CorrectionBuffer): The buffer of the received corrections
+    """
+
+    def receive_msgs_callback(messages : List[Message]):
+        """Buffers the corrections of Pub/Sub messages, and acknowledges them once they are durable.
+        Used in the `subscribe()` function.
+
+        Args:
+            messages (List[pubsub_v1.subscriber.message.Message]): The messages to acknowledge.
+        """
+        n_corrections = sum(buffer_corrections(correction_buffer, message) for message in messages)
+        Logger.info(f'💬✔️ Received {len(messages)} messages with {n_corrections} corrections')
+    return receive_msgs_callback
+
 def get_result(streaming_pull_future):
     """Wrapper function for getting results from Pub/Sub.
 
@@ -112,20 +189,47 @@ class LearningApp(FastAPI):
         pubsub_subscription_topic_id = settings[VarNames.PUBSUB_DATA_TOPIC_ID.value]
 
         self.lock = Lock()
+        self.training_jobs = TrainingJobManager(self.lock)
 
-        callback = get_callback(self.lock,
-                                settings[VarNames.LEARNING_MESSAGE_THRESHOLD.value],
-                                settings[VarNames.PUBSUB_DATA_TEMP_FILE.value],
-                                settings[VarNames.DATA_DIR.value] + "/train.tsv",
-                                self)
+        # Flushes of corrections only request training, which runs on its own thread
+        self.correction_buffer = CorrectionBuffer(
+            settings[VarNames.PUBSUB_DATA_TEMP_FILE.value],
+            settings[VarNames.LEARNING_MESSAGE_THRESHOLD.value],
+            lambda batch_path: self.training_scheduler.request(),
+            max_age=settings[VarNames.CORRECTION_MAX_AGE_SECONDS.value],
+            fsync_interval=settings[VarNames.CORRECTION_FSYNC_INTERVAL_SECONDS.value],
+            fsync_batch_size=settings[VarNames.CORRECTION_FSYNC_BATCH_SIZE.value]
+        )
+        self.training_scheduler = TrainingScheduler(
+            get_training_job(self.lock, self, self.correction_buffer,
+                             settings[VarNames.TRAINING_MAX_BATCH_ATTEMPTS.value]),
+            debounce=settings[VarNames.TRAINING_DEBOUNCE_SECONDS.value],
+            min_interval=settings[VarNames.TRAINING_MIN_INTERVAL_SECONDS.value],
+            max_staleness=settings[VarNames.TRAINING_MAX_STALENESS_SECONDS.value]
+        )
+        self.correction_buffer.start()
+        batch_max_messages = settings[VarNames.PUBSUB_BATCH_MAX_MESSAGES.value]
+        if batch_max_messages:
+            callback = get_batch_callback(self.correction_buffer)
+        else:
+            callback = get_callback(self.correction_buffer)
 
+        # Limits the messages leased at once, so that they are acknowledged before their leases expire
         subscriber, streaming_pull_future = subscribe_to_topic(
             pubsub_host,
             pubsub_project_id,
             pubsub_subscription_id,
             pubsub_subscription_topic_id,
             callback,
-            unique_subscription_name=True
+            unique_subscription_name=True,
+            flow_control=types.FlowControl(
+                max_messages=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_MESSAGES.value],
+                max_bytes=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_BYTES.value],
+                max_lease_duration=settings[VarNames.PUBSUB_FLOW_CONTROL_MAX_LEASE_SECONDS.value]
+            ),
+            callback_workers=settings[VarNames.PUBSUB_CALLBACK_WORKERS.value],
+            batch_max_messages=batch_max_messages,
+            batch_max_latency=settings[VarNames.PUBSUB_BATCH_MAX_LATENCY_SECONDS.value]
         )
         self.publish_topic = subscriber.topic_path(
             pubsub_project_id,
@@ -139,58 +243,53 @@ class LearningApp(FastAPI):
 
         prometheus_client.start_http_server(9010)
         # train_and_send(self)
-        bucket_auth = (
+        object_store = get_object_store(
+            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
             settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
             settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
             settings[VarNames.OBJECT_STORAGE_TLS.value]
         )
-        success = download_model(
-            settings[VarNames.CLASSIFIER_LOCAL_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.CLASSIFIER_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        success = success and download_model(
-            settings[VarNames.PREPROCESSOR_DATA_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_DATA_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        success = success and download_model(
-            settings[VarNames.PREPROCESSOR_LABELS_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_LABELS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        success = success and download_model(
-            settings[VarNames.PREPROCESSOR_VAL_DATA_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_VAL_DATA_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        success = success and download_model(
-            settings[VarNames.PREPROCESSOR_VAL_LABELS_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_VAL_LABELS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
-        )
-        success = success and download_model(
-            settings[VarNames.STATISTICS_PATH.value],
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.STATISTICS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *bucket_auth
+        # Artifacts which are already on disk are not downloaded again
+        object_store.cache = ArtifactCache(
+            settings[VarNames.ARTIFACT_CACHE_DIR.value],
+            settings[VarNames.ARTIFACT_CACHE_MAX_BYTES.value]
         )
+        artifacts = {
+            settings[VarNames.CLASSIFIER_OBJECT_KEY.value]:
+                settings[VarNames.CLASSIFIER_LOCAL_PATH.value],
+            settings[VarNames.PREPROCESSOR_DATA_OBJECT_KEY.value]:
+                settings[VarNames.PREPROCESSOR_DATA_PATH.value],
+            settings[VarNames.PREPROCESSOR_LABELS_OBJECT_KEY.value]:
+                settings[VarNames.PREPROCESSOR_LABELS_PATH.value],
+            settings[VarNames.PREPROCESSOR_VAL_DATA_OBJECT_KEY.value]:
+                settings[VarNames.PREPROCESSOR_VAL_DATA_PATH.value],
+            settings[VarNames.PREPROCESSOR_VAL_LABELS_OBJECT_KEY.value]:
+                settings[VarNames.PREPROCESSOR_VAL_LABELS_PATH.value],
+            settings[VarNames.STATISTICS_OBJECT_KEY.value]:
+                settings[VarNames.STATISTICS_PATH.value],
+        }
+        # Artifacts are downloaded concurrently, all from the latest bundle
+        manifest = read_manifest(object_store, settings[VarNames.BUCKET_NAME.value],
+                                 settings[VarNames.MODEL_BUNDLE_POINTER_KEY.value],
+                                 legacy_names=list(artifacts))
+        # Bundles published before the token table existed do not contain it
+        tokens_key = settings[VarNames.PREPROCESSOR_TOKENS_OBJECT_KEY.value]
+        if manifest is not None and tokens_key in manifest["artifacts"]:
+            artifacts[tokens_key] = os.path.join(
+                os.path.dirname(settings[VarNames.PREPROCESSOR_DATA_PATH.value]),
+                PREPROCESSOR_TOKENS_FILE_NAME
+            )
+        success = manifest is not None and fetch_bundle(
+            object_store, settings[VarNames.BUCKET_NAME.value], manifest, artifacts)
         
         if success :
             print('ok!')
             self.model = load_model(settings[VarNames.CLASSIFIER_LOCAL_PATH.value])
             update_scores_from_file(settings[VarNames.STATISTICS_PATH.value])
+
+        # Batches of corrections which were not learned before a restart are learned first
+        self.training_scheduler.start()
+        self.correction_buffer.recover_batches()
         
         # Create a new thread for the blocking Pub/Sub call and start it
         pubsub_thread = Thread(target=get_result, args=(streaming_pull_future,), daemon=True)
@@ -207,25 +306,98 @@ def ping():
 
 
 
-@app.get('/api/learn')
+def get_learning_stages(app_object : FastAPI) -> list:
+    """Gets the stages of a full training on the training data from the resources.
+
+    Args:
+        app_object (FastAPI): The app which the trained model should be part of.
+
+    Returns:
+        list[tuple[str, Callable[[], Any]]]: names and functions of the stages
+    """
+    # The model is stored by training, but only published and served by the last stage,
+    # so that a job cancelled before it leaves the served model unchanged
+    trained = {"name": f'{uuid.uuid4()}_model'}
+
+    def store_model(train):
+        def run():
+            trained["classifier"] = train(bucket_upload=False, classifier_name=trained["name"])
+        return run
+
+    def publish():
+        # Raises when the bundle could not be uploaded, failing the job before the model is served
+        publish_model(trained["name"])
+        app_object.model = trained["classifier"]
+        with open(
+            os.path.join(
+                OUTPUT_PATH,
+                "evaluation.json"
+            ),
+            'r',
+            encoding='utf-8'
+            ) as f:
+            evaluation_data = json.load(f)
+        app_object.publish_client.publish(app_object.publish_topic, b'New model available')
+        return {
+            "name": settings[VarNames.MODEL_OBJECT_KEY.value],
+            "evaluation": evaluation_data
+        }
+
+    if settings[VarNames.TRAINING_MODE.value] == TRAINING_MODE_STREAMING:
+        training_stages = [("train", store_model(streaming_main))]
+    else:
+        training_stages = [("preprocess", preprocess_main),
+                           ("train", store_model(classification_main))]
+    return [("copy_data", copy_data_from_resources)] + training_stages + [("publish", publish)]
+
+
+def get_job_or_404(job_id : str):
+    """Gets a training job, failing the request when it is unknown.
+
+    Args:
+        job_id (str): id of the job
+    """
+    job = app.training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Training job not found",
+            headers={"X-Error": "Training job not found"},
+        )
+    return job
+
+
+@app.get('/api/learn', status_code=202)
 def learn():
     """
-    Used to execute learning on the training data from the resources.
-    """
-    copy_data_from_resources()
-    preprocess_main()
-    app.model = classification_main(bucket_upload=True)
-    with open(
-        os.path.join(
-            OUTPUT_PATH,
-            "evaluation.json"
-        ),
-        'r',
-        encoding='utf-8'
-        ) as f:
-        evaluation_data = json.load(f)
-    app.publish_client.publish(app.publish_topic, b'New model available')
-    return {
-        "name": settings[VarNames.MODEL_OBJECT_KEY.value],
-        "evaluation": evaluation_data
-    }
+    Starts learning on the training data from the resources, in the background.
+    While a training job is queued or running, that job is returned instead of a new one.
+    """
+    job, created = app.training_jobs.submit(get_learning_stages(app))
+    return {**job.to_dict(), "created": created}
+
+
+@app.get('/api/learn/jobs')
+def learning_jobs():
+    """
+    Lists the recent training jobs, oldest first.
+    """
+    return [job.to_dict() for job in app.training_jobs.jobs()]
+
+
+@app.get('/api/learn/jobs/{job_id}')
+def learning_job(job_id : str):
+    """
+    Gets the status, the progress of every stage and the evaluation of a training job.
+    """
+    return get_job_or_404(job_id).to_dict()
+
+
+@app.delete('/api/learn/jobs/{job_id}')
+def cancel_learning_job(job_id : str):
+    """
+    Cancels a training job. A running job stops before its next stage.
+    """
+    job = get_job_or_404(job_id)
+    app.training_jobs.cancel(job.id)
+    return job.to_dict()
@@ -0,0 +1,90 @@
+"""
+Provides a featurizer sharding titles across a pool of processes.
+The fitted preprocessor and token normalizer are sent to every worker
+once, when the worker starts, and each worker normalizes and vectorizes
+whole shards of titles, so that only titles and sparse matrices are exchanged.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import scipy.sparse as sp
+
+from common.sharding import MIN_TITLES_PER_SHARD, split_into_shards
+
+_WORKER_STATE = {}
+
+
+def _init_worker(preprocessor, normalizer):
+    """Keeps the preprocessor and normalizer in a worker process."""
+    _WORKER_STATE['preprocessor'] = preprocessor
+    _WORKER_STATE['normalizer'] = normalizer
+
+
+def _featurize(preprocessor, normalizer, titles : list):
+    """Normalizes and vectorizes titles, titles are kept as they are without normalizer."""
+    if normalizer is not None:
+        titles = normalizer.normalize(titles)
+    return preprocessor.transform(titles)
+
+
+def _featurize_in_worker(titles : list):
+    """Normalizes and vectorizes titles with the preprocessor of the worker process."""
+    return _featurize(_WORKER_STATE['preprocessor'], _WORKER_STATE['normalizer'], titles)
+
+
+class ParallelFeaturizer:
+    """Featurizer of titles with a fitted preprocessor kept in memory.
+
+    Batches of titles are split into shards which are featurized
+    by a pool of processes, and the results are stacked in order.
+    The pool is started on first use, and stopped by `close`.
+
+    Args:
+        preprocessor (TfidfVectorizer | HashingTfidfVectorizer): fitted preprocessor
+        normalizer (TextNormalizer | None): normalizer of the titles,
+                    None vectorizes the titles as they are
+        n_jobs (int, optional): number of processes, 1 featurizes
+                    in the current process. Defaults to 1.
+        shard_size (int, optional): minimum number of titles of a shard.
+                    Defaults to MIN_TITLES_PER_SHARD.
+    """
+
+    def __init__(self, preprocessor, normalizer, n_jobs : int = 1,
+                 shard_size : int = MIN_TITLES_PER_SHARD):
+        self.preprocessor = preprocessor
+        self.normalizer = normalizer
+        self.n_jobs = n_jobs
+        self.shard_size = shard_size
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def transform(self, titles) -> sp.csr_matrix:
+        """Normalizes and vectorizes titles.
+
+        Args:
+            titles (Iterable[str]): titles of StackOverflow questions
+
+        Returns:
+            sp.csr_matrix: the features of the titles
+        """
+        titles = list(titles)
+        shards = split_into_shards(titles, self.n_jobs, self.shard_size)
+        if len(shards) <= 1:
+            return _featurize(self.preprocessor, self.normalizer, titles)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                initializer=_init_worker,
+                initargs=(self.preprocessor, self.normalizer)
+            )
+        return sp.vstack(list(self._executor.map(_featurize_in_worker, shards)), format='csr')
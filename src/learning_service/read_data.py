@@ -1,6 +1,7 @@
 """
 File that presents and shows information about data and statistics about it.
 """
+import gc
 import os
 from ast import literal_eval
 
@@ -15,8 +16,80 @@ DATASET_DIR = settings[VarNames.DATASET_FOR_TRAINING_DIR.value]
 TRAIN_DATA_FILE = 'train.tsv'
 VALIDATION_DATA_FILE = 'validation.tsv'
 TEST_DATA_FILE = 'test.tsv'
+PARQUET_EXTENSION = '.parquet'
 MAIN_COLOR = 94
 
+def parse_tags(values) -> list:
+    """Parses tag lists written as Python lists, such as `['c#', 'asp.net']`.
+
+    Lists of plainly quoted tags are split directly, any other syntax
+    is left to `ast.literal_eval`. The garbage collector is paused while
+    the lists are created, as it would otherwise repeatedly scan all of them.
+
+    Args:
+        values (Iterable[str]): the tag lists
+
+    Returns:
+        list[list[str]]: the parsed tags of every value
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        tags = []
+        append = tags.append
+        for value in values:
+            inner = value[2:-2]
+            if value[:2] == "['" and value[-2:] == "']" and '"' not in value \
+                    and '\\' not in value and "'" not in inner.replace("', '", ''):
+                append(inner.split("', '"))
+            elif value == '[]':
+                append([])
+            else:
+                append(literal_eval(value))
+        return tags
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def columnar_path(filename: str, root_path=DATASET_DIR) -> str:
+    """Gets the path of the columnar copy of a data file.
+
+    Args:
+        filename (str): name of the data file.
+        root_path (str, optional): root path where the file should be found.
+                            Defaults to DATASET_DIR.
+
+    Returns:
+        str: the path of the Parquet file
+    """
+    return os.path.join(root_path, os.path.splitext(filename)[0] + PARQUET_EXTENSION)
+
+def convert_data_to_columnar(filename: str, sep='\t', root_path=DATASET_DIR) -> str:
+    """Converts a labeled data file once into Parquet, with a native list column of tags.
+
+    Args:
+        filename (str): name of the data file.
+        sep (str, optional): delimiter for file. Defaults to '\t'.
+        root_path (str, optional): root path where the file should be found.
+                            Defaults to DATASET_DIR.
+
+    Returns:
+        str: the path of the Parquet file
+    """
+    path = columnar_path(filename, root_path)
+    data = read_data_from_file(filename, sep=sep, root_path=root_path, columnar=False)
+    temp_path = f'{path}.tmp'
+    data.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+    return path
+
+def _read_columnar(path: str, columns) -> pd.DataFrame:
+    """Reads columns of a Parquet data file, with tags as lists."""
+    data = pd.read_parquet(path, columns=list(columns))
+    if 'tags' in data:
+        data['tags'] = [list(tags) for tags in data['tags']]
+    return data
+
 def read_unlabeled_data_from_file(filename: str, sep='\t', root_path=DATASET_DIR):
     """Reads unlabeled data from a file.
 
@@ -24,13 +97,7 @@ def read_unlabeled_data_from_file(filename: str, sep='\t', root_path=DATASET_DIR
         filename (str): File to be read from.
         sep (str, optional): File separator. Defaults to '\t'.
     """
-    data = pd.read_csv(
-        os.path.join(root_path, filename),
-        sep=sep,
-        dtype={'title': 'str'}
-    )
-    data = data[["title"]]
-    return data
+    return read_data_from_file(filename, sep=sep, root_path=root_path, columns=("title",))
 
 def read_labeled_data(filename: str, sep='\t') :
     """Reads labeled data from a file.
@@ -45,27 +112,70 @@ def read_labeled_data(filename: str, sep='\t') :
     data = read_data_from_file(filename, sep=sep)
     return data
 
-def read_data_from_file(filename: str, sep='\t', root_path=DATASET_DIR):
+def read_data_from_file(filename: str, sep='\t', root_path=DATASET_DIR,
+                        columns=("title", "tags"), columnar=None):
     """Loads data from a file.
 
     Args:
-        filename (str): name of a file to be loaded.
+        filename (str): name of a file to be loaded, a Parquet file is read as such.
         sep (str, optional): delimiter for file. Defaults to '\t'.
         root_path (_type_, optional): root path where the file should be found.
                             Defaults to DATASET_DIR.
+        columns (tuple[str], optional): columns to load. Defaults to ("title", "tags").
+        columnar (bool, optional): whether a columnar copy of the file is kept up to date
+                            and read instead. Defaults to None, using the configured option.
 
     Returns:
         pd.DataFrame: pandas' DataFrame of StackOverflow's titles and tags
     """
+    path = os.path.join(root_path, filename)
+    if filename.endswith(PARQUET_EXTENSION):
+        return _read_columnar(path, columns)
+    if columnar is None:
+        columnar = settings[VarNames.DATASET_COLUMNAR_COPY.value]
+    if columnar and 'tags' in columns:
+        parquet_path = columnar_path(filename, root_path)
+        if not os.path.isfile(parquet_path) \
+                or os.path.getmtime(parquet_path) < os.path.getmtime(path):
+            convert_data_to_columnar(filename, sep=sep, root_path=root_path)
+        return _read_columnar(parquet_path, columns)
+
     data = pd.read_csv(
-        os.path.join(root_path, filename),
+        path,
         sep=sep,
-        dtype={'title': 'str', 'tags': 'str'}
+        dtype={column: 'str' for column in columns},
+        usecols=list(columns)
     )
-    data = data[["title", "tags"]]
-    data['tags'] = data['tags'].apply(literal_eval)
+    data = data[list(columns)]
+    if 'tags' in data:
+        data['tags'] = parse_tags(data['tags'].values)
     return data
 
+def read_data_in_chunks(filename: str, chunk_size: int, sep='\t', root_path=DATASET_DIR):
+    """Loads data from a file in chunks, so that only one chunk is held in memory.
+
+    Args:
+        filename (str): name of a file to be loaded.
+        chunk_size (int): number of rows of every chunk.
+        sep (str, optional): delimiter for file. Defaults to '\t'.
+        root_path (str, optional): root path where the file should be found.
+                            Defaults to DATASET_DIR.
+
+    Yields:
+        pd.DataFrame: pandas' DataFrame of StackOverflow's titles and tags of a chunk
+    """
+    with pd.read_csv(
+        os.path.join(root_path, filename),
+        sep=sep,
+        dtype={'title': 'str', 'tags': 'str'},
+        usecols=["title", "tags"],
+        chunksize=chunk_size
+    ) as reader:
+        for data in reader:
+            data = data[["title", "tags"]]
+            data['tags'] = parse_tags(data['tags'].values)
+            yield data
+
 def display_data_schema(filename: str):
     """Display schema information for a given data file.
 
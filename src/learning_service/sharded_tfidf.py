@@ -0,0 +1,99 @@
+"""
+Provides a sharded fit of TF-IDF vectorizers.
+Worker processes count the document frequencies of the n-grams of corpus shards,
+the partial counts are merged, and the `min_df`/`max_df` pruning is applied
+to the merged counts, giving the same vocabulary and IDF as a single fit.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from numbers import Integral
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+
+from common.sharding import MIN_TITLES_PER_SHARD, split_into_shards
+
+
+def _count_document_frequencies(params : dict, titles : list):
+    """Counts in how many titles of a shard every n-gram occurs.
+
+    Args:
+        params (dict): parameters of the CountVectorizer analyzing the titles
+        titles (list[str]): the shard of titles
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: the n-grams and their document frequencies
+    """
+    counter = CountVectorizer(**params, binary=True, min_df=1, max_df=1.0, max_features=None)
+    counts = counter.fit_transform(titles)
+    terms = np.empty(len(counter.vocabulary_), dtype=object)
+    for term, index in counter.vocabulary_.items():
+        terms[index] = term
+    return terms, np.bincount(counts.indices, minlength=len(terms))
+
+
+def fit_sharded(vectorizer : TfidfVectorizer, titles, n_jobs : int,
+                shard_size : int = MIN_TITLES_PER_SHARD) -> TfidfVectorizer:
+    """Fits a TF-IDF vectorizer by counting document frequencies of shards in parallel.
+
+    Small corpora, single jobs and vectorizers limiting the number of features,
+    which needs term frequencies, are fitted with a single `fit`.
+
+    Args:
+        vectorizer (TfidfVectorizer): the vectorizer to fit
+        titles (Iterable[str]): the corpus
+        n_jobs (int): number of processes
+        shard_size (int, optional): minimum number of titles of a shard.
+                    Defaults to MIN_TITLES_PER_SHARD.
+
+    Returns:
+        TfidfVectorizer: the fitted vectorizer
+    """
+    titles = list(titles)
+    shards = split_into_shards(titles, n_jobs, shard_size)
+    if len(shards) <= 1 or vectorizer.max_features is not None or vectorizer.vocabulary is not None:
+        return vectorizer.fit(titles)
+
+    count_params = {
+        name: value for name, value in vectorizer.get_params().items()
+        if name in CountVectorizer().get_params()
+        and name not in ('binary', 'min_df', 'max_df', 'max_features', 'vocabulary')
+    }
+    n_documents = len(titles)
+    max_doc_count, min_doc_count = (
+        bound if isinstance(bound, Integral) else bound * n_documents
+        for bound in (vectorizer.max_df, vectorizer.min_df)
+    )
+    if max_doc_count < min_doc_count:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        partial_counts = list(executor.map(
+            _count_document_frequencies, [count_params] * len(shards), shards
+        ))
+
+    # Merged counts are sorted by n-gram, which is also the order of the features of a single fit
+    document_frequency = pd.concat([
+        pd.Series(counts, index=terms) for terms, counts in partial_counts
+    ]).groupby(level=0, sort=True).sum()
+    document_frequency = document_frequency[
+        (document_frequency >= min_doc_count) & (document_frequency <= max_doc_count)
+    ]
+    if len(document_frequency) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    vectorizer.vocabulary_ = {term: index for index, term in enumerate(document_frequency.index)}
+    vectorizer.fixed_vocabulary_ = False
+    vectorizer._tfidf = TfidfTransformer(
+        norm=vectorizer.norm,
+        use_idf=vectorizer.use_idf,
+        smooth_idf=vectorizer.smooth_idf,
+        sublinear_tf=vectorizer.sublinear_tf
+    )
+    if vectorizer.use_idf:
+        document_frequency = document_frequency.values.astype(np.float64)
+        smoothing = int(vectorizer.smooth_idf)
+        vectorizer._tfidf.idf_ = np.log(
+            (n_documents + smoothing) / (document_frequency + smoothing)
+        ) + 1
+    return vectorizer
@@ -0,0 +1,172 @@
+"""
+Provides a cache of preprocessing stage outputs.
+A stage is keyed by the hashes of its input files, of the code computing it
+and of its parameters.
+When a stage runs again with unchanged inputs, its output files are
+restored from the cache instead of being computed again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import sklearn
+
+from common.logger import Logger
+from common.model_bundle import file_sha256
+
+# Changes of the stored layout or of the stage outputs invalidate all entries
+CACHE_FORMAT = 1
+MANIFEST_FILE_NAME = 'manifest.json'
+DIGESTS_FILE_NAME = 'digests.json'
+
+
+class StageCache:
+    """Cache of the output files of preprocessing stages.
+
+    Args:
+        directory (str): directory of the cache
+        max_entries (int, optional): number of entries kept for every stage,
+                    the least recently used ones are removed. Defaults to 3.
+        code_paths (list[str], optional): paths of the source files computing the stages,
+                    changes to them invalidate all entries. Defaults to None.
+    """
+
+    def __init__(self, directory : str, max_entries : int = 3, code_paths : list = None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.code_paths = list(code_paths or [])
+        self.hits = 0
+        self.misses = 0
+        self._digests = None
+
+    def _digests_path(self) -> str:
+        return os.path.join(self.directory, DIGESTS_FILE_NAME)
+
+    def file_digest(self, path : str) -> str:
+        """Computes the SHA-256 digest of a file, reusing digests of unchanged files.
+
+        Args:
+            path (str): path of the file
+
+        Returns:
+            str: the hex digest
+        """
+        if self._digests is None:
+            try:
+                with open(self._digests_path(), encoding='utf-8') as f:
+                    self._digests = json.load(f)
+            except (OSError, ValueError):
+                self._digests = {}
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = self._digests.get(os.path.abspath(path))
+        if entry is not None and entry["signature"] == signature:
+            return entry["sha256"]
+        digest = file_sha256(path)
+        self._digests[os.path.abspath(path)] = {"signature": signature, "sha256": digest}
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f'{self._digests_path()}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._digests, f)
+        os.replace(temp_path, self._digests_path())
+        return digest
+
+    def key(self, stage : str, inputs : list, params : dict) -> str:
+        """Computes the key of a stage run.
+
+        Args:
+            stage (str): name of the stage
+            inputs (list[str]): paths of the input files
+            params (dict): JSON serializable parameters of the stage
+
+        Returns:
+            str: the key
+        """
+        description = {
+            "format": CACHE_FORMAT,
+            "sklearn": sklearn.__version__,
+            "stage": stage,
+            "code": [self.file_digest(path) for path in self.code_paths],
+            "inputs": [self.file_digest(path) for path in inputs],
+            "params": params,
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+    def _entry_path(self, stage : str, key : str) -> str:
+        return os.path.join(self.directory, stage, key)
+
+    def run(self, stage : str, inputs : list, params : dict, outputs : dict, function) -> bool:
+        """Runs a stage, unless its outputs for the same inputs and parameters are cached.
+
+        Args:
+            stage (str): name of the stage
+            inputs (list[str]): paths of the input files
+            params (dict): JSON serializable parameters of the stage
+            outputs (dict[str, str]): paths of the output files, by output name.
+                    Outputs which the stage does not create are not cached.
+            function (Callable[[], Any]): function running the stage
+
+        Returns:
+            bool: whether the outputs were restored from the cache
+        """
+        key = self.key(stage, inputs, params)
+        entry = self._entry_path(stage, key)
+        manifest_path = os.path.join(entry, MANIFEST_FILE_NAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            for name in cached:
+                if name in outputs:
+                    _copy_file(os.path.join(entry, name), outputs[name])
+            os.utime(manifest_path)
+            self.hits += 1
+            Logger.info(f'Stage {stage} is unchanged, restored {", ".join(cached)} ✔️')
+            return True
+
+        self.misses += 1
+        function()
+        self._store(stage, entry, outputs)
+        return False
+
+    def _store(self, stage : str, entry : str, outputs : dict):
+        """Copies the outputs of a stage into a new entry."""
+        temp_entry = f'{entry}.{uuid.uuid4().hex}.tmp'
+        os.makedirs(temp_entry)
+        stored = []
+        for name, path in outputs.items():
+            if os.path.isfile(path):
+                shutil.copyfile(path, os.path.join(temp_entry, name))
+                stored.append(name)
+        with open(os.path.join(temp_entry, MANIFEST_FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump(stored, f)
+        try:
+            os.replace(temp_entry, entry)
+        except OSError:
+            # Another run stored the same entry in the meantime
+            shutil.rmtree(temp_entry, ignore_errors=True)
+        self._evict(stage)
+
+    def _evict(self, stage : str):
+        """Removes the least recently used entries of a stage over the limit."""
+        stage_directory = os.path.join(self.directory, stage)
+        entries = []
+        for name in os.listdir(stage_directory):
+            manifest_path = os.path.join(stage_directory, name, MANIFEST_FILE_NAME)
+            if os.path.isfile(manifest_path):
+                entries.append((os.path.getmtime(manifest_path), name))
+        for _, name in sorted(entries, reverse=True)[self.max_entries:]:
+            shutil.rmtree(os.path.join(stage_directory, name), ignore_errors=True)
+
+
+def _copy_file(source : str, destination : str):
+    """Copies a file, replacing the destination atomically."""
+    directory = os.path.dirname(destination)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f'{destination}.{uuid.uuid4().hex}.tmp'
+    shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
@@ -0,0 +1,173 @@
+"""
+Train the model out of core.
+The training data is read in chunks, featurized chunk by chunk and fed
+to `partial_fit` of the classifier, so that the memory used for the data
+is bounded by the chunk and shuffle buffer sizes instead of the dataset size.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from joblib import dump, parallel_backend
+from sklearn.linear_model import SGDClassifier
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from common.logger import Logger
+from learning_service.config import settings, VarNames
+from learning_service.read_data import read_data_from_file, read_data_in_chunks, DATASET_DIR
+from learning_service.text_classification import evaluate_and_store, partial_fit_classifier, \
+    VALIDATION_DATA_FILE_PATH
+from learning_service.text_preprocessing import create_bag_of_words_preprocessor, \
+    create_text_normalizer, prepare_data_from_processor, prepare_labels, \
+    FEATURIZER_MODE_HASHING, PREPROCESSOR_DATA_FILE_NAME, PREPROCESSOR_LABELS_FILE_NAME, \
+    PREPROCESSOR_TOKENS_FILE_NAME
+
+OUTPUT_PATH = settings[VarNames.OUTPUT_DIR.value]
+SHUFFLE_SEED = 12321
+
+
+def shuffled_batches(chunks, buffer_size : int, rng : np.random.Generator):
+    """Shuffles a stream of chunks through a bounded buffer.
+
+    Every incoming chunk is added to the buffer, and once the buffer holds more
+    than `buffer_size` rows, the excess is emitted as a batch of randomly drawn rows.
+    The remaining rows are emitted at the end of the stream.
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): the chunks of data
+        buffer_size (int): number of rows kept back for shuffling
+        rng (np.random.Generator): random number generator
+
+    Yields:
+        pd.DataFrame: batches of shuffled rows
+    """
+    buffer = None
+    for chunk in chunks:
+        buffer = chunk if buffer is None else pd.concat([buffer, chunk], ignore_index=True)
+        buffer = buffer.iloc[rng.permutation(len(buffer))].reset_index(drop=True)
+        if len(buffer) > buffer_size:
+            yield buffer.iloc[buffer_size:]
+            buffer = buffer.iloc[:buffer_size]
+    if buffer is not None and len(buffer) > 0:
+        yield buffer
+
+
+def fit_preprocessors(train_file : str, chunk_size : int, min_df=5, max_df=0.8,
+                      root_path=DATASET_DIR):
+    """Fits the data and labels preprocessors with one pass over the training data.
+    Features are hashed, so that the data preprocessor can be fitted chunk by chunk.
+
+    Args:
+        train_file (str): name of the training data file
+        chunk_size (int): number of rows read at once
+        min_df (int, optional): minimum document frequency of a feature. Defaults to 5.
+        max_df (float, optional): maximum document frequency of a feature. Defaults to 0.8.
+        root_path (str, optional): root path where the file should be found.
+                    Defaults to DATASET_DIR.
+
+    Returns:
+        tuple[HashingTfidfVectorizer, MultiLabelBinarizer, int]: the preprocessors
+                    and the number of training samples
+    """
+    preprocessor = create_bag_of_words_preprocessor(min_df, max_df, FEATURIZER_MODE_HASHING)
+    tags = set()
+    n_samples = 0
+    for chunk in read_data_in_chunks(train_file, chunk_size, root_path=root_path):
+        preprocessor.partial_fit(chunk['title'])
+        for chunk_tags in chunk['tags']:
+            tags.update(chunk_tags)
+        n_samples += len(chunk)
+    mlb = MultiLabelBinarizer(classes=sorted(tags))
+    mlb.fit([])
+    return preprocessor, mlb, n_samples
+
+
+def train_classifier_streaming(train_file : str, preprocessor, mlb : MultiLabelBinarizer,
+                               chunk_size : int, epochs : int, buffer_size : int,
+                               penalty='l1', root_path=DATASET_DIR):
+    """Trains a OneVsRest SGD classifier with passes over chunks of the training data.
+
+    Args:
+        train_file (str): name of the training data file
+        preprocessor (HashingTfidfVectorizer): fitted data preprocessor
+        mlb (MultiLabelBinarizer): fitted labels preprocessor
+        chunk_size (int): number of rows read at once
+        epochs (int): number of passes over the training data
+        buffer_size (int): number of rows of the shuffle buffer
+        penalty (str, optional): penalty for training, possible values are:
+                {'l1', 'l2', 'elasticnet', 'none'}. Defaults to 'l1'.
+        root_path (str, optional): root path where the file should be found.
+                    Defaults to DATASET_DIR.
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    classifier = OneVsRestClassifier(SGDClassifier(penalty=penalty), n_jobs=-1)
+    rng = np.random.default_rng(SHUFFLE_SEED)
+    Logger.info(f'Training on {train_file} in {epochs} epochs')
+    # The estimators are updated in threads, instead of being copied to processes for every batch
+    with parallel_backend('threading'):
+        for epoch in range(epochs):
+            batches = shuffled_batches(
+                read_data_in_chunks(train_file, chunk_size, root_path=root_path), buffer_size, rng
+            )
+            for batch in batches:
+                partial_fit_classifier(
+                    classifier,
+                    preprocessor.transform(batch['title']),
+                    mlb.transform(batch['tags'])
+                )
+            Logger.info(f'Epoch {epoch + 1}/{epochs} done ✔️')
+    Logger.info('Training done ✔️')
+    return classifier
+
+
+def main(bucket_upload=False, train_file="train.tsv", val_file="validation.tsv",
+         classifier_name=None):
+    """Main function to preprocess the data and train the model out of core.
+
+    Args:
+        bucket_upload (bool, optional): determined if the model should
+                be uploaded to a bucket. Defaults to False.
+        train_file (str, optional): name of the training data file. Defaults to "train.tsv".
+        val_file (str, optional): name of the validation data file. Defaults to "validation.tsv".
+        classifier_name (str, optional): name of the stored model, see `evaluate_and_store`.
+                Defaults to None.
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    chunk_size = settings[VarNames.STREAMING_CHUNK_SIZE.value]
+    if not os.path.exists(OUTPUT_PATH):
+        os.makedirs(OUTPUT_PATH)
+
+    preprocessor, mlb, n_samples = fit_preprocessors(train_file, chunk_size)
+    Logger.info(f'Fitted preprocessors on {n_samples} samples with {len(mlb.classes_)} tags')
+    dump(preprocessor, os.path.join(OUTPUT_PATH, PREPROCESSOR_DATA_FILE_NAME))
+    dump(mlb, os.path.join(OUTPUT_PATH, PREPROCESSOR_LABELS_FILE_NAME))
+    # The training words are not collected into a table, they are memoized on use instead
+    dump({stemming: create_text_normalizer(stemming) for stemming in (False, True)},
+         os.path.join(OUTPUT_PATH, PREPROCESSOR_TOKENS_FILE_NAME))
+
+    validation_data = read_data_from_file(val_file)
+    dump(
+        prepare_data_from_processor(validation_data['title'], OUTPUT_PATH),
+        VALIDATION_DATA_FILE_PATH
+    )
+    prepare_labels(validation_data['tags'], mlb, OUTPUT_PATH, labels_name="val")
+
+    classifier = train_classifier_streaming(
+        train_file,
+        preprocessor,
+        mlb,
+        chunk_size,
+        settings[VarNames.STREAMING_EPOCHS.value],
+        settings[VarNames.STREAMING_SHUFFLE_BUFFER_SIZE.value]
+    )
+    return evaluate_and_store(classifier, bucket_upload=bucket_upload,
+                              classifier_name=classifier_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Fixtures shared by the tests of the learning service."""
+import os
+
+import pytest
+
+from learning_service.read_data import read_data_from_file
+from learning_service.text_preprocessing import create_bag_of_words_preprocessor, \
+    FEATURIZER_MODE_TFIDF
+
+
+@pytest.fixture(scope="session")
+def data_dir():
+    """Directory of the datasets."""
+    return os.path.join(
+        os.path.dirname(
+            os.path.dirname(
+                os.path.abspath(__file__)
+            )
+        ),
+        "data"
+    )
+
+
+@pytest.fixture(scope="session")
+def validation_data(data_dir):
+    """Validation dataset, read once and shared by all tests, which must not modify it."""
+    return read_data_from_file("validation.tsv", root_path=data_dir)
+
+
+@pytest.fixture(scope="session")
+def fit_tfidf():
+    """Fits TF-IDF vectorizers configured like the preprocessor of the pipeline.
+
+    Returns:
+        Callable[[Iterable[str], int | float, int | float], tuple]: function fitting
+                    a vectorizer on titles with the given `min_df` and `max_df`,
+                    returning the vectorizer and the features of the titles
+    """
+    def fit(titles, min_df=5, max_df=0.9):
+        vectorizer = create_bag_of_words_preprocessor(min_df, max_df, FEATURIZER_MODE_TFIDF)
+        return vectorizer, vectorizer.fit_transform(titles)
+    return fit
@@ -0,0 +1,312 @@
+"""Tests for the pooled object storage client and the artifact cache."""
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from minio.error import S3Error
+
+from common.artifact_cache import ArtifactCache
+from common.bucket import ObjectStore
+from common.model_bundle import fetch_bundle, publish_bundle, read_manifest
+
+
+class FakeStat:
+    """Object metadata returned by `stat_object`."""
+
+    def __init__(self, etag, size):
+        self.etag = etag
+        self.size = size
+
+
+class FakeS3Client:
+    """In-process stand-in for the Minio client, storing objects in a dict."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.buckets = {}
+        self.bucket_checks = 0
+        self.downloads = 0
+        self.corrupt = False
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _error(self, code, bucket_name, object_name):
+        return S3Error(code=code, message=code, resource=object_name, request_id=None,
+                       host_id=None, response=None, bucket_name=bucket_name,
+                       object_name=object_name)
+
+    def _transfer(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+
+    def bucket_exists(self, bucket_name):
+        """Fake bucket existence check."""
+        self.bucket_checks += 1
+        return bucket_name in self.buckets
+
+    def make_bucket(self, bucket_name):
+        """Fake bucket creation."""
+        self.buckets[bucket_name] = {}
+
+    def fput_object(self, bucket_name, object_name, file_path):
+        """Fake upload."""
+        self._transfer()
+        with open(file_path, 'rb') as f:
+            self.buckets[bucket_name][object_name] = f.read()
+
+    def fget_object(self, bucket_name, object_name, file_path, request_headers=None):
+        """Fake download."""
+        self._transfer()
+        self.downloads += 1
+        if object_name not in self.buckets[bucket_name]:
+            raise self._error('NoSuchKey', bucket_name, object_name)
+        if request_headers and request_headers['If-Match'] != f'"{self.etag(bucket_name, object_name)}"':
+            raise self._error('PreconditionFailed', bucket_name, object_name)
+        with open(file_path, 'wb') as f:
+            data = self.buckets[bucket_name][object_name]
+            f.write(data[::-1] if self.corrupt else data)
+
+    def put_object(self, bucket_name, object_name, data, length, content_type=None):
+        """Fake upload from memory."""
+        self.buckets[bucket_name][object_name] = data.read(length)
+
+    def get_object(self, bucket_name, object_name):
+        """Fake download into memory."""
+        if object_name not in self.buckets.get(bucket_name, {}):
+            raise self._error('NoSuchKey', bucket_name, object_name)
+        response = io.BytesIO(self.buckets[bucket_name][object_name])
+        response.release_conn = lambda: None
+        return response
+
+    def etag(self, bucket_name, object_name):
+        """Fake ETag of an object, the MD5 of single part uploads."""
+        return hashlib.md5(self.buckets[bucket_name][object_name]).hexdigest()
+
+    def stat_object(self, bucket_name, object_name):
+        """Fake metadata request."""
+        if object_name not in self.buckets.get(bucket_name, {}):
+            raise self._error('NoSuchKey', bucket_name, object_name)
+        return FakeStat(self.etag(bucket_name, object_name),
+                        len(self.buckets[bucket_name][object_name]))
+
+
+def write_file(path, data):
+    """Writes bytes to a local file."""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_file(path):
+    """Reads bytes from a local file."""
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class ObjectStoreTest(unittest.TestCase):
+    """Testing the object storage client against an in-process fake"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeS3Client(delay=0.05)
+        self.store = ObjectStore(self.client, max_workers=4)
+        self.files = []
+        for i in range(4):
+            path = os.path.join(self.directory, f'artifact_{i}.joblib')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f'artifact {i}')
+            self.files.append((path, f'artifact_{i}.joblib'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_transfers_run_concurrently(self):
+        """All artifacts are transferred at once, and downloaded back intact."""
+        self.assertTrue(self.store.upload_many('models', self.files))
+        self.assertEqual(self.client.max_active, 4)
+
+        self.client.max_active = 0
+        downloads = [(path + '.downloaded', name) for path, name in self.files]
+        self.assertTrue(self.store.download_many('models', downloads))
+        self.assertEqual(self.client.max_active, 4)
+        for (path, _), (downloaded, _) in zip(self.files, downloads):
+            with open(path, encoding='utf-8') as f, open(downloaded, encoding='utf-8') as g:
+                self.assertEqual(f.read(), g.read())
+
+    def test_bucket_existence_is_cached(self):
+        """The bucket is checked once, not before every transfer."""
+        self.store.upload_many('models', self.files)
+        self.store.download_many('models', self.files)
+        self.assertEqual(self.client.bucket_checks, 1)
+
+    def test_missing_objects_fail(self):
+        """A failed transfer is reported without raising."""
+        self.assertFalse(self.store.download_many('models', self.files))
+        self.store.upload_many('models', self.files[:2])
+        self.assertFalse(self.store.download_many('models', self.files))
+        self.assertIsNone(self.store.get_version('models', 'missing.joblib'))
+
+    def test_versioned_download(self):
+        """Downloads of a given version fail once the object changed."""
+        path, name = self.files[0]
+        self.store.upload(path, 'models', name)
+        version = self.store.get_version('models', name)
+        self.assertTrue(self.store.download(path, 'models', name, version=version))
+        self.assertFalse(self.store.download(path, 'models', name, version='outdated'))
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    """Testing that only changed artifacts are downloaded"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeS3Client()
+        self.client.make_bucket('models')
+        self.cache = ArtifactCache(os.path.join(self.directory, 'cache'), max_bytes=100)
+        self.store = ObjectStore(self.client, cache=self.cache)
+        self.local_path = os.path.join(self.directory, 'output', 'model.joblib')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def put(self, name, data):
+        """Stores an object in the fake bucket."""
+        self.client.buckets['models'][name] = data
+
+    def read_local(self):
+        """Reads the downloaded artifact."""
+        with open(self.local_path, 'rb') as f:
+            return f.read()
+
+    def test_unchanged_artifacts_are_not_transferred(self):
+        """A cached version is copied from disk, a changed object is downloaded."""
+        self.put('model.joblib', b'first model')
+        self.assertTrue(self.store.download(self.local_path, 'models', 'model.joblib'))
+        self.assertTrue(self.store.download(self.local_path, 'models', 'model.joblib'))
+        self.assertEqual(self.client.downloads, 1)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.put('model.joblib', b'second model')
+        self.assertTrue(self.store.download(self.local_path, 'models', 'model.joblib'))
+        self.assertEqual(self.client.downloads, 2)
+        self.assertEqual(self.read_local(), b'second model')
+
+    def test_local_changes_do_not_affect_the_cache(self):
+        """Overwriting a downloaded file in place leaves the cached copy intact."""
+        self.put('model.joblib', b'model')
+        self.store.download(self.local_path, 'models', 'model.joblib')
+        with open(self.local_path, 'wb') as f:
+            f.write(b'retrained')
+        self.store.download(self.local_path, 'models', 'model.joblib')
+        self.assertEqual(self.read_local(), b'model')
+
+    def test_corrupted_downloads_are_rejected(self):
+        """Downloads which do not match the ETag are neither cached nor used."""
+        self.put('model.joblib', b'model')
+        self.client.corrupt = True
+        self.assertFalse(self.store.download(self.local_path, 'models', 'model.joblib'))
+        self.assertFalse(os.path.exists(self.local_path))
+        self.assertEqual(self.cache.size(), 0)
+
+    def test_least_recently_used_versions_are_evicted(self):
+        """The cache is kept within its size budget."""
+        for i in range(5):
+            self.put(f'artifact_{i}', bytes([i]) * 40)
+            self.store.download(self.local_path, 'models', f'artifact_{i}')
+        self.assertLessEqual(self.cache.size(), 100)
+        self.assertTrue(os.path.isfile(self.cache.entry_path(self.client.etag('models', 'artifact_4'))))
+        self.assertFalse(os.path.isfile(self.cache.entry_path(self.client.etag('models', 'artifact_0'))))
+
+
+class ModelBundleTest(unittest.TestCase):
+    """Testing publishing and fetching versioned model bundles"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.client = FakeS3Client()
+        self.store = ObjectStore(self.client)
+        self.pointer_key = 'bundles/latest.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def publish(self, contents):
+        """Publishes a bundle of artifacts with the given contents."""
+        artifacts = {}
+        for name, data in contents.items():
+            artifacts[name] = os.path.join(self.directory, name)
+            write_file(artifacts[name], data)
+        return publish_bundle(self.store, 'models', self.pointer_key, artifacts)
+
+    def test_round_trip(self):
+        """Consumers fetch only the artifacts they need from the latest bundle."""
+        manifest = self.publish({'model.joblib': b'model', 'classifier.joblib': b'classifier'})
+        self.assertEqual(read_manifest(self.store, 'models', self.pointer_key), manifest)
+
+        target = os.path.join(self.directory, 'downloaded.joblib')
+        self.assertTrue(fetch_bundle(self.store, 'models', manifest, {'model.joblib': target}))
+        self.assertEqual(read_file(target), b'model')
+        self.assertEqual(self.client.downloads, 1)
+        self.assertFalse(fetch_bundle(self.store, 'models', manifest, {'missing': target}))
+
+    def test_generations_are_not_mixed(self):
+        """Publishing a new bundle never changes the artifacts of an older manifest."""
+        first = self.publish({'model.joblib': b'first model', 'statistics.json': b'{}'})
+        second = self.publish({'model.joblib': b'second model', 'statistics.json': b'{}'})
+        self.assertEqual(read_manifest(self.store, 'models', self.pointer_key), second)
+        # Unchanged artifacts are stored once
+        self.assertEqual(first['artifacts']['statistics.json'],
+                         second['artifacts']['statistics.json'])
+
+        target = os.path.join(self.directory, 'downloaded.joblib')
+        fetch_bundle(self.store, 'models', first, {'model.joblib': target})
+        self.assertEqual(read_file(target), b'first model')
+
+    def test_pointer_is_published_last(self):
+        """A failed artifact upload leaves the previous bundle in place."""
+        first = self.publish({'model.joblib': b'model'})
+        failure = self.client._error('InternalError', 'models', 'model.joblib')
+        with mock.patch.object(self.client, 'fput_object', side_effect=failure):
+            self.assertIsNone(self.publish({'model.joblib': b'new model'}))
+        pointer = json.loads(self.client.buckets['models'][self.pointer_key])
+        self.assertEqual(pointer['manifest'], f'bundles/{first["version"]}.json')
+
+    def test_corrupted_artifacts_are_rejected(self):
+        """Artifacts are checked against the hash in the manifest."""
+        manifest = self.publish({'model.joblib': b'model'})
+        self.client.buckets['models'][manifest['artifacts']['model.joblib']['key']] = b'modem'
+        target = os.path.join(self.directory, 'downloaded.joblib')
+        self.assertFalse(fetch_bundle(self.store, 'models', manifest, {'model.joblib': target}))
+
+    def test_legacy_artifacts(self):
+        """Artifacts stored under their own keys are read until a bundle is published."""
+        self.client.buckets['models'] = {'model.joblib': b'legacy model', 'classifier.joblib': b'c'}
+        self.assertIsNone(read_manifest(self.store, 'models', self.pointer_key))
+        self.assertIsNone(read_manifest(self.store, 'models', self.pointer_key,
+                                        legacy_names=['model.joblib', 'missing.joblib']))
+        legacy = read_manifest(self.store, 'models', self.pointer_key,
+                               legacy_names=['model.joblib', 'classifier.joblib'])
+        target = os.path.join(self.directory, 'downloaded.joblib')
+        self.assertTrue(fetch_bundle(self.store, 'models', legacy, {'model.joblib': target}))
+        self.assertEqual(read_file(target), b'legacy model')
+
+        # The version changes with the artifacts
+        self.client.buckets['models']['model.joblib'] = b'updated legacy model'
+        updated = read_manifest(self.store, 'models', self.pointer_key,
+                                legacy_names=['model.joblib', 'classifier.joblib'])
+        self.assertNotEqual(updated["version"], legacy["version"])
+
+        manifest = self.publish({'model.joblib': b'model', 'classifier.joblib': b'classifier'})
+        self.assertEqual(read_manifest(self.store, 'models', self.pointer_key,
+                                       legacy_names=['model.joblib']), manifest)
@@ -0,0 +1,71 @@
+"""Tests for the compiled inference model."""
+import pickle
+import unittest
+
+import numpy as np
+import pytest
+from sklearn.linear_model import SGDClassifier
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import FunctionTransformer, MultiLabelBinarizer
+
+from common.compiled_model import compile_model, top_k_scores
+
+
+class CompiledModelTest(unittest.TestCase):
+    """Testing parity of the compiled model with the scikit-learn pipeline"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data, fit_tfidf):
+        """Fixture to train a model on part of the validation data."""
+        self.validation_data = validation_data
+        train_data = self.validation_data[:5000]
+        self.vectorizer, features = fit_tfidf(train_data['title'])
+        self.label_binarizer = MultiLabelBinarizer()
+        labels = self.label_binarizer.fit_transform(train_data['tags'])
+        self.classifier = OneVsRestClassifier(SGDClassifier(penalty='l1', max_iter=50))
+        self.classifier.fit(features, labels)
+
+    def test_predictions_match_pipeline(self):
+        """The compiled model predicts the same tags as the pipeline on validation.tsv."""
+        pipeline = make_pipeline(
+            self.vectorizer,
+            FunctionTransformer(self.classifier.predict),
+            FunctionTransformer(self.label_binarizer.inverse_transform)
+        )
+        model = compile_model(self.vectorizer, self.classifier, self.label_binarizer)
+        titles = list(self.validation_data['title'].values)
+        self.assertEqual(model.transform(titles), pipeline.transform(titles))
+
+    def test_scores_match_classifier(self):
+        """The single matrix product computes the decision function of every estimator."""
+        model = compile_model(self.vectorizer, self.classifier, self.label_binarizer)
+        titles = list(self.validation_data['title'].values[:1000])
+        expected = self.classifier.decision_function(self.vectorizer.transform(titles))
+        np.testing.assert_allclose(model.decision_function(titles), expected, atol=1e-10)
+
+    def test_pickled_model_predicts(self):
+        """The compiled model survives serialization."""
+        model = compile_model(self.vectorizer, self.classifier, self.label_binarizer)
+        titles = list(self.validation_data['title'].values[:100])
+        self.assertEqual(pickle.loads(pickle.dumps(model)).transform(titles),
+                         model.transform(titles))
+
+    def test_top_k_matches_full_sort(self):
+        """The partial sort selects the same tags as a full sort of the scores."""
+        model = compile_model(self.vectorizer, self.classifier, self.label_binarizer)
+        titles = list(self.validation_data['title'].values[:200])
+        scores = model.decision_function(titles)
+        for title_scores, ranked in zip(scores, model.top_k(titles, k=5)):
+            expected = [model.tags[i] for i in np.argsort(-title_scores, kind='stable')[:5]]
+            self.assertEqual([tag for tag, _ in ranked], expected)
+
+    def test_top_k_thresholds(self):
+        """Global and per-label thresholds filter the selected labels."""
+        scores = np.array([[0.1, -2.0, 3.0, 0.5], [-1.0, -2.0, -3.0, -4.0]])
+        selected = top_k_scores(scores, 2, threshold=0.2)
+        np.testing.assert_array_equal(selected[0][0], [2, 3])
+        self.assertEqual(len(selected[1][0]), 0)
+
+        selected = top_k_scores(scores, 4, threshold=np.array([0.0, 0.0, 5.0, 0.0]))
+        np.testing.assert_array_equal(selected[0][0], [3, 0])
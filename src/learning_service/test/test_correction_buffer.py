@@ -0,0 +1,134 @@
+"""Tests for the buffer of received corrections."""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from learning_service.correction_buffer import CorrectionBuffer
+from learning_service.read_data import read_data_from_file
+
+
+class CorrectionBufferTest(unittest.TestCase):
+    """Testing the write-ahead log, its syncs and the flushes of batches"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.wal_path = os.path.join(self.directory, 'incoming.tsv')
+        self.batches = []
+        self.buffers = []
+
+    def tearDown(self):
+        for buffer in self.buffers:
+            buffer.stop()
+        shutil.rmtree(self.directory)
+
+    def create_buffer(self, threshold=3, **kwargs):
+        """Creates and starts a buffer recording the flushed batches."""
+        buffer = CorrectionBuffer(self.wal_path, threshold, self.batches.append, **kwargs)
+        buffer.start()
+        self.buffers.append(buffer)
+        return buffer
+
+    def read_batch(self, batch_path):
+        """Reads a batch file like training data."""
+        return read_data_from_file(
+            os.path.basename(batch_path), root_path=os.path.dirname(batch_path)
+        )
+
+    def test_flush_at_threshold(self):
+        """A full buffer is rotated into a batch file readable as training data."""
+        buffer = self.create_buffer(threshold=3)
+        buffer.append("How to sort a list\tin python?", ['python'])
+        buffer.append("Center a div", ['html', 'css'])
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(self.batches, [])
+
+        buffer.append("Java streams", ['java'])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(len(self.batches), 1)
+        data = self.read_batch(self.batches[0])
+        self.assertEqual(list(data['title']),
+                         ["How to sort a list in python?", "Center a div", "Java streams"])
+        self.assertEqual(list(data['tags']), [['python'], ['html', 'css'], ['java']])
+
+        buffer.append("Next batch", ['c#'])
+        buffer.sync()
+        self.assertEqual(len(self.read_batch(self.wal_path)), 1)
+
+    def test_acknowledged_once_synced(self):
+        """Corrections are acknowledged in groups, once they are synced."""
+        buffer = self.create_buffer(threshold=100, fsync_interval=60, fsync_batch_size=3)
+        acknowledged = []
+        for index in range(5):
+            buffer.append(f"title {index}", ['python'],
+                          on_durable=lambda i=index: acknowledged.append(i))
+        self.assertEqual(acknowledged, [0, 1, 2])
+        buffer.sync()
+        self.assertEqual(acknowledged, [0, 1, 2, 3, 4])
+
+    def test_extend(self):
+        """Many corrections are appended at once, and acknowledged together."""
+        buffer = self.create_buffer(threshold=100, fsync_interval=60)
+        acknowledged = []
+        buffer.extend([("Center a div", ['html', 'css']), ("Java streams", ['java'])],
+                      on_durable=lambda: acknowledged.append(True))
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(acknowledged, [])
+        buffer.sync()
+        self.assertEqual(acknowledged, [True])
+        self.assertEqual(list(self.read_batch(self.wal_path)['tags']), [['html', 'css'], ['java']])
+
+    def test_flush_by_age(self):
+        """Corrections which waited longer than the maximum age are flushed."""
+        buffer = self.create_buffer(threshold=100, max_age=0.1, fsync_interval=0.02)
+        buffer.append("Old correction", ['python'])
+        deadline = time.monotonic() + 5
+        while not self.batches and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(buffer), 0)
+
+    def test_recovery(self):
+        """Corrections of the log and left over batches survive a restart."""
+        buffer = self.create_buffer(threshold=2)
+        buffer.append("First", ['python'])
+        buffer.append("Second", ['python'])
+        buffer.append("Third", ['java'])
+        buffer.stop()
+        self.buffers.remove(buffer)
+        leftover = self.batches.pop()
+
+        restarted = self.create_buffer(threshold=2)
+        self.assertEqual(len(restarted), 1)
+        restarted.recover_batches()
+        self.assertEqual(self.batches, [leftover])
+        restarted.append("Fourth", ['java'])
+        self.assertEqual(list(self.read_batch(self.batches[-1])['title']), ["Third", "Fourth"])
+
+    def test_merge_batches(self):
+        """Batches are merged into one file of corrections, and kept until they are learned."""
+        buffer = self.create_buffer(threshold=2)
+        for index in range(5):
+            buffer.append(f"title {index}", ['python'])
+        self.assertEqual(buffer.pending_batches(), self.batches)
+        self.assertEqual(buffer.merge_batches(self.batches[:1]), self.batches[0])
+
+        merged_path = buffer.merge_batches(self.batches)
+        self.assertEqual(list(self.read_batch(merged_path)['title']),
+                         [f"title {index}" for index in range(4)])
+        self.assertNotIn(merged_path, buffer.pending_batches())
+        self.assertEqual(len(buffer.pending_batches()), 2)
+
+    def test_set_aside(self):
+        """A batch which is set aside is no longer pending, and its error is logged."""
+        buffer = self.create_buffer(threshold=1)
+        buffer.append("title", ['python'])
+        try:
+            raise ValueError("Only one class present in y_true")
+        except ValueError as error:
+            failed_path = buffer.set_aside(self.batches[0], error)
+        self.assertEqual(buffer.pending_batches(), [])
+        self.assertEqual(list(self.read_batch(failed_path)['title']), ["title"])
+        with open(failed_path[:-len('.tsv')] + '.log', encoding='utf-8') as log:
+            self.assertIn("Only one class present in y_true", log.read())
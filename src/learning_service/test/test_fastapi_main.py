@@ -1,6 +1,23 @@
 """Basic test for inference service."""
+import glob
+import os
+import shutil
+import tempfile
+import time
 import unittest
+from threading import Event, Lock
+from unittest import mock
+
 import pytest
+
+from fastapi.testclient import TestClient
+
+from common.bucket import ObjectStore
+from common.pubsub import encode_corrections
+from learning_service.config import settings, VarNames
+from learning_service import text_classification
+from learning_service.correction_buffer import CorrectionBuffer
+from learning_service.test.test_bucket import FakeS3Client
 #from fastapi.testclient import TestClient
 #from learning_service.main import app
 
@@ -22,3 +39,275 @@ class MainTest(unittest.TestCase):
         response = self.test_app.get("/api/ping")
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json(), {})
+
+
+@pytest.fixture(scope="module")
+def learning_main():
+    """Imports the learning service without Pub/Sub, object storage or metrics server."""
+    directory = tempfile.mkdtemp()
+    overrides = {
+        VarNames.PUBSUB_DATA_TEMP_FILE.value: os.path.join(directory, 'incoming.tsv'),
+        VarNames.ARTIFACT_CACHE_DIR.value: os.path.join(directory, 'artifact_cache'),
+    }
+    previous = {key: settings[key] for key in overrides}
+    for key, value in overrides.items():
+        settings.set(key, value)
+    with mock.patch('common.pubsub.subscribe_to_topic',
+                    return_value=(mock.MagicMock(), mock.MagicMock())), \
+            mock.patch('common.pubsub.publish_to_topic'), \
+            mock.patch('common.model_bundle.read_manifest', return_value=None), \
+            mock.patch('prometheus_client.start_http_server'):
+        from learning_service import main # pylint: disable=import-outside-toplevel
+    yield main
+    main.app.training_scheduler.stop()
+    main.app.correction_buffer.stop()
+    for key, value in previous.items():
+        settings.set(key, value)
+    shutil.rmtree(directory)
+
+
+class FakeMessage:
+    """Pub/Sub message recording its acknowledgements."""
+
+    def __init__(self, data, attributes=None):
+        self.data = data
+        self.attributes = attributes or {}
+        self.message_id = str(id(self))
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        """Records the acknowledgement."""
+        self.acked = True
+
+    def nack(self):
+        """Records the negative acknowledgement."""
+        self.nacked = True
+
+
+class CorrectionCallbackTest(unittest.TestCase):
+    """Testing that every received message is buffered, dropped or delivered again"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, learning_main):
+        """Fixture creating a buffer in a temporary directory."""
+        self.main = learning_main
+        self.directory = tempfile.mkdtemp()
+        self.buffer = CorrectionBuffer(os.path.join(self.directory, 'incoming.tsv'), 100,
+                                       lambda batch_path: None, fsync_interval=60)
+        self.buffer.start()
+        yield
+        self.buffer.stop()
+        shutil.rmtree(self.directory)
+
+    def test_batch_callback(self):
+        """Messages are acknowledged once durable, undecodable ones are dropped."""
+        valid = FakeMessage(encode_corrections([
+            {"title": "Java streams", "predicted": set(), "actual": {"java"}},
+            {"title": "SQL joins", "predicted": set(), "actual": {"sql"}},
+        ]))
+        former = FakeMessage(b'New correction data', {"title": "Center a div",
+                                                      "predicted": "set()", "actual": "{'css'}"})
+        undecodable = FakeMessage(encode_corrections([])[:-2])
+        self.main.get_batch_callback(self.buffer)([valid, undecodable, former])
+        self.assertTrue(undecodable.acked)
+        self.assertEqual(len(self.buffer), 3)
+        self.assertFalse(valid.acked or former.acked)
+        self.buffer.sync()
+        self.assertTrue(valid.acked and former.acked)
+        self.assertFalse(any(message.nacked for message in (valid, former, undecodable)))
+
+    def test_failed_append(self):
+        """Messages which could not be appended are delivered again."""
+        buffer = mock.MagicMock()
+        buffer.extend.side_effect = OSError("disk full")
+        message = FakeMessage(encode_corrections([
+            {"title": "Java streams", "predicted": set(), "actual": {"java"}}
+        ]))
+        self.main.get_callback(buffer)(message)
+        self.assertTrue(message.nacked)
+        self.assertFalse(message.acked)
+
+
+class TrainingOnCorrectionsTest(unittest.TestCase):
+    """Testing that batches of corrections which cannot be learned are set aside"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, learning_main):
+        """Fixture creating a buffer of batches, and failing training on the bad batch."""
+        self.main = learning_main
+        self.directory = tempfile.mkdtemp()
+        self.buffer = CorrectionBuffer(os.path.join(self.directory, 'incoming.tsv'), 1,
+                                       lambda batch_path: None, fsync_interval=60)
+        self.buffer.start()
+        self.trained = []
+
+        def train_and_send(app, train_file, train_file_path, model):
+            with open(os.path.join(train_file_path, train_file), encoding='utf-8') as file:
+                titles = [line.split('\t')[0] for line in file.readlines()[1:]]
+            if "bad" in titles:
+                raise ValueError("Only one class present in y_true")
+            self.trained.append(titles)
+
+        with mock.patch.object(learning_main, 'train_and_send', train_and_send):
+            yield
+        self.buffer.stop()
+        shutil.rmtree(self.directory)
+
+    def test_bad_batch_is_set_aside(self):
+        """A failing batch is retried on its own, then set aside without blocking the others."""
+        job = self.main.get_training_job(mock.MagicMock(), None, self.buffer, max_attempts=2)
+        self.buffer.append("good", ['python'])
+        self.buffer.append("bad", ['java'])
+        job()
+        self.assertEqual(self.trained, [])
+        self.assertEqual(len(self.buffer.pending_batches()), 2)
+
+        job()
+        self.assertEqual(self.trained, [["good"]])
+        self.assertEqual(self.buffer.pending_batches(), [])
+        self.assertEqual(len(glob.glob(os.path.join(self.directory, '*.failed.tsv'))), 1)
+
+        self.buffer.append("next", ['sql'])
+        job()
+        self.assertEqual(self.trained, [["good"], ["next"]])
+
+
+class FailingS3Client(FakeS3Client):
+    """Fake client rejecting every upload."""
+
+    def fput_object(self, bucket_name, object_name, file_path):
+        """Fake failed upload."""
+        raise self._error('AccessDenied', bucket_name, object_name)
+
+
+class FailedPublishTest(unittest.TestCase):
+    """Testing that a model which could not be published is not announced"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, learning_main):
+        """Fixture training on corrections with an object storage rejecting uploads."""
+        self.main = learning_main
+        self.directory = tempfile.mkdtemp()
+        self.buffer = CorrectionBuffer(os.path.join(self.directory, 'incoming.tsv'), 1,
+                                       lambda batch_path: None, fsync_interval=60)
+        self.buffer.start()
+        artifact_path = os.path.join(self.directory, 'model.joblib')
+        with open(artifact_path, 'wb') as file:
+            file.write(b'model')
+
+        def train(bucket_upload, classifier):
+            if bucket_upload:
+                text_classification.publish_model('test_model')
+            return classifier
+
+        with mock.patch.multiple(learning_main, copy_data=mock.DEFAULT,
+                                 prepocess_incoming_data=mock.DEFAULT,
+                                 classification_main=train), \
+                mock.patch.multiple(text_classification,
+                                    get_object_store=lambda *args: ObjectStore(FailingS3Client()),
+                                    get_model_artifacts=lambda name: {'model.joblib': artifact_path}):
+            yield
+        self.buffer.stop()
+        shutil.rmtree(self.directory)
+
+    def test_failed_upload_keeps_batches(self):
+        """No new model is announced, and the batches are kept for the next training."""
+        app = mock.MagicMock()
+        job = self.main.get_training_job(Lock(), app, self.buffer)
+        self.buffer.append("title", ['python'])
+        job()
+        app.publish_client.publish.assert_not_called()
+        self.assertEqual(len(self.buffer.pending_batches()), 1)
+
+
+def wait_finished(client, job_id, timeout=5):
+    """Waits until a training job finished, and returns its state."""
+    deadline = time.monotonic() + timeout
+    while True:
+        state = client.get(f'/api/learn/jobs/{job_id}').json()
+        if state["status"] not in ('queued', 'running') or time.monotonic() > deadline:
+            return state
+        time.sleep(0.01)
+
+
+class LearningJobsTest(unittest.TestCase):
+    """Testing the training job endpoints, and that cancelled jobs publish nothing"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, learning_main):
+        """Fixture replacing the training steps, and blocking training until released."""
+        self.main = learning_main
+        self.client = TestClient(learning_main.app)
+        self.release = Event()
+        self.training = Event()
+        self.model = object()
+
+        def train(bucket_upload, classifier_name):
+            self.training.set()
+            self.release.wait(5)
+            return self.model
+
+        output_path = tempfile.mkdtemp()
+        with open(os.path.join(output_path, 'evaluation.json'), 'w', encoding='utf-8') as file:
+            file.write('{"f1_score": 0.5}')
+        self.publish_model = mock.MagicMock()
+        with mock.patch.multiple(learning_main, OUTPUT_PATH=output_path,
+                                 copy_data_from_resources=mock.DEFAULT,
+                                 preprocess_main=mock.DEFAULT,
+                                 classification_main=train, streaming_main=train,
+                                 publish_model=self.publish_model), \
+                mock.patch.object(learning_main.app, 'model', None, create=True):
+            yield
+        self.release.set()
+        shutil.rmtree(output_path)
+
+    def test_learn(self):
+        """A job publishes the trained model, and duplicate requests return the same job."""
+        response = self.client.get('/api/learn')
+        self.assertEqual(response.status_code, 202)
+        job = response.json()
+        self.assertTrue(job["created"])
+        self.assertTrue(self.training.wait(5))
+        duplicate = self.client.get('/api/learn').json()
+        self.assertEqual((duplicate["id"], duplicate["created"]), (job["id"], False))
+
+        self.release.set()
+        state = wait_finished(self.client, job["id"])
+        self.assertEqual(state["status"], 'succeeded')
+        self.assertEqual(state["result"]["evaluation"], {"f1_score": 0.5})
+        self.publish_model.assert_called_once()
+        self.assertIs(self.main.app.model, self.model)
+        self.assertIn(job["id"], [listed["id"] for listed in self.client.get('/api/learn/jobs').json()])
+
+    def test_cancel_during_training(self):
+        """A job cancelled while training neither publishes nor serves its model."""
+        job = self.client.get('/api/learn').json()
+        self.assertTrue(self.training.wait(5))
+        response = self.client.delete(f'/api/learn/jobs/{job["id"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["cancel_requested"])
+        self.release.set()
+        state = wait_finished(self.client, job["id"])
+        self.assertEqual(state["status"], 'cancelled')
+        self.assertEqual(state["stages"][-1]["status"], 'skipped')
+        self.publish_model.assert_not_called()
+        self.assertIsNone(self.main.app.model)
+
+    def test_failed_publish(self):
+        """A job whose model could not be published fails, and its model is not served."""
+        self.publish_model.side_effect = RuntimeError('Publishing model failed')
+        self.release.set()
+        with mock.patch.object(self.main.app, 'publish_client') as publish_client:
+            job = self.client.get('/api/learn').json()
+            state = wait_finished(self.client, job["id"])
+        self.assertEqual(state["status"], 'failed')
+        self.assertEqual(state["stages"][-1]["status"], 'failed')
+        self.assertIsNone(state["result"])
+        self.assertIsNone(self.main.app.model)
+        publish_client.publish.assert_not_called()
+
+    def test_unknown_job(self):
+        """Unknown jobs are not found."""
+        self.assertEqual(self.client.get('/api/learn/jobs/unknown').status_code, 404)
+        self.assertEqual(self.client.delete('/api/learn/jobs/unknown').status_code, 404)
@@ -0,0 +1,107 @@
+"""Tests for the hashing TF-IDF vectorizer."""
+import os
+import pickle
+import tempfile
+import unittest
+from collections import Counter
+
+import numpy as np
+import pytest
+from sklearn.linear_model import SGDClassifier
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer
+from sklearn.utils import murmurhash3_32
+
+from common.compiled_model import compile_model
+from common.mapped_model import load_mapped_model, save_mapped_model
+from learning_service.hashing_vectorizer import HashingTfidfVectorizer
+
+
+class HashingTfidfVectorizerTest(unittest.TestCase):
+    """Testing the hashing vectorizer against TfidfVectorizer and the compiled model"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data, fit_tfidf):
+        """Fixture to read part of the validation data."""
+        self.fit_tfidf = fit_tfidf
+        self.train_data = validation_data[:3000]
+        self.test_titles = list(validation_data['title'].values[3000:4000])
+
+    def test_idf_matches_tfidf_vectorizer(self):
+        """Every kept term gets the IDF of TfidfVectorizer, pruned terms get zero."""
+        titles = self.train_data['title']
+        vectorizer = HashingTfidfVectorizer(n_features=2 ** 22, min_df=3, max_df=0.05)
+        vectorizer.fit(titles)
+        reference, _ = self.fit_tfidf(titles, min_df=3, max_df=0.05)
+
+        # Terms sharing a bucket with another term of the corpus are not comparable
+        analyze = reference.build_analyzer()
+        terms = {term for title in titles for term in analyze(title)}
+        buckets = {term: abs(murmurhash3_32(term)) % vectorizer.n_features for term in terms}
+        bucket_counts = Counter(buckets.values())
+        compared = 0
+        for term, index in reference.vocabulary_.items():
+            if bucket_counts[buckets[term]] == 1:
+                self.assertAlmostEqual(vectorizer.idf_[buckets[term]], reference.idf_[index])
+                compared += 1
+        self.assertGreater(compared, 0.95 * len(reference.vocabulary_))
+
+    def test_partial_fit_matches_fit(self):
+        """Fitting in batches gives the same features as fitting all data at once."""
+        titles = list(self.train_data['title'])
+        vectorizer = HashingTfidfVectorizer(n_features=2 ** 18, min_df=2)
+        for start in range(0, len(titles), 700):
+            vectorizer.partial_fit(titles[start:start + 700])
+        reference = HashingTfidfVectorizer(n_features=2 ** 18, min_df=2)
+        reference_features = reference.fit_transform(titles)
+
+        self.assertEqual(vectorizer.n_documents_, len(titles))
+        self.assertAlmostEqual(
+            abs(vectorizer.transform(self.test_titles)
+                - reference.transform(self.test_titles)).max(), 0, places=12
+        )
+        self.assertAlmostEqual(
+            abs(vectorizer.transform(titles) - reference_features).max(), 0, places=12
+        )
+
+        restored = pickle.loads(pickle.dumps(vectorizer))
+        np.testing.assert_array_equal(restored.document_frequency_,
+                                      vectorizer.document_frequency_)
+        np.testing.assert_array_equal(restored.idf_, vectorizer.idf_)
+
+    def test_new_terms_are_learned(self):
+        """Terms first seen in a later batch become features once they are frequent enough."""
+        vectorizer = HashingTfidfVectorizer(n_features=2 ** 18, min_df=2)
+        vectorizer.fit(self.train_data['title'])
+        title = 'how to configure qwertyframework routes'
+        bucket = abs(murmurhash3_32('qwertyframework')) % vectorizer.n_features
+        self.assertEqual(vectorizer.transform([title])[0, bucket], 0)
+
+        vectorizer.partial_fit([title, 'qwertyframework dependency injection'])
+        self.assertGreater(vectorizer.transform([title])[0, bucket], 0)
+
+    def test_compiled_model_matches_pipeline(self):
+        """The compiled and mapped models keep only used buckets and predict the same tags."""
+        vectorizer = HashingTfidfVectorizer(n_features=2 ** 20, min_df=5, max_df=0.9)
+        features = vectorizer.fit_transform(self.train_data['title'])
+        label_binarizer = MultiLabelBinarizer()
+        labels = label_binarizer.fit_transform(self.train_data['tags'])
+        classifier = OneVsRestClassifier(SGDClassifier(penalty='l1', max_iter=50))
+        classifier.fit(features, labels)
+
+        model = compile_model(vectorizer, classifier, label_binarizer)
+        self.assertEqual(model.n_features, np.count_nonzero(vectorizer.idf_))
+        expected_features = vectorizer.transform(self.test_titles)
+        expected_scores = classifier.decision_function(expected_features)
+        expected = label_binarizer.inverse_transform(classifier.predict(expected_features))
+        np.testing.assert_allclose(model.decision_function(self.test_titles),
+                                   expected_scores, atol=1e-10)
+        self.assertEqual(model.transform(self.test_titles), expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npmap')
+            save_mapped_model(path, model)
+            mapped_model = load_mapped_model(path)
+            np.testing.assert_allclose(mapped_model.decision_function(self.test_titles),
+                                       expected_scores, atol=1e-10)
+            del mapped_model
@@ -0,0 +1,136 @@
+"""Tests for growing trained models to new tags and terms."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from joblib import dump
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from learning_service.incremental_learning import grow_label_binarizer, grow_vocabulary, \
+    grow_classifier, pad_columns
+from learning_service import text_classification
+from learning_service.text_classification import train_classifier, retrain_model
+from learning_service.text_preprocessing import create_bag_of_words_preprocessor, \
+    FEATURIZER_MODE_TFIDF
+
+
+class IncrementalLearningTest(unittest.TestCase):
+    """Testing the growth of binarizers, vocabularies and classifiers"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data):
+        """Fixture to load up data."""
+        has_new_tag = validation_data['tags'].apply(lambda tags: 'ruby' in tags)
+        # The known model never saw the tag, the incoming data has it
+        self.known_data = validation_data[~has_new_tag][:3000]
+        self.incoming_data = validation_data[has_new_tag][:300]
+        self.mlb = MultiLabelBinarizer(
+            classes=sorted({tag for tags in self.known_data['tags'] for tag in tags})
+        )
+        self.mlb.fit([])
+
+    def test_grow_label_binarizer(self):
+        """New tags are appended after the known ones."""
+        grown, new_tags = grow_label_binarizer(self.mlb, self.incoming_data['tags'])
+        self.assertIn('ruby', new_tags)
+        self.assertEqual(list(grown.classes_[:len(self.mlb.classes_)]), list(self.mlb.classes_))
+        self.assertEqual(list(grown.classes_[len(self.mlb.classes_):]), new_tags)
+        np.testing.assert_array_equal(
+            grown.transform(self.known_data['tags'])[:, :len(self.mlb.classes_)],
+            self.mlb.transform(self.known_data['tags'])
+        )
+        self.assertIs(grow_label_binarizer(grown, self.incoming_data['tags'])[0], grown)
+
+    def test_grow_vocabulary(self):
+        """New terms get new columns, the known columns keep their terms and IDF."""
+        vectorizer = create_bag_of_words_preprocessor(5, 0.8, FEATURIZER_MODE_TFIDF)
+        vectorizer.fit(self.known_data['title'])
+        known_vocabulary = dict(vectorizer.vocabulary_)
+        known_idf = vectorizer.idf_.copy()
+
+        new_terms = grow_vocabulary(vectorizer, self.incoming_data['title'], min_df=2)
+        self.assertIn('rvm', new_terms)
+        self.assertEqual(len(vectorizer.vocabulary_), len(known_vocabulary) + len(new_terms))
+        for term, index in known_vocabulary.items():
+            self.assertEqual(vectorizer.vocabulary_[term], index)
+        np.testing.assert_array_equal(vectorizer.idf_[:len(known_idf)], known_idf)
+
+        features = vectorizer.transform(self.incoming_data['title'])
+        self.assertEqual(features.shape[1], len(vectorizer.vocabulary_))
+        self.assertGreater(features[:, vectorizer.vocabulary_['rvm']].nnz, 0)
+
+    def test_retrain_with_new_tag(self):
+        """A trained classifier learns a new tag and new terms without a full retrain."""
+        vectorizer = create_bag_of_words_preprocessor(5, 0.8, FEATURIZER_MODE_TFIDF)
+        X_known = vectorizer.fit_transform(self.known_data['title'])
+        classifier = train_classifier(X_known, self.mlb.transform(self.known_data['tags']))
+        known_predictions = classifier.predict(X_known)
+
+        grow_vocabulary(vectorizer, self.incoming_data['title'], min_df=2)
+        mlb, _ = grow_label_binarizer(self.mlb, self.incoming_data['tags'])
+        X_incoming = vectorizer.transform(self.incoming_data['title'])
+        y_incoming = mlb.transform(self.incoming_data['tags'])
+
+        grown = grow_classifier(classifier, X_incoming.shape[1], y_incoming.shape[1])
+        # Growing alone does not change the predictions of the known labels
+        X_padded = pad_columns(X_known, X_incoming.shape[1])
+        np.testing.assert_array_equal(
+            np.column_stack([
+                estimator.predict(X_padded)
+                for estimator in grown.estimators_[:len(self.mlb.classes_)]
+            ]),
+            known_predictions
+        )
+
+        retrain_model(classifier, X_incoming, y_incoming)
+        self.assertEqual(len(classifier.estimators_), len(mlb.classes_))
+        predictions = classifier.predict(X_incoming)
+        ruby = list(mlb.classes_).index('ruby')
+        self.assertGreater(predictions[:, ruby].sum(), len(self.incoming_data) / 2)
+
+    def test_evaluate_after_new_tag(self):
+        """A classifier which learned a new tag is evaluated on validation data without the tag."""
+        vectorizer = create_bag_of_words_preprocessor(5, 0.8, FEATURIZER_MODE_TFIDF)
+        X_known = vectorizer.fit_transform(self.known_data['title'])
+        y_known = self.mlb.transform(self.known_data['tags'])
+        classifier = train_classifier(X_known, y_known)
+        mlb, _ = grow_label_binarizer(self.mlb, self.incoming_data['tags'])
+        retrain_model(classifier, vectorizer.transform(self.incoming_data['title']),
+                      mlb.transform(self.incoming_data['tags']))
+
+        output_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_path)
+        paths = {name: os.path.join(output_path, f'{name}.joblib')
+                 for name in ('data', 'labels', 'vectorizer', 'mlb')}
+        # The validation data was prepared before the tag was added
+        dump(X_known, paths['data'])
+        dump(y_known, paths['labels'])
+        dump(vectorizer, paths['vectorizer'])
+        dump(mlb, paths['mlb'])
+        with mock.patch.multiple(text_classification, OUTPUT_PATH=output_path,
+                                 DATA_PREPROCESSOR=paths['vectorizer'],
+                                 LABEL_PREPROCESSOR=paths['mlb'],
+                                 read_data_from_file=lambda *args, **kwargs: self.known_data):
+            text_classification.evaluate_and_store(
+                classifier,
+                validation_data_file=paths['data'],
+                validation_labels_file=paths['labels']
+            )
+        with open(os.path.join(output_path, 'evaluation.json'), encoding='utf-8') as file:
+            scores = json.load(file)
+        self.assertTrue(all(np.isfinite(score) for score in scores.values()))
+
+    def test_pad_columns(self):
+        """Zero columns are appended to dense and sparse matrices."""
+        matrix = np.arange(6).reshape(2, 3)
+        np.testing.assert_array_equal(pad_columns(matrix, 5), [[0, 1, 2, 0, 0], [3, 4, 5, 0, 0]])
+        padded = pad_columns(sp.csr_matrix(matrix), 5)
+        self.assertEqual(padded.shape, (2, 5))
+        np.testing.assert_array_equal(padded.toarray()[:, :3], matrix)
+        self.assertIs(pad_columns(matrix, 3), matrix)
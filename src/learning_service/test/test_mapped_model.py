@@ -0,0 +1,75 @@
+"""Tests for the memory-mapped model format."""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+from sklearn.linear_model import SGDClassifier
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer
+
+from common.compiled_model import compile_model
+from common.mapped_model import MappedVocabulary, load_mapped_arrays, load_mapped_model, \
+    save_mapped_arrays, save_mapped_model
+
+
+class MappedModelTest(unittest.TestCase):
+    """Testing the memory-mapped model format"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data, fit_tfidf):
+        """Fixture to train a small model."""
+        data = validation_data[:3000]
+        self.train_data = data[:2000]
+        self.test_titles = list(data[2000:]['title'].values)
+        self.vectorizer, features = fit_tfidf(self.train_data['title'], min_df=2)
+        self.label_binarizer = MultiLabelBinarizer()
+        labels = self.label_binarizer.fit_transform(self.train_data['tags'])
+        self.classifier = OneVsRestClassifier(SGDClassifier(penalty='l1', max_iter=20))
+        self.classifier.fit(features, labels)
+        self.directory = tempfile.TemporaryDirectory()
+        yield
+        self.directory.cleanup()
+
+    def test_arrays_round_trip(self):
+        """Arrays are restored as read-only memory maps with the same contents."""
+        path = os.path.join(self.directory.name, 'arrays.npmap')
+        arrays = {
+            "floats": np.random.rand(3, 5),
+            "ints": np.arange(7, dtype=np.int32),
+            "empty": np.zeros(0),
+        }
+        save_mapped_arrays(path, arrays, {"name": "test"})
+        loaded, meta = load_mapped_arrays(path)
+        self.assertEqual(meta, {"name": "test"})
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(loaded[name], array)
+        self.assertIsInstance(loaded["floats"], np.memmap)
+        self.assertFalse(loaded["floats"].flags.writeable)
+
+    def test_vocabulary_lookup(self):
+        """Known terms map to their feature index, unknown terms to -1."""
+        vocabulary = {"java": 2, "c++": 0, "java oop": 1, "žluťoučký": 3}
+        terms, indices = MappedVocabulary.arrays_from_dict(vocabulary)
+        mapped_vocabulary = MappedVocabulary(terms, indices)
+        result = mapped_vocabulary.lookup(["java oop", "python", "c++", "žluťoučký", "a" * 100])
+        np.testing.assert_array_equal(result, [1, -1, 0, 3, -1])
+
+    def test_predictions_match_pipeline(self):
+        """The mapped model predicts the same tags as the scikit-learn model."""
+        path = os.path.join(self.directory.name, 'model.npmap')
+        save_mapped_model(
+            path, compile_model(self.vectorizer, self.classifier, self.label_binarizer)
+        )
+        model = load_mapped_model(path)
+        self.assertFalse(model.weights.data.flags.owndata)
+
+        expected_features = self.vectorizer.transform(self.test_titles)
+        self.assertAlmostEqual(
+            abs(model.vectorize(self.test_titles) - expected_features).max(), 0, places=12
+        )
+        expected = self.label_binarizer.inverse_transform(
+            self.classifier.predict(expected_features)
+        )
+        self.assertEqual(model.transform(self.test_titles), expected)
@@ -0,0 +1,38 @@
+"""Tests for the featurizer sharding titles across processes."""
+import unittest
+
+import pytest
+
+from common.text_normalizer import TextNormalizer
+from learning_service.parallel_featurizer import ParallelFeaturizer
+from learning_service.text_preprocessing import STOP_WORDS
+
+
+class ParallelFeaturizerTest(unittest.TestCase):
+    """Testing that sharded featurization matches featurization in one process"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data, fit_tfidf):
+        """Fixture to fit a preprocessor on part of the validation data."""
+        self.titles = list(validation_data['title'].values[:5000])
+        self.normalizer = TextNormalizer(STOP_WORDS)
+        self.preprocessor, _ = fit_tfidf(self.normalizer.normalize(self.titles))
+
+    def test_shards_match_single_process(self):
+        """Shards are featurized by the workers and stacked in order."""
+        expected = self.preprocessor.transform(self.normalizer.normalize(self.titles))
+        with ParallelFeaturizer(self.preprocessor, self.normalizer,
+                                n_jobs=3, shard_size=1000) as featurizer:
+            features = featurizer.transform(self.titles)
+            self.assertIsNotNone(featurizer._executor)
+            # Batches smaller than a shard are featurized in the current process
+            featurizer.transform(self.titles[:10])
+        self.assertEqual(features.shape, expected.shape)
+        self.assertEqual(abs(features - expected).max(), 0)
+        self.assertIsNone(featurizer._executor)
+
+    def test_single_job_does_not_start_processes(self):
+        """With one job, titles are featurized without a pool."""
+        featurizer = ParallelFeaturizer(self.preprocessor, self.normalizer, shard_size=1000)
+        featurizer.transform(self.titles)
+        self.assertIsNone(featurizer._executor)
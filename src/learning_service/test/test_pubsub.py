@@ -0,0 +1,115 @@
+"""Tests for the delivery of messages in lists and the binary format of correction messages."""
+import time
+import unittest
+
+from common.pubsub import CORRECTIONS_MAGIC, MessageBatcher, decode_corrections, \
+    encode_corrections
+
+
+class FakeMessage:
+    """Message recording whether it was acknowledged."""
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.nacked = False
+
+    def nack(self):
+        """Records the negative acknowledgement."""
+        self.nacked = True
+
+
+class MessageBatcherTest(unittest.TestCase):
+    """Testing that messages are handed to the callback in lists"""
+
+    def setUp(self):
+        self.lists = []
+
+    def test_full_lists(self):
+        """Lists are handed over once they are full."""
+        batcher = MessageBatcher(self.lists.append, max_messages=2, max_latency=60)
+        messages = [FakeMessage(index) for index in range(3)]
+        for message in messages:
+            batcher(message)
+        self.assertEqual(self.lists, [messages[:2]])
+        batcher.flush()
+        self.assertEqual(self.lists, [messages[:2], messages[2:]])
+
+    def test_lists_by_latency(self):
+        """Lists which do not fill are handed over after the latency."""
+        batcher = MessageBatcher(self.lists.append, max_messages=10, max_latency=0.01)
+        message = FakeMessage(0)
+        batcher(message)
+        deadline = time.monotonic() + 5
+        while not self.lists and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.lists, [[message]])
+
+    def test_failed_lists_are_left_alone(self):
+        """Messages of a failed list are not negatively acknowledged, later lists still arrive."""
+        def fail_once(messages):
+            if not self.lists:
+                self.lists.append(None)
+                raise RuntimeError("unavailable")
+            self.lists.append(messages)
+
+        batcher = MessageBatcher(fail_once, max_messages=2, max_latency=60)
+        messages = [FakeMessage(index) for index in range(4)]
+        for message in messages:
+            batcher(message)
+        self.assertFalse(any(message.nacked for message in messages))
+        self.assertEqual(self.lists, [None, messages[2:]])
+
+
+class CorrectionsFormatTest(unittest.TestCase):
+    """Testing the encoding and decoding of corrections"""
+
+    def setUp(self):
+        self.corrections = [
+            {"title": "How to merge dicts?", "predicted": {"python"}, "actual": {"python", "dictionary"}},
+            {"title": "Générer un UUID", "predicted": set(), "actual": {"c#", "asp.net"}},
+            {"title": "", "predicted": {"java"}, "actual": set()},
+        ]
+
+    def test_round_trip(self):
+        """Decoding gives back the encoded corrections."""
+        data = encode_corrections(self.corrections)
+        self.assertTrue(data.startswith(CORRECTIONS_MAGIC))
+        self.assertEqual(decode_corrections(data), self.corrections)
+        self.assertEqual(decode_corrections(encode_corrections([])), [])
+
+    def test_large_messages_are_compressed(self):
+        """Repeated titles and tags are compressed, and still decoded."""
+        corrections = self.corrections * 200
+        data = encode_corrections(corrections)
+        self.assertLess(len(data), sum(len(correction["title"]) for correction in corrections))
+        self.assertEqual(decode_corrections(data), corrections)
+
+    def test_former_format(self):
+        """Messages with a single correction in their attributes are decoded."""
+        attributes = {"title": "How to merge dicts?", "predicted": "{'python'}",
+                      "actual": "{'python', 'dictionary'}"}
+        self.assertEqual(decode_corrections(b'New correction data', attributes), self.corrections[:1])
+        with self.assertRaises(ValueError):
+            decode_corrections(b'New correction data', {})
+
+    def test_invalid_messages(self):
+        """Unknown versions and unseparable fields are rejected."""
+        data = bytearray(encode_corrections(self.corrections))
+        data[len(CORRECTIONS_MAGIC)] = 99
+        with self.assertRaises(ValueError):
+            decode_corrections(bytes(data))
+        with self.assertRaises(ValueError):
+            encode_corrections([{"title": "a\0b", "predicted": set(), "actual": set()}])
+
+    def test_malformed_messages(self):
+        """Truncated or corrupted messages are rejected with a ValueError."""
+        for corrections in (self.corrections, self.corrections * 200):
+            data = encode_corrections(corrections)
+            for size in range(len(CORRECTIONS_MAGIC), len(data), max(len(data) // 50, 1)):
+                with self.assertRaises(ValueError):
+                    decode_corrections(data[:size])
+        # The last tag index refers to a tag which does not exist
+        data = bytearray(encode_corrections(self.corrections[:1]))
+        data[-4:] = (99).to_bytes(4, 'little')
+        with self.assertRaises(ValueError):
+            decode_corrections(bytes(data))
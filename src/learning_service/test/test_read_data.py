@@ -0,0 +1,67 @@
+"""Tests for reading the data files."""
+import os
+import shutil
+import tempfile
+import unittest
+from ast import literal_eval
+
+import pandas as pd
+import pytest
+
+from learning_service.read_data import parse_tags, read_data_from_file, \
+    read_unlabeled_data_from_file
+
+BASE_DIR = os.path.join(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    ),
+    "data"
+)
+
+
+class ReadDataTest(unittest.TestCase):
+    """Testing the fast parsing of tags and the columnar copies of data files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        shutil.copy(os.path.join(BASE_DIR, "validation.tsv"), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_tags_match_literal_eval(self):
+        """Tags are parsed like Python literals, including quoted and escaped tags."""
+        raw = pd.read_csv(os.path.join(BASE_DIR, "validation.tsv"), sep='\t', dtype=str)
+        values = list(raw['tags']) + [
+            "[]", "['c++']", "[\"it's\"]", "['a', \"b'c\", 'd']", "['back\\\\slash']",
+            "['a','b']", "['a', 'b', ]",
+        ]
+        self.assertEqual(parse_tags(values), [literal_eval(value) for value in values])
+
+    def test_columns_are_selected(self):
+        """Only the requested columns are read."""
+        titles = read_data_from_file("validation.tsv", root_path=self.directory,
+                                     columns=("title",))
+        self.assertEqual(list(titles.columns), ["title"])
+        data = read_data_from_file("validation.tsv", root_path=self.directory, columnar=False)
+        self.assertEqual(list(data.columns), ["title", "tags"])
+        self.assertEqual(data['tags'][0], ['php', 'sql'])
+        unlabeled = read_unlabeled_data_from_file("test.tsv", root_path=BASE_DIR)
+        self.assertEqual(list(unlabeled.columns), ["title"])
+
+    def test_columnar_copy(self):
+        """The columnar copy holds the same data, and is refreshed when the file changes."""
+        pytest.importorskip("pyarrow")
+        expected = read_data_from_file("validation.tsv", root_path=self.directory,
+                                       columnar=False)
+        data = read_data_from_file("validation.tsv", root_path=self.directory, columnar=True)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "validation.parquet")))
+        pd.testing.assert_frame_equal(data, expected)
+
+        expected[:100].to_csv(os.path.join(self.directory, "validation.tsv"), sep='\t',
+                              index=False)
+        os.utime(os.path.join(self.directory, "validation.parquet"), (0, 0))
+        data = read_data_from_file("validation.tsv", root_path=self.directory, columnar=True)
+        self.assertEqual(len(data), 100)
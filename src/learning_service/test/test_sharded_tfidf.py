@@ -0,0 +1,47 @@
+"""Tests for the sharded fit of TF-IDF vectorizers."""
+import unittest
+
+import numpy as np
+import pytest
+
+from learning_service.sharded_tfidf import fit_sharded
+from learning_service.text_preprocessing import create_bag_of_words_preprocessor, \
+    FEATURIZER_MODE_TFIDF
+
+
+class ShardedTfidfTest(unittest.TestCase):
+    """Testing that a sharded fit is equivalent to a single fit"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, validation_data):
+        """Fixture to load up data."""
+        self.titles = list(validation_data['title'][:5000])
+
+    def assert_equivalent(self, min_df, max_df):
+        """Checks the vocabulary, IDF and features of a sharded fit against a single fit."""
+        expected = create_bag_of_words_preprocessor(min_df, max_df, FEATURIZER_MODE_TFIDF)
+        expected_features = expected.fit_transform(self.titles)
+        sharded = fit_sharded(
+            create_bag_of_words_preprocessor(min_df, max_df, FEATURIZER_MODE_TFIDF),
+            self.titles, n_jobs=3, shard_size=1000
+        )
+        self.assertEqual(sharded.vocabulary_, expected.vocabulary_)
+        np.testing.assert_allclose(sharded.idf_, expected.idf_)
+        features = sharded.transform(self.titles)
+        self.assertAlmostEqual(abs(features - expected_features).max(), 0)
+
+    def test_equivalent_to_single_fit(self):
+        """Pruning of the merged counts gives the vocabulary of a single fit."""
+        self.assert_equivalent(5, 0.8)
+
+    def test_equivalent_with_tight_bounds(self):
+        """Relative min_df and absolute max_df are applied to the merged counts."""
+        self.assert_equivalent(0.001, 200)
+
+    def test_prunes_every_term(self):
+        """Bounds excluding every term are rejected."""
+        with self.assertRaises(ValueError):
+            fit_sharded(
+                create_bag_of_words_preprocessor(5, 1, FEATURIZER_MODE_TFIDF),
+                self.titles, n_jobs=3, shard_size=1000
+            )
@@ -0,0 +1,87 @@
+"""Tests for the cache of preprocessing stages."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from learning_service.stage_cache import StageCache
+
+
+class StageCacheTest(unittest.TestCase):
+    """Testing that unchanged stages are restored instead of running again"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.code_path = self.path('stage.py')
+        self.write(self.code_path, 'MIN_DF = 5\n')
+        self.cache = StageCache(os.path.join(self.directory, 'cache'), max_entries=2,
+                                code_paths=[self.code_path])
+        self.input_path = self.path('input.tsv')
+        self.write(self.input_path, 'title\ttags\n')
+        self.outputs = {'output.joblib': self.path('output.joblib'),
+                        'optional.json': self.path('optional.json')}
+        self.runs = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        """Gets the path of a file in the test directory."""
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def write(path, text):
+        """Writes a text file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    @staticmethod
+    def read(path):
+        """Reads a text file."""
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    def stage(self):
+        """Stage writing the number of runs to its output."""
+        self.runs += 1
+        self.write(self.outputs['output.joblib'], f'run {self.runs}')
+
+    def run_stage(self, params=None):
+        """Runs the test stage through the cache."""
+        return self.cache.run('stage', [self.input_path], params or {'min_df': 5},
+                              self.outputs, self.stage)
+
+    def test_unchanged_stages_are_restored(self):
+        """The outputs of an unchanged stage are restored, even if they were modified since."""
+        self.assertFalse(self.run_stage())
+        self.write(self.outputs['output.joblib'], 'modified')
+        self.assertTrue(self.run_stage())
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(self.read(self.outputs['output.joblib']), 'run 1')
+        # Outputs which were not created are not restored
+        self.assertFalse(os.path.exists(self.outputs['optional.json']))
+
+    def test_changes_run_the_stage(self):
+        """Changed inputs or parameters run the stage again."""
+        self.run_stage()
+        self.write(self.input_path, 'title\ttags\nnew\t[]\n')
+        self.assertFalse(self.run_stage())
+        self.assertFalse(self.run_stage({'min_df': 2}))
+        self.assertEqual(self.runs, 3)
+        self.assertTrue(self.run_stage({'min_df': 2}))
+
+    def test_least_recently_used_entries_are_removed(self):
+        """Only the configured number of entries is kept for every stage."""
+        for min_df in range(4):
+            self.run_stage({'min_df': min_df})
+        self.assertEqual(len(os.listdir(os.path.join(self.cache.directory, 'stage'))), 2)
+        self.assertTrue(self.run_stage({'min_df': 3}))
+        self.assertFalse(self.run_stage({'min_df': 0}))
+
+    def test_changed_code_invalidates_stages(self):
+        """Stages run again after the code computing them changed."""
+        self.assertFalse(self.run_stage())
+        self.write(self.code_path, 'MIN_DF = 20\n')
+        self.assertFalse(self.run_stage())
+        self.assertEqual(self.runs, 2)
+        self.assertTrue(self.run_stage())
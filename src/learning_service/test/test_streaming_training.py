@@ -0,0 +1,73 @@
+"""Tests for the out of core training pipeline."""
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import f1_score
+from sklearn.multiclass import OneVsRestClassifier
+
+from learning_service.config import VarNames
+from learning_service.read_data import read_data_in_chunks
+from learning_service.streaming_training import fit_preprocessors, shuffled_batches, \
+    train_classifier_streaming
+from learning_service.text_classification import partial_fit_classifier
+
+
+class StreamingTrainingTest(unittest.TestCase):
+    """Testing chunked reading, shuffling and training with partial_fit"""
+
+    @pytest.fixture(autouse=True)
+    def prepare_fixture(self, data_dir, validation_data):
+        """Fixture to load up data."""
+        self.data_dir = data_dir
+        self.validation_data = validation_data
+
+    def test_chunks_match_whole_file(self):
+        """Reading in chunks gives the same rows as reading the whole file."""
+        chunks = list(read_data_in_chunks("validation.tsv", 7000, root_path=self.data_dir))
+        self.assertEqual([len(chunk) for chunk in chunks], [7000] * 4 + [2000])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), self.validation_data)
+
+    def test_shuffled_batches(self):
+        """Every row is emitted once, in batches bounded by the chunk size."""
+        chunks = [pd.DataFrame({"row": range(start, start + 100)}) for start in range(0, 1000, 100)]
+        batches = list(shuffled_batches(chunks, 250, np.random.default_rng(0)))
+        rows = pd.concat(batches)["row"].tolist()
+        self.assertEqual(sorted(rows), list(range(1000)))
+        self.assertNotEqual(rows, list(range(1000)))
+        self.assertTrue(all(len(batch) <= 250 for batch in batches))
+        # Rows of the first chunk are spread over the stream
+        self.assertGreater(max(rows.index(row) for row in range(100)), 500)
+
+    def test_partial_fit_multi_label(self):
+        """The first partial_fit of a OneVsRestClassifier accepts multi-label targets."""
+        features = np.random.default_rng(0).random((50, 8))
+        labels = (features[:, :3] > 0.5).astype(int)
+        classifier = OneVsRestClassifier(SGDClassifier())
+        partial_fit_classifier(classifier, features[:25], labels[:25])
+        partial_fit_classifier(classifier, features[25:], labels[25:])
+        self.assertEqual(classifier.predict(features).shape, labels.shape)
+        self.assertEqual(len(classifier.estimators_), 3)
+
+    def test_streaming_training(self):
+        """Streaming training learns a model comparable to training on the whole data."""
+        # Fewer hashed features keep the dense weights of the 100 estimators small
+        with mock.patch('learning_service.text_preprocessing.settings',
+                        {VarNames.HASHING_N_FEATURES.value: 2 ** 16}):
+            preprocessor, mlb, n_samples = fit_preprocessors(
+                "validation.tsv", 5000, root_path=self.data_dir
+            )
+        self.assertEqual(n_samples, len(self.validation_data))
+        self.assertEqual(len(mlb.classes_), 100)
+
+        classifier = train_classifier_streaming(
+            "validation.tsv", preprocessor, mlb, chunk_size=5000, epochs=2,
+            buffer_size=10000, root_path=self.data_dir
+        )
+        test_data = self.validation_data[:3000]
+        predictions = classifier.predict(preprocessor.transform(test_data['title']))
+        score = f1_score(mlb.transform(test_data['tags']), predictions, average='weighted')
+        self.assertGreater(score, 0.4)
@@ -4,9 +4,13 @@ import collections
 import numpy as np
 import pandas as pd
 import unittest
+from unittest import mock
+from common import sharding
+from learning_service import text_preprocessing
 from learning_service.read_data import read_data_from_file
-from learning_service.text_preprocessing import text_process, preprocess_bag_of_words, \
-    prepare_data_from_processor, prepare_labels, create_multi_label_binarizer
+from learning_service.text_preprocessing import text_process, text_process_batch, \
+    preprocess_bag_of_words, prepare_data_from_processor, prepare_labels, \
+    create_multi_label_binarizer, load_text_normalizer
 from typing import Dict, List, Union, Tuple
 from parameterized import parameterized
 
@@ -81,6 +85,66 @@ class PreprocessingTest(unittest.TestCase):
         output = text_process(text_input, stemming=stemming)
         self.assertEqual(output, text_arr_output)
 
+    @parameterized.expand([[False], [True]])
+    def test_preprocess_text_batch(self, stemming:bool):
+        """Test that processing titles in batches gives the same results as one by one.
+
+        Args:
+            stemming (bool): flag to enable or disable stemming
+        """
+        titles = list(self.validation_data['title'][:2000]) + \
+            ["Line\nbreak", "", "İstanbul / Kelvin K", "c#;java (c++)"]
+        expected = [text_process(title, stemming=stemming) for title in titles]
+        self.assertEqual(text_process_batch(titles, stemming=stemming), expected)
+        with mock.patch.object(sharding, 'MIN_TITLES_PER_SHARD', 100):
+            self.assertEqual(text_process_batch(titles, stemming=stemming, n_jobs=3), expected)
+
+    def test_token_table(self):
+        """Test that the words of the training titles are saved next to the preprocessor,
+        and that other words are kept in a bounded cache.
+        """
+        processor_prefix = self.id()
+        train_titles = self.validation_data['title'][:1000]
+        preprocess_bag_of_words(
+            train_titles,
+            save_path=CWD,
+            min_df=1,
+            max_df=1.0,
+            processor_prefix=processor_prefix
+        )
+        normalizer = load_text_normalizer(CWD, processor_prefix=processor_prefix)
+        self.assertIn("sql", normalizer.table)
+        self.assertEqual(normalizer.table["the"], "")
+
+        normalizer.cache_size = 100
+        titles = list(self.validation_data['title'][1000:2000])
+        expected = [text_process(title) for title in titles]
+        self.assertEqual(normalizer.normalize(titles), expected)
+        self.assertEqual(len(normalizer.word_cache), 100)
+        self.assertTrue(all(word not in normalizer.table for word in normalizer.word_cache))
+
+        stemming_normalizer = load_text_normalizer(CWD, processor_prefix=processor_prefix,
+                                                   stemming=True)
+        self.assertEqual(stemming_normalizer.table["databases"], "databas")
+        expected = [text_process(title, stemming=True) for title in titles]
+        self.assertEqual(stemming_normalizer.normalize(titles), expected)
+
+    def test_shared_normalizer_uses_token_table(self):
+        """Test that `text_process` starts from the table saved with the latest preprocessor."""
+        preprocess_bag_of_words(
+            self.validation_data['title'][:1000],
+            save_path=CWD,
+            min_df=1,
+            max_df=1.0
+        )
+        with mock.patch.object(text_preprocessing, 'OUTPUT_PATH', CWD), \
+                mock.patch.object(text_preprocessing, '_TEXT_NORMALIZERS', {}):
+            for stemming in (False, True):
+                normalizer = text_preprocessing.get_text_normalizer(stemming)
+                self.assertIn("sql", normalizer.table)
+                self.assertEqual(normalizer.stemmer is not None, stemming)
+            self.assertEqual(text_process("Databases in SQL", stemming=True), "databas sql")
+
     @parameterized.expand([
             [
                 {
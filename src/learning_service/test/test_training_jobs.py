@@ -0,0 +1,100 @@
+"""Tests for asynchronous training jobs."""
+import time
+import unittest
+from threading import Event, Lock
+
+from learning_service.training_jobs import TrainingJobManager, JOB_CANCELLED, JOB_FAILED, \
+    JOB_RUNNING, JOB_SUCCEEDED, STAGE_DONE, STAGE_FAILED, STAGE_SKIPPED
+
+
+def wait_finished(job, timeout=5):
+    """Waits until a job finished."""
+    deadline = time.monotonic() + timeout
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not job.active
+
+
+class TrainingJobsTest(unittest.TestCase):
+    """Testing the stages, coalescing and cancellation of training jobs"""
+
+    def setUp(self):
+        self.manager = TrainingJobManager(Lock())
+        self.release = Event()
+        self.started = Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def blocking_stage(self):
+        """Stage running until the test releases it."""
+        self.started.set()
+        self.release.wait(5)
+
+    def test_stages_and_result(self):
+        """Stages run in order, with their timing, and the last one gives the result."""
+        calls = []
+        job, created = self.manager.submit([
+            ("preprocess", lambda: calls.append("preprocess")),
+            ("train", lambda: calls.append("train")),
+            ("publish", lambda: {"evaluation": {"f1_score": 0.5}}),
+        ])
+        self.assertTrue(created)
+        self.assertTrue(wait_finished(job))
+        state = job.to_dict()
+        self.assertEqual(state["status"], JOB_SUCCEEDED)
+        self.assertEqual(calls, ["preprocess", "train"])
+        self.assertEqual([stage["status"] for stage in state["stages"]], [STAGE_DONE] * 3)
+        self.assertTrue(all(stage["duration_seconds"] >= 0 for stage in state["stages"]))
+        self.assertEqual(state["result"], {"evaluation": {"f1_score": 0.5}})
+        self.assertIs(self.manager.get(job.id), job)
+
+    def test_duplicate_submissions(self):
+        """Submissions while a job runs return the running job."""
+        job, _ = self.manager.submit([("train", self.blocking_stage)])
+        self.assertTrue(self.started.wait(5))
+        self.assertEqual(job.status, JOB_RUNNING)
+        duplicate, created = self.manager.submit([("train", self.blocking_stage)])
+        self.assertFalse(created)
+        self.assertIs(duplicate, job)
+        self.release.set()
+        self.assertTrue(wait_finished(job))
+        _, created = self.manager.submit([("train", lambda: None)])
+        self.assertTrue(created)
+
+    def test_cancellation(self):
+        """A cancelled job stops before its next stage."""
+        calls = []
+        job, _ = self.manager.submit([
+            ("preprocess", self.blocking_stage),
+            ("train", lambda: calls.append("train")),
+        ])
+        self.assertTrue(self.started.wait(5))
+        self.assertIs(self.manager.cancel(job.id), job)
+        self.release.set()
+        self.assertTrue(wait_finished(job))
+        self.assertEqual(job.status, JOB_CANCELLED)
+        self.assertEqual(calls, [])
+        self.assertEqual([stage["status"] for stage in job.stages], [STAGE_DONE, STAGE_SKIPPED])
+        self.assertIsNone(self.manager.cancel("unknown"))
+
+    def test_failure(self):
+        """A failing stage fails the job and skips the remaining stages."""
+        def fail():
+            raise ValueError("no data")
+
+        job, _ = self.manager.submit([("preprocess", fail), ("train", lambda: None)])
+        self.assertTrue(wait_finished(job))
+        self.assertEqual(job.status, JOB_FAILED)
+        self.assertEqual(job.error, "preprocess: no data")
+        self.assertEqual([stage["status"] for stage in job.stages], [STAGE_FAILED, STAGE_SKIPPED])
+
+    def test_history_is_bounded(self):
+        """Only the most recent finished jobs are kept."""
+        manager = TrainingJobManager(max_jobs=3)
+        jobs = []
+        for _ in range(5):
+            job, _ = manager.submit([("train", lambda: None)])
+            self.assertTrue(wait_finished(job))
+            jobs.append(job)
+        self.assertEqual(manager.jobs(), jobs[-3:])
@@ -0,0 +1,88 @@
+"""Tests for the scheduler of training runs."""
+import time
+import unittest
+from threading import Event
+
+from learning_service.training_scheduler import TrainingScheduler
+
+
+class TrainingSchedulerTest(unittest.TestCase):
+    """Testing that requests are coalesced and runs are spaced"""
+
+    def setUp(self):
+        self.run_times = []
+        self.schedulers = []
+
+    def tearDown(self):
+        for scheduler in self.schedulers:
+            scheduler.stop()
+
+    def create_scheduler(self, train=None, **kwargs):
+        """Creates and starts a scheduler recording the start times of runs."""
+        scheduler = TrainingScheduler(
+            train or (lambda: self.run_times.append(time.monotonic())), **kwargs
+        )
+        scheduler.start()
+        self.schedulers.append(scheduler)
+        return scheduler
+
+    def test_burst_is_coalesced(self):
+        """A burst of requests results in a single run after the debounce period."""
+        scheduler = self.create_scheduler(debounce=0.1)
+        start = time.monotonic()
+        for _ in range(20):
+            scheduler.request()
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(len(self.run_times), 1)
+        self.assertGreaterEqual(self.run_times[0] - start, 0.1)
+
+    def test_requests_during_run(self):
+        """Requests arriving during a run are served by a single following run."""
+        started, release = Event(), Event()
+
+        def train():
+            self.run_times.append(time.monotonic())
+            started.set()
+            release.wait(5)
+
+        scheduler = self.create_scheduler(train)
+        scheduler.request()
+        self.assertTrue(started.wait(5))
+        for _ in range(5):
+            scheduler.request()
+        release.set()
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(scheduler.runs, 2)
+
+    def test_max_staleness(self):
+        """Continuous requests cannot delay a run beyond the maximum staleness."""
+        scheduler = self.create_scheduler(debounce=0.2, max_staleness=0.3)
+        start = time.monotonic()
+        while not self.run_times and time.monotonic() - start < 2:
+            scheduler.request()
+            time.sleep(0.05)
+        self.assertEqual(len(self.run_times), 1)
+        self.assertLess(self.run_times[0] - start, 0.6)
+
+    def test_min_interval(self):
+        """Consecutive runs are spaced by the minimum interval."""
+        scheduler = self.create_scheduler(min_interval=0.2)
+        scheduler.request()
+        self.assertTrue(scheduler.wait_idle(5))
+        scheduler.request()
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(len(self.run_times), 2)
+        self.assertGreaterEqual(self.run_times[1] - self.run_times[0], 0.2)
+
+    def test_failed_run(self):
+        """A failing run does not stop the scheduler."""
+        def train():
+            self.run_times.append(time.monotonic())
+            raise RuntimeError("no data")
+
+        scheduler = self.create_scheduler(train)
+        scheduler.request()
+        self.assertTrue(scheduler.wait_idle(5))
+        scheduler.request()
+        self.assertTrue(scheduler.wait_idle(5))
+        self.assertEqual(len(self.run_times), 2)
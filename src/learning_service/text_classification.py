@@ -6,18 +6,23 @@ import os
 import uuid
 from typing import List, Any
 
+import numpy as np
 import pandas as pd
 import scipy
 from joblib import load, dump
 from prometheus_client import Gauge
+from sklearn.base import clone
 from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import accuracy_score, f1_score, average_precision_score, roc_auc_score
 from sklearn.multiclass import OneVsRestClassifier
-from sklearn.pipeline import make_pipeline
-from sklearn.preprocessing import FunctionTransformer
+from sklearn.preprocessing import LabelBinarizer
 
-from common.bucket import upload_model
+from common.bucket import get_object_store
+from common.compiled_model import compile_model
+from common.mapped_model import MAPPED_MODEL_EXTENSION, save_mapped_model
+from common.model_bundle import publish_bundle
 from learning_service.config import settings, VarNames
+from learning_service.incremental_learning import grow_classifier, pad_columns
 from learning_service.read_data import read_data_from_file
 
 OUTPUT_PATH = settings[VarNames.OUTPUT_DIR.value]
@@ -30,6 +35,7 @@ VALIDATION_LABELS_FILE_PATH = os.path.join(OUTPUT_PATH, "val_preprocessed_labels
 
 LABEL_PREPROCESSOR = os.path.join(OUTPUT_PATH, "preprocessor_labels.joblib")
 DATA_PREPROCESSOR = os.path.join(OUTPUT_PATH, "preprocessor_data.joblib")
+TOKENS_PREPROCESSOR = os.path.join(OUTPUT_PATH, "preprocessor_tokens.joblib")
 
 ACCURACY_SCORE = Gauge('stackoverflow_tagger_accuracy_score', 'Model accuracy score')
 F1_SCORE = Gauge('stackoverflow_tagger_f1_score', 'F1-score')
@@ -74,6 +80,28 @@ def train_classifier(X_train, y_train, penalty='l1', C=1.0):
     return clf
 
 
+def partial_fit_classifier(classifier: OneVsRestClassifier, X_train, y_train):
+    """Updates a OneVsRestClassifier with a batch of multi-label data.
+
+    scikit-learn only sets up multi-class targets in the first call of `partial_fit`,
+    so the estimators and the label binarizer are set up here for multi-label targets,
+    the same way `fit` does.
+
+    Args:
+        classifier (OneVsRestClassifier): classifier with an estimator supporting `partial_fit`
+        X_train (scipy.sparse.csr.csr_matrix): features of the batch
+        y_train (ndarray): label indicator matrix of the batch
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    if not hasattr(classifier, 'estimators_'):
+        classifier.label_binarizer_ = LabelBinarizer(sparse_output=True)
+        classifier.label_binarizer_.fit(y_train)
+        classifier.classes_ = classifier.label_binarizer_.classes_
+        classifier.estimators_ = [clone(classifier.estimator) for _ in classifier.classes_]
+    return classifier.partial_fit(X_train, y_train)
+
 def predict_labels(
     classifier: OneVsRestClassifier,
     input_data: scipy.sparse.csr.csr_matrix or List[str],
@@ -109,6 +137,18 @@ def update_scores_from_file(filename : str):
         ROC_AUC.set(json_stats['roc_auc'])
         LATEST_MODEL_UPDATE.set_to_current_time()
 
+def get_ranked_columns(actual_labels) -> np.ndarray:
+    """Gets the label columns with both positive and negative examples.
+
+    Args:
+        actual_labels (scipy.sparse.csr.csr_matrix | ndarray): label indicator matrix
+
+    Returns:
+        ndarray: indices of the columns
+    """
+    positives = np.asarray(actual_labels.sum(axis=0)).ravel()
+    return np.flatnonzero((positives > 0) & (positives < actual_labels.shape[0]))
+
 def get_evaluation_scores(
     predicted_labels : scipy.sparse.csr.csr_matrix,
     actual_data : scipy.sparse.csr.csr_matrix,
@@ -130,9 +170,16 @@ def get_evaluation_scores(
     """
     accuracy_score_num = accuracy_score(actual_labels, predicted_labels)
     f1_score_num = f1_score(actual_labels, predicted_labels, average='weighted')
-    precision_score = average_precision_score(actual_labels, predicted_labels, average='macro')
+    # Ranking scores are undefined for tags which are always or never present,
+    # such as the tags which were added after the validation data was prepared
+    columns = get_ranked_columns(actual_labels)
+    precision_score = average_precision_score(
+        actual_labels[:, columns], predicted_labels[:, columns], average='macro'
+    )
     predicted_scores = classifier.decision_function(actual_data)
-    roc_auc_score_num = roc_auc_score(actual_labels, predicted_scores, multi_class='ovo')
+    roc_auc_score_num = roc_auc_score(
+        actual_labels[:, columns], predicted_scores[:, columns], multi_class='ovo'
+    )
 
     ACCURACY_SCORE.set(accuracy_score_num)
     F1_SCORE.set(f1_score_num)
@@ -154,34 +201,128 @@ def get_evaluation_scores(
         "roc_auc": roc_auc_score_num,
     }
 
-def retrain_model(classifier):
-    pass
+def retrain_model(classifier: OneVsRestClassifier, X_train, y_train):
+    """Updates a trained classifier with new data, without retraining it from scratch.
+
+    The classifier first grows to the features and labels of the data, which can
+    be more than it was trained with after the vocabulary or the tags grew.
+
+    Args:
+        classifier (OneVsRestClassifier): trained classifier
+        X_train (scipy.sparse.csr.csr_matrix): features of the new data
+        y_train (ndarray): label indicator matrix of the new data
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    grow_classifier(classifier, X_train.shape[1], y_train.shape[1])
+    return partial_fit_classifier(classifier, X_train, y_train)
 
 def main(bucket_upload=False,
          train_data_file = TRAIN_DATA_FILE_PATH,
          train_labels_file = TRAIN_LABELS_FILE_PATH,
          validation_data_file = VALIDATION_DATA_FILE_PATH,
          validation_labels_file = VALIDATION_LABELS_FILE_PATH,
-         classifier = None):
+         classifier = None,
+         classifier_name = None):
     """Main function run training
 
     Args:
         bucket_upload (bool, optional): determined if the model should
                 be uploaded to a bucket. Defaults to True.
+        classifier_name (str, optional): name of the stored model, see `evaluate_and_store`.
+                Defaults to None.
     """
     X_train = load(train_data_file)
     y_train = load(train_labels_file)
 
-    X_val = load(validation_data_file)
-    y_val = load(validation_labels_file)
+    classifier = train_classifier(X_train, y_train) if classifier is None else retrain_model(classifier, X_train, y_train)
+    return evaluate_and_store(
+        classifier,
+        bucket_upload=bucket_upload,
+        validation_data_file=validation_data_file,
+        validation_labels_file=validation_labels_file,
+        classifier_name=classifier_name
+    )
+
+def get_model_artifacts(classifier_name : str) -> dict:
+    """Gets the artifacts of a stored model, as a bundle would publish them.
+
+    Args:
+        classifier_name (str): name of the stored model
+
+    Returns:
+        dict[str, str]: local paths of the artifacts by object key
+    """
+    return {
+        settings[VarNames.MODEL_OBJECT_KEY.value]:
+            os.path.join(OUTPUT_PATH, f'{classifier_name}.joblib'),
+        settings[VarNames.MAPPED_MODEL_OBJECT_KEY.value]:
+            os.path.join(OUTPUT_PATH, f'{classifier_name}{MAPPED_MODEL_EXTENSION}'),
+        settings[VarNames.CLASSIFIER_OBJECT_KEY.value]:
+            os.path.join(OUTPUT_PATH, f'{classifier_name}_classifier.joblib'),
+        settings[VarNames.PREPROCESSOR_DATA_OBJECT_KEY.value]: DATA_PREPROCESSOR,
+        settings[VarNames.PREPROCESSOR_LABELS_OBJECT_KEY.value]: LABEL_PREPROCESSOR,
+        settings[VarNames.PREPROCESSOR_TOKENS_OBJECT_KEY.value]: TOKENS_PREPROCESSOR,
+        settings[VarNames.PREPROCESSOR_VAL_DATA_OBJECT_KEY.value]: VALIDATION_DATA_FILE_PATH,
+        settings[VarNames.PREPROCESSOR_VAL_LABELS_OBJECT_KEY.value]: VALIDATION_LABELS_FILE_PATH,
+        settings[VarNames.STATISTICS_OBJECT_KEY.value]: os.path.join(OUTPUT_PATH, "evaluation.json"),
+    }
+
+def publish_model(classifier_name : str):
+    """Publishes a stored model as the latest bundle.
+
+    Args:
+        classifier_name (str): name of the stored model
+
+    Raises:
+        RuntimeError: if the bundle could not be published
+    """
+    object_store = get_object_store(
+        settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
+        settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
+        settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
+        settings[VarNames.OBJECT_STORAGE_TLS.value]
+    )
+    # All artifacts are published together as one bundle, under their object keys
+    manifest = publish_bundle(object_store, settings[VarNames.BUCKET_NAME.value],
+                              settings[VarNames.MODEL_BUNDLE_POINTER_KEY.value],
+                              get_model_artifacts(classifier_name))
+    if manifest is None:
+        raise RuntimeError(f'Publishing model {classifier_name} failed')
+
+def evaluate_and_store(classifier: OneVsRestClassifier,
+                       bucket_upload=False,
+                       validation_data_file = VALIDATION_DATA_FILE_PATH,
+                       validation_labels_file = VALIDATION_LABELS_FILE_PATH,
+                       classifier_name = None):
+    """Evaluates a trained classifier, stores the model and optionally publishes it.
+
+    Args:
+        classifier (OneVsRestClassifier): trained classifier
+        bucket_upload (bool, optional): determined if the model should
+                be uploaded to a bucket. Defaults to False.
+        validation_data_file (str, optional): preprocessed validation data.
+                Defaults to VALIDATION_DATA_FILE_PATH.
+        validation_labels_file (str, optional): preprocessed validation labels.
+                Defaults to VALIDATION_LABELS_FILE_PATH.
+        classifier_name (str, optional): name of the stored model, to publish it later
+                with `publish_model`. Defaults to None, generating a unique name.
+
+    Returns:
+        OneVsRestClassifier: classifier
+    """
+    # Validation data prepared before the vocabulary or the tags grew has fewer columns
+    X_val = pad_columns(load(validation_data_file), getattr(classifier, 'n_features_in_', 0))
+    y_val = pad_columns(load(validation_labels_file), len(classifier.estimators_))
 
     label_preprocessor = load(LABEL_PREPROCESSOR)
 
-    raw_data = read_data_from_file("validation.tsv")
+    raw_data = read_data_from_file("validation.tsv", columns=("title",))
     raw_titles = raw_data["title"].values
 
-    classifier = train_classifier(X_train, y_train) if classifier is None else classifier.partial_fit(X_train, y_train)
-    classifier_name = f'{str(uuid.uuid4())}_model'
+    if classifier_name is None:
+        classifier_name = f'{str(uuid.uuid4())}_model'
 
     # Non inverse transformed data
     y_val_pred = predict_labels(classifier, X_val)
@@ -227,75 +368,20 @@ def main(bucket_upload=False,
     df_misclassifications.to_csv(
         os.path.join(OUTPUT_PATH, f"{classifier_name}_misclassifications.csv")
     )
-    # Store "best" classifier
-    classifier_pipeline = make_pipeline(
+    # Store "best" classifier, compiled into a single object for inference
+    compiled_model = compile_model(
         load(DATA_PREPROCESSOR),
-        FunctionTransformer(classifier.predict),
-        FunctionTransformer(label_preprocessor.inverse_transform)
+        classifier,
+        label_preprocessor
     )
-    filename = f'{classifier_name}.joblib'
-    classifier_filename = f'{classifier_name}_classifier.joblib'
-    model_path = os.path.join(OUTPUT_PATH, filename)
-    classifier_path = os.path.join(OUTPUT_PATH, classifier_filename)
-    dump(classifier_pipeline, model_path)
+    artifacts = get_model_artifacts(classifier_name)
+    dump(compiled_model, artifacts[settings[VarNames.MODEL_OBJECT_KEY.value]])
+    save_mapped_model(artifacts[settings[VarNames.MAPPED_MODEL_OBJECT_KEY.value]], compiled_model)
 
-    dump(classifier, classifier_path)
+    dump(classifier, artifacts[settings[VarNames.CLASSIFIER_OBJECT_KEY.value]])
 
     if bucket_upload:
-        auth = (
-            settings[VarNames.OBJECT_STORAGE_ACCESS_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_SECRET_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_TLS.value]
-        )
-        upload_model(
-            model_path,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.MODEL_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            classifier_path,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.CLASSIFIER_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            DATA_PREPROCESSOR,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_DATA_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            LABEL_PREPROCESSOR,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_LABELS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            VALIDATION_DATA_FILE_PATH,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_VAL_DATA_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            VALIDATION_LABELS_FILE_PATH,
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.PREPROCESSOR_VAL_LABELS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
-        upload_model(
-            os.path.join(OUTPUT_PATH, "evaluation.json"),
-            settings[VarNames.BUCKET_NAME.value],
-            settings[VarNames.STATISTICS_OBJECT_KEY.value],
-            settings[VarNames.OBJECT_STORAGE_ENDPOINT.value],
-            *auth
-        )
+        publish_model(classifier_name)
     return classifier
 
 
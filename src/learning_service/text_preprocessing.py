@@ -5,7 +5,6 @@ Creates files `preprocessor.joblib` and `preprocessed_data.joblib`
 from importlib.resources import path
 import json
 import os
-import re
 
 import nltk
 import numpy as np
@@ -16,22 +15,113 @@ from nltk.stem import SnowballStemmer
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import MultiLabelBinarizer
 
+from common import text_normalizer
+from common.logger import Logger
+from common.text_normalizer import TextNormalizer
+from learning_service import hashing_vectorizer, parallel_featurizer, read_data, sharded_tfidf
 from learning_service.config import settings, VarNames
-from learning_service.read_data import read_data_from_file, read_unlabeled_data_from_file
+from learning_service.hashing_vectorizer import HashingTfidfVectorizer
+from learning_service.incremental_learning import grow_label_binarizer, grow_vocabulary
+from learning_service.parallel_featurizer import ParallelFeaturizer
+from learning_service.read_data import read_data_from_file, read_unlabeled_data_from_file, \
+    DATASET_DIR
+from learning_service.sharded_tfidf import fit_sharded
+from learning_service.stage_cache import StageCache
 
 nltk.download('stopwords')
 
-REPLACE_BY_SPACE_RE = re.compile('[/(){}\[\]\|@,;]')
-BAD_SYMBOLS_RE = re.compile('[^0-9a-z #+_]')
 STOP_WORDS = set(stopwords.words('english'))
+_TEXT_NORMALIZERS = {}
 
 PREPROCESSOR_DATA_FILE_NAME = "preprocessor_data.joblib"
 PREPROCESSOR_LABELS_FILE_NAME = "preprocessor_labels.joblib"
+PREPROCESSOR_TOKENS_FILE_NAME = "preprocessor_tokens.joblib"
+FEATURIZER_MODE_TFIDF = "tfidf"
+FEATURIZER_MODE_HASHING = "hashing"
 
 OUTPUT_PATH = settings[VarNames.OUTPUT_DIR.value]
+# Sources of the code computing the preprocessing stages, changes to them invalidate cached stages
+STAGE_CODE_PATHS = [
+    __file__,
+    text_normalizer.__file__,
+    hashing_vectorizer.__file__,
+    parallel_featurizer.__file__,
+    read_data.__file__,
+    sharded_tfidf.__file__,
+]
 
 np.random.seed(12321)
 
+def create_text_normalizer(stemming=False) -> TextNormalizer:
+    """Creates a normalizer without a table of words.
+
+    Args:
+        stemming (bool, optional): flag to enable or disable stemming. Defaults to False.
+
+    Returns:
+        TextNormalizer: the normalizer
+    """
+    return TextNormalizer(
+        STOP_WORDS,
+        SnowballStemmer('english') if stemming else None,
+        cache_size=settings[VarNames.PREPROCESSING_TOKEN_CACHE_SIZE.value]
+    )
+
+def read_text_normalizers(save_path : str, processor_prefix='') -> dict:
+    """Reads the normalizers saved next to a preprocessor, by stemming mode.
+
+    Args:
+        save_path (str): path where the preprocessor exists in
+        processor_prefix (str, optional): Prefix for processor. Defaults to "".
+
+    Returns:
+        dict[bool, TextNormalizer]: the normalizers, empty when none were saved
+    """
+    final_processor_prefix = f'{processor_prefix}_' if processor_prefix != '' else ''
+    tokens_path = os.path.join(
+        save_path,
+        f'{final_processor_prefix}{PREPROCESSOR_TOKENS_FILE_NAME}'
+    )
+    if not os.path.isfile(tokens_path):
+        return {}
+    normalizers = load(tokens_path)
+    if isinstance(normalizers, TextNormalizer):
+        # Saved by earlier versions, which only kept the normalizer without stemming
+        normalizers = {False: normalizers}
+    for normalizer in normalizers.values():
+        normalizer.cache_size = settings[VarNames.PREPROCESSING_TOKEN_CACHE_SIZE.value]
+    return normalizers
+
+def get_text_normalizer(stemming=False) -> TextNormalizer:
+    """Gets the shared normalizer used by `text_process`.
+    It starts from the table of words saved with the latest preprocessor, if any.
+
+    Args:
+        stemming (bool, optional): flag to enable or disable stemming. Defaults to False.
+
+    Returns:
+        TextNormalizer: the normalizer, which memoizes the normalized words
+    """
+    if stemming not in _TEXT_NORMALIZERS:
+        normalizer = read_text_normalizers(OUTPUT_PATH).get(stemming)
+        _TEXT_NORMALIZERS[stemming] = normalizer or create_text_normalizer(stemming)
+    return _TEXT_NORMALIZERS[stemming]
+
+def load_text_normalizer(save_path : str, processor_prefix='', stemming=False):
+    """Loads the normalizer saved next to a preprocessor, with the table of its training words.
+    Falls back to the shared normalizer when no table was saved.
+
+    Args:
+        save_path (str): path where the preprocessor exists in
+        processor_prefix (str, optional): Prefix for processor. Defaults to "".
+        stemming (bool, optional): flag to enable or disable stemming. Defaults to False.
+
+    Returns:
+        TextNormalizer: the normalizer
+    """
+    normalizer = read_text_normalizers(save_path, processor_prefix).get(stemming)
+    return normalizer or get_text_normalizer(stemming)
+
 def text_process(text : str, stemming=False):
     """Text processor that removes bad characters and stop words.
     If needed, stemming can be performed
@@ -43,19 +133,22 @@ def text_process(text : str, stemming=False):
     Returns:
         str : processed text
     """
-    processed_text = text.lower()
-    processed_text = re.sub(REPLACE_BY_SPACE_RE, " ", processed_text)
-    processed_text = re.sub(BAD_SYMBOLS_RE, "", processed_text)
-    processed_text = [word for word in processed_text.split() if not word in STOP_WORDS]
-    if stemming:
-        stemmed = []
-        for word in processed_text:
-            stemmer = SnowballStemmer('english')
-            stemmed.append(stemmer.stem(word))
-        processed_text = stemmed
-    return " ".join(processed_text)
-
-def create_bag_of_words_preprocessor(min_df=5, max_df=0.9):
+    return get_text_normalizer(stemming).normalize([text])[0]
+
+def text_process_batch(texts, stemming=False, n_jobs=1):
+    """Batched version of `text_process`, processing all texts at once.
+
+    Args:
+        texts (Iterable[str]): texts to be processed
+        stemming (bool, optional): flag to enable or disable stemming. Defaults to False.
+        n_jobs (int, optional): number of processes sharing large batches. Defaults to 1.
+
+    Returns:
+        list[str] : processed texts
+    """
+    return get_text_normalizer(stemming).normalize(texts, n_jobs=n_jobs)
+
+def create_bag_of_words_preprocessor(min_df=5, max_df=0.9, featurizer_mode=None):
     """Creates a bag of words preprocessor. The processor works through:
     1. Conversion of word tokens from processed title text into a bag of words
     2. Conversion of bag of words representation into TF-IDF vectorized representation
@@ -65,10 +158,23 @@ def create_bag_of_words_preprocessor(min_df=5, max_df=0.9):
     Args:
         min_df (int, optional): TfidfVectorizer's min_df. Defaults to 5.
         max_df (float, optional): TfidfVectorizer's max_df. Defaults to 0.8.
+        featurizer_mode (str, optional): 'tfidf' for a vocabulary based vectorizer,
+                'hashing' for a vectorizer hashing the features into a fixed number of columns.
+                Defaults to None, using the configured mode.
 
     Returns:
-        _type_: _description_
+        TfidfVectorizer | HashingTfidfVectorizer: the preprocessor
     """
+    if featurizer_mode is None:
+        featurizer_mode = settings[VarNames.FEATURIZER_MODE.value]
+    if featurizer_mode == FEATURIZER_MODE_HASHING:
+        return HashingTfidfVectorizer(
+            n_features=settings[VarNames.HASHING_N_FEATURES.value],
+            min_df=min_df,
+            max_df=max_df,
+            ngram_range=(1,2),
+            token_pattern=r'(\S+)'
+        )
     preprocessor = TfidfVectorizer(
         min_df=min_df,
         max_df=max_df,
@@ -94,7 +200,14 @@ def preprocess_bag_of_words(titles : pd.DataFrame, data_name='', \
         ndarray[float64] | Any | ndarray: processed data
     """
     preprocessor = create_bag_of_words_preprocessor(min_df, max_df)
-    preprocessed_data = preprocessor.fit_transform(titles)
+    n_jobs = settings[VarNames.PREPROCESSING_JOBS.value]
+    if isinstance(preprocessor, TfidfVectorizer) and n_jobs > 1:
+        titles = list(titles)
+        fit_sharded(preprocessor, titles, n_jobs)
+        with ParallelFeaturizer(preprocessor, None, n_jobs) as featurizer:
+            preprocessed_data = featurizer.transform(titles)
+    else:
+        preprocessed_data = preprocessor.fit_transform(titles)
 
     if save_path is not None and save_path != "":
         final_data_name = f'{data_name}_' if data_name != '' else ''
@@ -106,6 +219,18 @@ def preprocess_bag_of_words(titles : pd.DataFrame, data_name='', \
                 f'{final_processor_prefix}{PREPROCESSOR_DATA_FILE_NAME}'
             )
         )
+        # Words of the training titles are normalized once in every stemming mode,
+        # and reused for all later data
+        normalizers = {stemming: create_text_normalizer(stemming) for stemming in (False, True)}
+        for normalizer in normalizers.values():
+            normalizer.build_table(titles)
+        dump(
+            normalizers,
+            os.path.join(
+                save_path,
+                f'{final_processor_prefix}{PREPROCESSOR_TOKENS_FILE_NAME}'
+            )
+        )
         dump(
             preprocessed_data,
             os.path.join(
@@ -115,26 +240,82 @@ def preprocess_bag_of_words(titles : pd.DataFrame, data_name='', \
         )
     return preprocessed_data
 
-def prepare_data_from_processor(titles:pd.DataFrame, save_path:str, processor_prefix=''):
-    """Loads a preprocessor from a file and runs it on data.
+def load_preprocessor(save_path:str, processor_prefix=''):
+    """Loads a data preprocessor from a file.
 
     Args:
-        titles (pd.DataFrame): DataFrame of titles of StackOverflow questions
         save_path (str): path where the preprocessor exists in
+        processor_prefix (str, optional): Prefix for processor. Defaults to "".
 
     Returns:
-        ndarray[float64] | Any | ndarray: processed data
+        TfidfVectorizer | HashingTfidfVectorizer: the preprocessor
     """
     final_processor_prefix = f'{processor_prefix}_' if processor_prefix != '' else ''
-    preprocessor = load(
+    return load(
         os.path.join(
             save_path,
             f'{final_processor_prefix}{PREPROCESSOR_DATA_FILE_NAME}'
         )
     )
-    titles_arr = [text_process(x) for x in titles.values]
+
+def prepare_data_from_processor(titles:pd.DataFrame, save_path:str, processor_prefix='',
+                                featurizer:ParallelFeaturizer=None):
+    """Loads a preprocessor from a file and runs it on data.
+
+    Args:
+        titles (pd.DataFrame): DataFrame of titles of StackOverflow questions
+        save_path (str): path where the preprocessor exists in
+        processor_prefix (str, optional): Prefix for processor. Defaults to "".
+        featurizer (ParallelFeaturizer, optional): featurizer holding the loaded preprocessor,
+                used instead of loading it. Defaults to None.
+
+    Returns:
+        ndarray[float64] | Any | ndarray: processed data
+    """
+    if featurizer is not None:
+        return featurizer.transform(titles.values)
+    preprocessor = load_preprocessor(save_path, processor_prefix)
+    titles_arr = load_text_normalizer(save_path, processor_prefix).normalize(
+        titles.values,
+        n_jobs=settings[VarNames.PREPROCESSING_JOBS.value]
+    )
     return preprocessor.transform(titles_arr)
 
+def update_preprocessor(titles:pd.DataFrame, save_path:str, processor_prefix=''):
+    """Updates a saved preprocessor with new data, if it can be fitted incrementally.
+    Preprocessors with a vocabulary only grow it with new terms when
+    vocabulary growth is enabled, and are left unchanged otherwise.
+
+    Args:
+        titles (pd.DataFrame): DataFrame of titles of StackOverflow questions
+        save_path (str): path where the preprocessor exists in
+        processor_prefix (str, optional): Prefix for processor. Defaults to "".
+
+    Returns:
+        bool: whether the preprocessor was updated
+    """
+    final_processor_prefix = f'{processor_prefix}_' if processor_prefix != '' else ''
+    preprocessor_path = os.path.join(
+        save_path,
+        f'{final_processor_prefix}{PREPROCESSOR_DATA_FILE_NAME}'
+    )
+    preprocessor = load(preprocessor_path)
+    if hasattr(preprocessor, 'partial_fit'):
+        preprocessor.partial_fit(titles)
+    elif settings[VarNames.INCREMENTAL_GROW_VOCABULARY.value]:
+        new_terms = grow_vocabulary(
+            preprocessor,
+            titles,
+            min_df=settings[VarNames.INCREMENTAL_VOCABULARY_MIN_DF.value]
+        )
+        if not new_terms:
+            return False
+        Logger.info(f'Added {len(new_terms)} new terms to the vocabulary ✔️')
+    else:
+        return False
+    dump(preprocessor, preprocessor_path)
+    return True
+
 def prepare_labels(labels : pd.DataFrame, mlb : MultiLabelBinarizer, \
     save_path=None, labels_name=''):
     """Prepares labels for multi label classifier.
@@ -181,12 +362,20 @@ def prepocess_incoming_data(data_preprocessor_path,
                             incoming_data_path):
     data = read_data_from_file(incoming_data_file, root_path=incoming_data_path)
 
+    update_preprocessor(data['title'], data_preprocessor_path)
     transformed_data = prepare_data_from_processor(
                             data['title'],
                             data_preprocessor_path
                         )
     dump(transformed_data, os.path.join(OUTPUT_PATH, 'train_preprocessed_data.joblib'))
-    mlb = load(os.path.join(label_preprocessor_path, label_preprocessor_name))
+    mlb_path = os.path.join(label_preprocessor_path, label_preprocessor_name)
+    mlb = load(mlb_path)
+    if settings[VarNames.INCREMENTAL_GROW_LABELS.value]:
+        # New tags get new columns, which the classifier grows to before being updated
+        mlb, new_tags = grow_label_binarizer(mlb, data['tags'])
+        if new_tags:
+            dump(mlb, mlb_path)
+            Logger.info(f'Added new tags {new_tags} to the labels ✔️')
 
     # preprocess labels
     prepare_labels(
@@ -196,78 +385,148 @@ def prepocess_incoming_data(data_preprocessor_path,
         labels_name='train'
     )
 
-def main(train_file = "train.tsv", val_file = "validation.tsv", test_file = "test.tsv"):
-    """Main function to run preprocessors.
-    """
-
-    train_data = read_data_from_file(train_file)
-    validation_data = read_data_from_file(val_file)
-    test_data = read_unlabeled_data_from_file(test_file)
-    print('\n################### Processed Messages ###################\n')
-    with pd.option_context('expand_frame_repr', False):
-        print('\n################### train_data ###################\n')
-        print(train_data)
-        print('\n################### validation_data ###################\n')
-        print(validation_data)
-        print('\n################### test_data ###################\n')
-        print(test_data)
-    # Create output folder
-    if not os.path.exists(OUTPUT_PATH):
-        os.makedirs(OUTPUT_PATH)
-
-    # preprocess data
-    preprocess_bag_of_words(
-        train_data['title'],
-        data_name="train",
-        save_path=OUTPUT_PATH
-    )
+def get_stage_cache():
+    """Creates the cache of preprocessing stages, if it is enabled.
 
-    val_preprocessed_data = prepare_data_from_processor(
-        validation_data['title'],
-        OUTPUT_PATH
-    )
-    dump(val_preprocessed_data, os.path.join(OUTPUT_PATH, 'val_preprocessed_data.joblib'))
-
-    test_preprocessed_data = prepare_data_from_processor(
-        test_data['title'],
-        OUTPUT_PATH
+    Returns:
+        StageCache | None: the cache, or None when stages always run
+    """
+    if not settings[VarNames.STAGE_CACHE_ENABLED.value]:
+        return None
+    return StageCache(
+        settings[VarNames.STAGE_CACHE_DIR.value],
+        settings[VarNames.STAGE_CACHE_MAX_ENTRIES.value],
+        code_paths=STAGE_CODE_PATHS
     )
-    dump(test_preprocessed_data, os.path.join(OUTPUT_PATH, 'test_preprocessed_data.joblib'))
 
-    mlb = create_multi_label_binarizer(train_data['tags'])
+def run_stage(stage_cache, stage : str, inputs : list, params : dict, outputs : list, function):
+    """Runs a preprocessing stage, unless its outputs are cached.
 
-    # preprocess labels
-    prepare_labels(
-        train_data['tags'],
-        mlb,
-        save_path=OUTPUT_PATH,
-        labels_name="train"
-    )
-    prepare_labels(
-        validation_data['tags'],
-        mlb,
-        OUTPUT_PATH,
-        labels_name="val"
+    Args:
+        stage_cache (StageCache | None): the cache of stages
+        stage (str): name of the stage
+        inputs (list[str]): paths of the input files
+        params (dict): parameters of the stage
+        outputs (list[str]): names of the output files in the output folder
+        function (Callable[[], Any]): function running the stage
+    """
+    if stage_cache is None:
+        function()
+        return
+    stage_cache.run(
+        stage,
+        inputs,
+        params,
+        {name: os.path.join(OUTPUT_PATH, name) for name in outputs},
+        function
     )
 
-    dump(mlb, os.path.join(OUTPUT_PATH, PREPROCESSOR_LABELS_FILE_NAME))
-
-    data_preprocessor = load(
-        os.path.join(
-            OUTPUT_PATH,
-            PREPROCESSOR_DATA_FILE_NAME
+def main(train_file = "train.tsv", val_file = "validation.tsv", test_file = "test.tsv",
+         min_df=5, max_df=0.8):
+    """Main function to run preprocessors.
+    Stages whose input files and parameters did not change are restored from the stage cache.
+    """
+    # Create output folder
+    if not os.path.exists(OUTPUT_PATH):
+        os.makedirs(OUTPUT_PATH)
+    stage_cache = get_stage_cache()
+    train_path = os.path.join(DATASET_DIR, train_file)
+    val_path = os.path.join(DATASET_DIR, val_file)
+    test_path = os.path.join(DATASET_DIR, test_file)
+    preprocessor_path = os.path.join(OUTPUT_PATH, PREPROCESSOR_DATA_FILE_NAME)
+    tokens_path = os.path.join(OUTPUT_PATH, PREPROCESSOR_TOKENS_FILE_NAME)
+
+    # Data files are only read by the stages which run
+    datasets = {}
+    def read(name, filename, reader=read_data_from_file):
+        if name not in datasets:
+            datasets[name] = reader(filename)
+            with pd.option_context('expand_frame_repr', False):
+                print(f'\n################### {name} ###################\n')
+                print(datasets[name])
+        return datasets[name]
+
+    def fit_bag_of_words():
+        preprocess_bag_of_words(
+            read('train_data', train_file)['title'],
+            data_name="train",
+            save_path=OUTPUT_PATH,
+            min_df=min_df,
+            max_df=max_df
         )
-    )
-    vocabulary = data_preprocessor.vocabulary_
-    with open(
-            os.path.join(
+        data_preprocessor = load(preprocessor_path)
+        vocabulary_path = os.path.join(OUTPUT_PATH, 'data_vocabulary.json')
+        if not hasattr(data_preprocessor, 'vocabulary_'):
+            # Hashed features have no vocabulary
+            if os.path.isfile(vocabulary_path):
+                os.remove(vocabulary_path)
+            return
+        with open(vocabulary_path, 'w', encoding='utf-8') as outfile:
+            json.dump(data_preprocessor.vocabulary_, outfile, indent=2)
+
+    # The fitted preprocessor is loaded once for all splits, and shared by the worker processes
+    featurizers = []
+    def get_featurizer():
+        if not featurizers:
+            featurizers.append(ParallelFeaturizer(
+                load_preprocessor(OUTPUT_PATH),
+                load_text_normalizer(OUTPUT_PATH),
+                n_jobs=settings[VarNames.PREPROCESSING_JOBS.value]
+            ))
+        return featurizers[0]
+
+    def transform(name, filename, reader):
+        def run():
+            preprocessed_data = prepare_data_from_processor(
+                read(f'{name}_data', filename, reader)['title'],
                 OUTPUT_PATH,
-                'data_vocabulary.json'
-            ),
-            'w',
-            encoding='utf-8'
-        ) as outfile:
-        json.dump(vocabulary, outfile, indent=2)
+                featurizer=get_featurizer()
+            )
+            dump(preprocessed_data, os.path.join(OUTPUT_PATH, f'{name}_preprocessed_data.joblib'))
+        return run
+
+    def prepare_all_labels():
+        train_tags = read('train_data', train_file)['tags']
+        mlb = create_multi_label_binarizer(train_tags)
+        prepare_labels(
+            train_tags,
+            mlb,
+            save_path=OUTPUT_PATH,
+            labels_name="train"
+        )
+        prepare_labels(
+            read('val_data', val_file)['tags'],
+            mlb,
+            OUTPUT_PATH,
+            labels_name="val"
+        )
+        dump(mlb, os.path.join(OUTPUT_PATH, PREPROCESSOR_LABELS_FILE_NAME))
+
+    # The parameters of the vectorizer are part of the key, e.g. min_df, max_df and ngram_range
+    preprocessor_params = json.loads(json.dumps(
+        create_bag_of_words_preprocessor(min_df, max_df).get_params(), default=str
+    ))
+    run_stage(stage_cache, 'bag_of_words', [train_path], preprocessor_params, [
+        PREPROCESSOR_DATA_FILE_NAME,
+        PREPROCESSOR_TOKENS_FILE_NAME,
+        'train_preprocessed_data.joblib',
+        'data_vocabulary.json',
+    ], fit_bag_of_words)
+    try:
+        run_stage(stage_cache, 'val_features', [val_path, preprocessor_path, tokens_path], {},
+                  ['val_preprocessed_data.joblib'],
+                  transform('val', val_file, read_data_from_file))
+        run_stage(stage_cache, 'test_features', [test_path, preprocessor_path, tokens_path], {},
+                  ['test_preprocessed_data.joblib'],
+                  transform('test', test_file, read_unlabeled_data_from_file))
+    finally:
+        for featurizer in featurizers:
+            featurizer.close()
+    run_stage(stage_cache, 'labels', [train_path, val_path], {}, [
+        PREPROCESSOR_LABELS_FILE_NAME,
+        'train_preprocessed_labels.joblib',
+        'val_preprocessed_labels.joblib',
+    ], prepare_all_labels)
 
 if __name__ == "__main__":
     main()
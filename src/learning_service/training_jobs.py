@@ -0,0 +1,199 @@
+"""
+Provides asynchronous training jobs.
+A job runs a sequence of named stages on a background worker, recording the
+status and timing of every stage. Only one job runs at a time, and submissions
+arriving while a job is queued or running return that job instead of a new one.
+Cancellation takes effect between stages.
+"""
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+from common.logger import Logger
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+STAGE_PENDING = 'pending'
+STAGE_RUNNING = 'running'
+STAGE_DONE = 'done'
+STAGE_FAILED = 'failed'
+STAGE_SKIPPED = 'skipped'
+
+
+class TrainingJob:
+    """State of a training job.
+
+    Args:
+        stage_names (list[str]): names of the stages of the job, in order
+    """
+
+    def __init__(self, stage_names : list):
+        self.id = uuid.uuid4().hex
+        self.status = JOB_QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.stages = [
+            {"name": name, "status": STAGE_PENDING, "started": None,
+             "finished": None, "duration_seconds": None}
+            for name in stage_names
+        ]
+        self.result = None
+        self.error = None
+        self.cancel_requested = Event()
+
+    @property
+    def active(self) -> bool:
+        """Whether the job is queued or running."""
+        return self.status in (JOB_QUEUED, JOB_RUNNING)
+
+    def to_dict(self) -> dict:
+        """Gets the JSON serializable state of the job.
+
+        Returns:
+            dict: the state
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "duration_seconds": None if self.started is None
+                else (self.finished or time.time()) - self.started,
+            "stages": [dict(stage) for stage in self.stages],
+            "cancel_requested": self.cancel_requested.is_set(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class TrainingJobManager:
+    """Runs training jobs one at a time on a background worker.
+
+    Args:
+        lock (Lock, optional): lock held while a job runs, shared with other
+                    updates of the model. Defaults to None.
+        max_jobs (int, optional): number of jobs kept for status queries,
+                    the oldest finished ones are forgotten. Defaults to 20.
+    """
+
+    def __init__(self, lock : Lock = None, max_jobs : int = 20):
+        self.lock = lock
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._jobs_lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='training-job')
+
+    def submit(self, stages : list):
+        """Submits a job, unless a job is already queued or running.
+
+        Args:
+            stages (list[tuple[str, Callable[[], Any]]]): names and functions of the stages,
+                    the result of the last stage is the result of the job
+
+        Returns:
+            tuple[TrainingJob, bool]: the job, and whether it was created by this submission
+        """
+        with self._jobs_lock:
+            for job in reversed(self._jobs.values()):
+                if job.active and not job.cancel_requested.is_set():
+                    Logger.info(f'Training job {job.id} is already {job.status}, coalescing ⚠️')
+                    return job, False
+            job = TrainingJob([name for name, _ in stages])
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        self._executor.submit(self._run, job, stages)
+        return job, True
+
+    def get(self, job_id : str):
+        """Gets a job.
+
+        Args:
+            job_id (str): id of the job
+
+        Returns:
+            TrainingJob | None: the job, or None when it is unknown
+        """
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list:
+        """Gets the known jobs, oldest first.
+
+        Returns:
+            list[TrainingJob]: the jobs
+        """
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id : str):
+        """Requests the cancellation of a job. A running job stops before its next stage.
+
+        Args:
+            job_id (str): id of the job
+
+        Returns:
+            TrainingJob | None: the job, or None when it is unknown
+        """
+        job = self.get(job_id)
+        if job is not None and job.active:
+            job.cancel_requested.set()
+            Logger.info(f'Cancellation of training job {job.id} requested ⚠️')
+        return job
+
+    def _forget_finished_jobs(self):
+        """Removes the oldest finished jobs over the limit."""
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job : TrainingJob, stages : list):
+        """Runs the stages of a job on the background worker."""
+        if self.lock is not None:
+            with self.lock:
+                self._run_stages(job, stages)
+        else:
+            self._run_stages(job, stages)
+
+    def _run_stages(self, job : TrainingJob, stages : list):
+        """Runs the stages of a job, recording their status and timing."""
+        job.started = time.time()
+        job.status = JOB_RUNNING
+        result = None
+        for stage, (name, function) in zip(job.stages, stages):
+            if job.cancel_requested.is_set():
+                stage["status"] = STAGE_SKIPPED
+                continue
+            stage["started"] = time.time()
+            stage["status"] = STAGE_RUNNING
+            try:
+                result = function()
+            except Exception as error: # pylint: disable=broad-except
+                stage["status"] = STAGE_FAILED
+                job.error = f'{name}: {error}'
+                Logger.fail(f'Training job {job.id} failed in stage {name} ❌\n{error}')
+                for remaining in job.stages:
+                    if remaining["status"] == STAGE_PENDING:
+                        remaining["status"] = STAGE_SKIPPED
+                break
+            finally:
+                stage["finished"] = time.time()
+                stage["duration_seconds"] = stage["finished"] - stage["started"]
+            stage["status"] = STAGE_DONE
+            Logger.info(f'Training job {job.id} finished stage {name} '
+                        f'in {stage["duration_seconds"]:.1f}s ✔️')
+        if job.error is not None:
+            job.status = JOB_FAILED
+        elif any(stage["status"] == STAGE_SKIPPED for stage in job.stages):
+            job.status = JOB_CANCELLED
+        else:
+            job.result = result
+            job.status = JOB_SUCCEEDED
+        job.finished = time.time()
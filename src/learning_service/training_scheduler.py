@@ -0,0 +1,122 @@
+"""
+Provides a scheduler running training on a dedicated worker thread.
+Callers only signal that training is requested. Requests arriving in a burst,
+or while training runs, are coalesced into a single run, which starts once
+the requests stopped for a debounce period, unless the oldest request would
+wait longer than the maximum staleness. Runs are spaced by a minimum interval.
+"""
+import time
+from threading import Condition, Thread
+
+from common.logger import Logger
+
+
+class TrainingScheduler:
+    """Worker thread running training when requested, coalescing bursts of requests.
+
+    Args:
+        train (Callable[[], Any]): function running the training
+        debounce (float, optional): seconds without new requests before training starts.
+                    Defaults to 0.
+        min_interval (float, optional): minimum seconds between the end of a run
+                    and the start of the next one. Defaults to 0.
+        max_staleness (float, optional): maximum seconds a request waits for the debounce
+                    period, the minimum interval still applies. Defaults to None, unlimited.
+    """
+
+    def __init__(self, train, debounce : float = 0, min_interval : float = 0,
+                 max_staleness : float = None):
+        self.train = train
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self.runs = 0
+        self._condition = Condition()
+        self._first_request = None
+        self._last_request = None
+        self._last_run_end = None
+        self._running = False
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Starts the worker thread."""
+        with self._condition:
+            self._stopped = False
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the worker thread, after the run in progress. Pending requests are dropped."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def request(self):
+        """Requests a training run, without waiting for it."""
+        with self._condition:
+            now = time.monotonic()
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            self._condition.notify_all()
+
+    @property
+    def pending(self) -> bool:
+        """Whether a training run is requested and did not start yet."""
+        return self._first_request is not None
+
+    def wait_idle(self, timeout : float = None) -> bool:
+        """Waits until no training is requested or running.
+
+        Args:
+            timeout (float, optional): maximum seconds to wait. Defaults to None, unlimited.
+
+        Returns:
+            bool: whether the scheduler is idle
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self.pending and not self._running, timeout
+            )
+
+    def _due(self) -> float:
+        """Computes when the requested run starts."""
+        due = self._last_request + self.debounce
+        if self.max_staleness is not None:
+            due = min(due, self._first_request + self.max_staleness)
+        if self._last_run_end is not None:
+            due = max(due, self._last_run_end + self.min_interval)
+        return due
+
+    def _run(self):
+        """Waits for requests and runs the training."""
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if self.pending:
+                        remaining = self._due() - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._stopped:
+                    return
+                # Requests arriving from now on are served by the next run
+                self._first_request = None
+                self._last_request = None
+                self._running = True
+            try:
+                self.train()
+            except Exception as error: # pylint: disable=broad-except
+                Logger.fail(f'Training failed: {error} ❌')
+            finally:
+                with self._condition:
+                    self.runs += 1
+                    self._running = False
+                    self._last_run_end = time.monotonic()
+                    self._condition.notify_all()